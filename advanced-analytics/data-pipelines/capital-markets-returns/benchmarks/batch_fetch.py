@@ -0,0 +1,136 @@
+""" Throughput of the batched quotes fetch against a slow, unreliable provider stand-in.
+
+The stand-in serves pregenerated synthetic quotes after a latency of `--call-latency` seconds
+per call plus `--ticker-latency` per ticker, fails `--failure-rate` of the calls, silently leaves
+out a ticker in `--drop-rate` of the calls and always fails calls holding one of the `--poison`
+tickers, like YahooFinance does for a delisted symbol. The single-call baseline is what
+`MarketQuotes.fetch` used to do: one download of the whole universe without retries.
+
+Usage, from the capital-markets-returns directory:
+    python benchmarks/batch_fetch.py [--tickers 500] [--batch-sizes 10 25 50] [--workers 1 4 8] [--json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+import batch_fetch  # noqa: E402
+import quote_providers  # noqa: E402
+
+
+class FlakyProvider(quote_providers.QuoteProvider):
+    """ Pregenerated quotes with injected latency, failures and dropped tickers. """
+    name = "flaky"
+
+    def __init__(self, frames: dict, callLatency: float, tickerLatency: float, failureRate: float,
+                 dropRate: float, poison: list, seed: int = 0):
+        self.frames: dict = frames
+        self.callLatency: float = callLatency
+        self.tickerLatency: float = tickerLatency
+        self.failureRate: float = failureRate
+        self.dropRate: float = dropRate
+        self.poison: set = set(poison)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def download(self, tickers: list, period: str = None, start=None, end=None,
+                 auto_adjust: bool = False) -> pd.DataFrame:
+        time.sleep(self.callLatency + self.tickerLatency * len(tickers))
+        with self._lock:
+            failed = self._random.random() < self.failureRate
+            dropped = self._random.choice(tickers) if self._random.random() < self.dropRate else None
+        if failed:
+            raise ConnectionError("injected failure")
+        if self.poison.intersection(tickers):
+            raise ValueError(f"injected poison ticker in {len(tickers)} tickers")
+        return super().download([ticker for ticker in tickers if ticker != dropped], period, start, end, auto_adjust)
+
+    def quotes(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        return self.frames[ticker].loc[start:end]
+
+
+def run(args) -> list:
+    tickers = [f"T{i:04d}" for i in range(args.tickers)]
+    poison = tickers[:args.poison]
+    end = pd.Timestamp.now().normalize()
+    start = end - pd.DateOffset(days=args.days)
+    synthetic = quote_providers.SyntheticProvider()
+    # quotes are generated upfront, so the timings measure the fetch rather than the random walks
+    frames = {ticker: synthetic.quotes(ticker, start, end) for ticker in tickers}
+
+    def provider():
+        return FlakyProvider(frames, args.call_latency, args.ticker_latency, args.failure_rate, args.drop_rate,
+                             poison)
+
+    rows = []
+    started = time.perf_counter()
+    try:
+        data = provider().download(tickers, start=start, end=end)
+        fetched, error = len(batch_fetch.BatchFetcher.tickers_with_data(data)), None
+    except Exception as e:
+        fetched, error = 0, type(e).__name__
+    seconds = time.perf_counter() - started
+    rows.append({"layout": "single call", "batchSize": args.tickers, "workers": 1, "seconds": seconds,
+                 "fetched": fetched, "quarantined": 0, "calls": 1, "retries": 0, "error": error})
+    for batchSize in args.batch_sizes:
+        for workers in args.workers:
+            fetcher = batch_fetch.BatchFetcher(provider(), batchSize=batchSize, workers=workers, retries=args.retries,
+                                               backoff=args.backoff, maxBackoff=args.backoff * 8, rate=args.rate)
+            started = time.perf_counter()
+            try:
+                data = fetcher.download(tickers, start=start, end=end)
+                error = None
+            except Exception as e:
+                data, error = None, type(e).__name__
+            seconds = time.perf_counter() - started
+            report = fetcher.report()
+            rows.append({"layout": "batched", "batchSize": batchSize, "workers": workers, "seconds": seconds,
+                         "fetched": len(fetcher.tickers_with_data(data)), "quarantined": len(report["quarantined"]),
+                         "calls": report["calls"], "retries": report["retries"], "error": error})
+    for row in rows:
+        row["tickersPerSecond"] = row["fetched"] / row["seconds"]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[10, 25, 50])
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--call-latency", type=float, default=0.2)
+    parser.add_argument("--ticker-latency", type=float, default=0.005)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--drop-rate", type=float, default=0.05)
+    parser.add_argument("--poison", type=int, default=2, help="number of tickers that always fail")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=0.1)
+    parser.add_argument("--rate", type=float, default=0, help="provider calls per second, 0 for no limit")
+    parser.add_argument("--json", action="store_true", help="print rows as JSON instead of a table")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    rows = run(args)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{args.tickers} tickers, {args.call_latency} s + {args.ticker_latency} s/ticker per call, "
+          f"{args.failure_rate:.0%} failed calls, {args.drop_rate:.0%} dropped tickers, {args.poison} poison tickers")
+    print(f"{'layout':>11} {'batch':>5} {'workers':>7} {'seconds':>8} {'fetched':>7} {'quarantined':>11} "
+          f"{'calls':>5} {'retries':>7} {'tickers/s':>9} {'error':>15}")
+    for row in rows:
+        print(f"{row['layout']:>11} {row['batchSize']:>5} {row['workers']:>7} {row['seconds']:>8.2f} "
+              f"{row['fetched']:>7} {row['quarantined']:>11} {row['calls']:>5} {row['retries']:>7} "
+              f"{row['tickersPerSecond']:>9.1f} {row['error'] or '':>15}")
+
+
+if __name__ == "__main__":
+    main()
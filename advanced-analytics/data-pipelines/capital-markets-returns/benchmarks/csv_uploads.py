@@ -0,0 +1,88 @@
+""" Peak memory, size and time of CSV uploads: one in-memory string vs streamed, compressed chunks.
+
+The in-memory layout is what `MarketData.upload_to_gcs` used to do: `data.to_csv()` sent with
+`upload_from_string`. Quotes come from the synthetic provider and are written to a local
+temporary directory, so the benchmark runs offline; peak memory is measured with `tracemalloc`.
+
+Usage, from the capital-markets-returns directory:
+    python benchmarks/csv_uploads.py [--tickers 27 500] [--years 8] [--codecs none gzip zstd] [--json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+import compressed_io  # noqa: E402
+import quote_providers  # noqa: E402
+
+
+def measure(func) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def run(tickerCounts: list, years: int, codecs: list, chunkCells: int) -> list:
+    provider = quote_providers.SyntheticProvider()
+    end = pd.Timestamp.now().normalize()
+    directory = tempfile.mkdtemp(prefix="ipre-upload-")
+    rows = []
+    try:
+        for tickers in tickerCounts:
+            names = [f"T{i:04d}" for i in range(tickers)]
+            data = provider.download(names, start=end - pd.DateOffset(years=years), end=end)
+            path = os.path.join(directory, "quotes.csv")
+
+            def in_memory():
+                with open(path, "wb") as f:
+                    f.write(data.to_csv().encode("utf-8"))
+
+            seconds, peak = measure(in_memory)
+            rows.append({"tickers": tickers, "layout": "in-memory", "seconds": seconds, "peakBytes": peak,
+                         "bytes": os.path.getsize(path)})
+            for codec in codecs:
+                writer = compressed_io.CsvStreamWriter(codec, chunkCells=chunkCells)
+                seconds, peak = measure(lambda: writer.upload(data, path))
+                rows.append({"tickers": tickers, "layout": f"stream/{codec}", "seconds": seconds, "peakBytes": peak,
+                             "bytes": writer.bytesWritten})
+                _, readPeak = measure(lambda: compressed_io.read_csv(path, index_col=0, header=[0, 1]))
+                rows[-1]["readPeakBytes"] = readPeak
+    finally:
+        shutil.rmtree(directory)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", nargs="+", type=int, default=[27, 500])
+    parser.add_argument("--years", type=int, default=8)
+    parser.add_argument("--codecs", nargs="+", default=["none", "gzip", "zstd"])
+    parser.add_argument("--chunk-cells", type=int, default=100000)
+    parser.add_argument("--json", action="store_true", help="print rows as JSON instead of a table")
+    args = parser.parse_args()
+    rows = run(args.tickers, args.years, args.codecs, args.chunk_cells)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'tickers':>7} {'layout':>12} {'seconds':>8} {'peak MB':>8} {'MB':>7} {'read peak MB':>12}")
+    for row in rows:
+        readPeak = f"{row['readPeakBytes'] / 1e6:.1f}" if "readPeakBytes" in row else ""
+        print(f"{row['tickers']:>7} {row['layout']:>12} {row['seconds']:>8.2f} {row['peakBytes'] / 1e6:>8.1f} "
+              f"{row['bytes'] / 1e6:>7.2f} {readPeak:>12}")
+
+
+if __name__ == "__main__":
+    main()
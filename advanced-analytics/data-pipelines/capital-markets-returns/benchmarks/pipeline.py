@@ -0,0 +1,294 @@
+""" End-to-end time, peak memory and bytes written of every stage of `data_providers.workflow`
+and of its sharded counterpart `sharding.run`.
+
+Every grid point runs the whole Cloud Function workflow twice against a local storage root
+(STORAGE_ROOT): a first run downloading the whole history, then an incremental run one business
+day later. Quotes are random walks generated upfront for the whole universe and served by an
+in-memory provider, so the fetch stage measures the pipeline rather than the quote generator.
+
+Stages are the pipeline methods they time; a stage called from another stage counts for the outer one:
+    - fetch -- MarketQuotes.fetch: batched download and merge into the stored history
+    - preprocess -- MarketQuotes.preprocess: data-quality repair
+    - statistics -- MarketStatistics.get_statistics
+    - returns -- MarketReturns.get_cube and get_returns
+    - compare -- MarketReturns.remote_last_date, compare and new_cube_rows
+    - upload -- MarketData.save and upload_json_to_gcs: datasets, manifests and reports
+    - shards -- sharding.run_shards: fetch, preprocess and statistics of every shard in a process pool
+    - merge -- sharding.read_shard: loading the stored shards
+    - other -- the rest of the workflow: settings, stored history, setup
+
+With more than one shard the fetch, preprocess and statistics stages run in the shard processes
+and count for the shards stage; memory is traced in the main process only. Pass `--latency` to
+delay every provider call like a remote API, which is what shards run in parallel mostly hide.
+Peak memory is traced with `tracemalloc`, which slows allocation-heavy stages down; pass
+`--no-memory` for timings only. Bytes written are the sizes of the files a stage created or changed.
+Full OHLCV quotes of 10,000 tickers over 30 years take about 3.6 GB in memory.
+
+Usage, from the capital-markets-returns directory:
+    python benchmarks/pipeline.py [--tickers 27 500 2000] [--years 1 10] [--shards 1 4] [--latency 0.5]
+                                  [--store-format csv] [--no-memory] [--output results.json] [--json]
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+import data_providers  # noqa: E402
+import quote_providers  # noqa: E402
+import sharding  # noqa: E402
+
+STAGES = {
+    "fetch": [(data_providers.MarketQuotes, "fetch")],
+    "preprocess": [(data_providers.MarketQuotes, "preprocess")],
+    "statistics": [(data_providers.MarketStatistics, "get_statistics")],
+    "returns": [(data_providers.MarketReturns, "get_cube"), (data_providers.MarketReturns, "get_returns")],
+    "compare": [(data_providers.MarketReturns, "remote_last_date"), (data_providers.MarketReturns, "compare"),
+                (data_providers.MarketReturns, "new_cube_rows")],
+    "upload": [(data_providers.MarketData, "save"), (data_providers.MarketData, "upload_json_to_gcs")],
+    "shards": [(sharding, "run_shards")],
+    "merge": [(sharding, "read_shard")],
+}
+
+
+class PanelProvider(quote_providers.QuoteProvider):
+    """ Quotes of a whole universe generated upfront as one array per field. """
+    name = "benchmark"
+
+    def __init__(self, tickers: list, start: pd.Timestamp, end: pd.Timestamp, seed: int = 0, latency: float = 0.0):
+        self.latency: float = latency
+        self.dates: pd.DatetimeIndex = pd.bdate_range(start, end, name="Date")
+        self.tickers: pd.Index = pd.Index(tickers)
+        self.end: pd.Timestamp = self.dates[-2]
+        rng = np.random.default_rng(seed)
+        shape = (len(self.dates), len(tickers))
+        close = (20.0 + 180.0 * rng.random(len(tickers))) \
+            * np.exp(np.cumsum(0.0003 + 0.015 * rng.standard_normal(shape), axis=0))
+        spread = 1 + np.abs(0.0075 * rng.standard_normal(shape))
+        self.fields: dict = {
+            "Adj Close": close,
+            "Close": close,
+            "High": close * spread,
+            "Low": close / spread,
+            "Open": close * (1 + 0.005 * rng.standard_normal(shape)),
+            "Volume": np.round(np.exp(14.0 + 0.5 * rng.standard_normal(shape))),
+        }
+
+    def last_date(self, ticker: str = None) -> pd.Timestamp:
+        return self.end
+
+    def quotes(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        data = self.download([ticker], start=start, end=end)
+        if data.shape[0] == 0:
+            return pd.DataFrame(columns=quote_providers.FIELDS)
+        return data.xs(ticker, axis=1, level=1)
+
+    def download(self, tickers: list, period: str = None, start=None, end=None,
+                 auto_adjust: bool = False) -> pd.DataFrame:
+        start, end = self.window(None, period, start, end)
+        time.sleep(self.latency)
+        rows = slice(self.dates.searchsorted(start), self.dates.searchsorted(min(end, self.end), side="right"))
+        positions = self.tickers.get_indexer(tickers)
+        known = [ticker for ticker, position in zip(tickers, positions) if position >= 0]
+        positions = positions[positions >= 0]
+        if not known or rows.start >= rows.stop:
+            return pd.DataFrame()
+        values = np.concatenate([self.fields[field][rows][:, positions] for field in quote_providers.FIELDS], axis=1)
+        return pd.DataFrame(values, index=self.dates[rows],
+                            columns=pd.MultiIndex.from_product([quote_providers.FIELDS, known]))
+
+
+class StageRecorder:
+    """ Time, peak traced memory and bytes written of pipeline methods, grouped into stages. """
+    def __init__(self, storageRoot: str, traceMemory: bool):
+        self.storageRoot: str = storageRoot
+        self.traceMemory: bool = traceMemory
+        self.stages: dict = {}
+        self._depth: int = 0
+
+    def files(self) -> dict:
+        files = {}
+        for directory, _, names in os.walk(self.storageRoot):
+            for name in names:
+                stat = os.stat(os.path.join(directory, name))
+                files[os.path.join(directory, name)] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def record(self, stage: str, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if self._depth > 0:
+                return func(*args, **kwargs)
+            self._depth += 1
+            before = self.files()
+            if self.traceMemory:
+                tracemalloc.reset_peak()
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1] if self.traceMemory else None
+                after = self.files()
+                written = sum(size for path, (size, mtime) in after.items() if before.get(path) != (size, mtime))
+                self._depth -= 1
+                self.add(stage, seconds, peak, written)
+        return timed
+
+    def add(self, stage: str, seconds: float, peak: int, written: int) -> None:
+        totals = self.stages.setdefault(stage, {"seconds": 0.0, "peakBytes": None, "bytesWritten": 0})
+        totals["seconds"] += seconds
+        totals["bytesWritten"] += written
+        if peak is not None:
+            totals["peakBytes"] = max(totals["peakBytes"] or 0, peak)
+
+    @contextlib.contextmanager
+    def patched(self):
+        """ Wrap the stage methods of the pipeline classes while the context is open. """
+        originals = []
+        for stage, methods in STAGES.items():
+            for cls, name in methods:
+                original = cls.__dict__[name]
+                if isinstance(original, staticmethod):
+                    wrapped = staticmethod(self.record(stage, original.__func__))
+                else:
+                    wrapped = self.record(stage, original)
+                originals.append((cls, name, original))
+                setattr(cls, name, wrapped)
+        try:
+            yield self
+        finally:
+            for cls, name, original in originals:
+                setattr(cls, name, original)
+
+
+def run_workflow(storageRoot: str, traceMemory: bool, shards: int) -> dict:
+    recorder = StageRecorder(storageRoot, traceMemory)
+    if traceMemory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with recorder.patched():
+            if shards > 1:
+                sharding.run(shards)
+            else:
+                data_providers.workflow()
+        total = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if traceMemory else None
+    finally:
+        if traceMemory:
+            tracemalloc.stop()
+    recorder.add("other", total - sum(stage["seconds"] for stage in recorder.stages.values()), None, 0)
+    recorder.stages["total"] = {
+        "seconds": total,
+        "peakBytes": peak,
+        "bytesWritten": sum(stage["bytesWritten"] for stage in recorder.stages.values()),
+    }
+    return recorder.stages
+
+
+def run(tickerCounts: list, yearCounts: list, shardCounts: list, storeFormat: str, traceMemory: bool,
+        latency: float = 0.0) -> list:
+    rows = []
+    workingDirectory = os.getcwd()
+    end = pd.Timestamp.now().normalize()
+    grid = [(tickers, years, shards) for tickers in tickerCounts for years in yearCounts for shards in shardCounts]
+    for tickers, years, shards in grid:
+        names = [f"T{i:05d}" for i in range(tickers)]
+        start = end - pd.DateOffset(years=years)
+        directory = tempfile.mkdtemp(prefix="ipre-pipeline-")
+        storageRoot = os.path.join(directory, "storage")
+        environment = {
+            "STORAGE_ROOT": storageRoot,
+            "QUOTES_BUCKET_NAME": "quotes",
+            "QUOTES_BLOB_NAME": "capital-markets-quotes.csv",
+            "RETURNS_BUCKET_NAME": "returns",
+            "RETURNS_BLOB_NAME": "capital-markets-returns.csv",
+            "MARKET_DATA_PROVIDER": PanelProvider.name,
+            "QUOTES_RATE_LIMIT": "0",
+            "STORE_FORMAT": storeFormat,
+            "RUN_ID": "full",
+            # run records stay with the benchmark rather than in the shared metrics file
+            "RUN_METRICS_FILE": os.path.join(directory, "pipeline-runs.jsonl"),
+        }
+        saved = {name: os.environ.get(name) for name in environment}
+        provider = PanelProvider(names, start, end + pd.offsets.BDay(1), latency=latency)
+        quote_providers.__providers__[PanelProvider.name] = lambda: provider
+        try:
+            os.makedirs(storageRoot)
+            with open(os.path.join(directory, "settings.json"), "w") as f:
+                json.dump({"tickers": names, "startDate": start.strftime("%Y-%m-%d")}, f)
+            os.chdir(directory)
+            os.environ.update(environment)
+            for run_name in ["full", "incremental"]:
+                # both runs happen on the same day, which is one checkpointed run by default
+                os.environ["RUN_ID"] = run_name
+                stages = run_workflow(storageRoot, traceMemory, shards)
+                for stage, totals in stages.items():
+                    rows.append({"tickers": tickers, "years": years, "shards": shards, "days": int(provider.dates.searchsorted(
+                        provider.end, side="right")), "run": run_name, "stage": stage, **totals})
+                provider.end = provider.dates[-1]
+        finally:
+            os.chdir(workingDirectory)
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            quote_providers.__providers__.pop(PanelProvider.name, None)
+            shutil.rmtree(directory)
+    return rows
+
+
+def summary(rows: list) -> str:
+    stages = list(STAGES) + ["other", "total"]
+    lines = [f"{'tickers':>7} {'years':>5} {'shards':>6} {'run':>11} "
+             + " ".join(f"{stage[:10]:>10}" for stage in stages) + f" {'peak MB':>8} {'MB written':>10}"]
+    for key in dict.fromkeys((row["tickers"], row["years"], row["shards"], row["run"]) for row in rows):
+        byStage = {row["stage"]: row for row in rows
+                   if (row["tickers"], row["years"], row["shards"], row["run"]) == key}
+        seconds = " ".join(f"{byStage[stage]['seconds'] if stage in byStage else 0.0:>10.2f}" for stage in stages)
+        peak = byStage["total"]["peakBytes"]
+        lines.append(f"{key[0]:>7} {key[1]:>5} {key[2]:>6} {key[3]:>11} {seconds} "
+                     f"{peak / 1e6 if peak is not None else float('nan'):>8.1f} "
+                     f"{byStage['total']['bytesWritten'] / 1e6:>10.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", nargs="+", type=int, default=[27, 500, 2000])
+    parser.add_argument("--years", nargs="+", type=int, default=[1, 10])
+    parser.add_argument("--shards", nargs="+", type=int, default=[1], help="shard counts, 1 runs the plain workflow")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every provider call takes")
+    parser.add_argument("--store-format", default="csv", help="STORE_FORMAT of the runs, e.g. csv,parquet")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory, for undisturbed timings")
+    parser.add_argument("--output", help="also write the rows as JSON to this file")
+    parser.add_argument("--json", action="store_true", help="print rows as JSON instead of a table")
+    args = parser.parse_args()
+    logging.getLogger("capital-markets-data").setLevel(logging.WARNING)
+    rows = run(args.tickers, args.years, args.shards, args.store_format, not args.no_memory, args.latency)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print("Seconds per stage:")
+    print(summary(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+""" Monolithic CSV vs date-partitioned Parquet for the raw quotes dataset.
+
+Quotes come from the synthetic provider and are written to a local temporary directory, so the
+benchmark runs offline. For every layout it measures the full write, the stored size, a full
+read, a one-year read of five tickers' close prices, and appending one day.
+
+Usage, from the capital-markets-returns directory:
+    python benchmarks/quotes_store.py [--tickers 27] [--years 8] [--codecs snappy zstd gzip none] [--json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+import partitioned_store  # noqa: E402
+import quote_providers  # noqa: E402
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def directory_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def bench_csv(directory: str, history: pd.DataFrame, day: pd.DataFrame, rangeStart, columns: list) -> dict:
+    path = os.path.join(directory, "quotes.csv")
+    _, writeSeconds = timed(lambda: history.to_csv(path))
+    size = directory_size(path)
+    _, readSeconds = timed(lambda: pd.read_csv(path, index_col=0, header=[0, 1], parse_dates=True))
+    # a CSV file has to be parsed completely before it can be sliced
+    _, rangeSeconds = timed(
+        lambda: pd.read_csv(path, index_col=0, header=[0, 1], parse_dates=True).loc[rangeStart:, columns]
+    )
+
+    def append():
+        stored = pd.read_csv(path, index_col=0, header=[0, 1], parse_dates=True)
+        pd.concat([stored, day]).to_csv(path)
+
+    _, appendSeconds = timed(append)
+    return {
+        "layout": "csv",
+        "writeSeconds": writeSeconds,
+        "bytes": size,
+        "readSeconds": readSeconds,
+        "rangeReadSeconds": rangeSeconds,
+        "appendSeconds": appendSeconds,
+        "appendBytesWritten": directory_size(path),
+    }
+
+
+def bench_parquet(directory: str, history: pd.DataFrame, day: pd.DataFrame, rangeStart, columns: list,
+                  codec: str, partitioning: str, rowGroupSize: int) -> dict:
+    path = os.path.join(directory, f"quotes-{codec}-{partitioning}")
+    store = partitioned_store.PartitionedStore(path, partitioning=partitioning, codec=codec, rowGroupSize=rowGroupSize)
+    _, writeSeconds = timed(lambda: store.write(history))
+    size = directory_size(path)
+    _, readSeconds = timed(lambda: store.read())
+    _, rangeSeconds = timed(lambda: store.read(start=rangeStart, columns=columns))
+    store.bytesWritten = 0
+    _, appendSeconds = timed(lambda: store.append(day))
+    return {
+        "layout": f"parquet/{codec}/{partitioning}",
+        "writeSeconds": writeSeconds,
+        "bytes": size,
+        "readSeconds": readSeconds,
+        "rangeReadSeconds": rangeSeconds,
+        "appendSeconds": appendSeconds,
+        "appendBytesWritten": store.bytesWritten,
+    }
+
+
+def run(tickers: int, years: int, codecs: list, partitionings: list, rowGroupSize: int) -> list:
+    provider = quote_providers.SyntheticProvider()
+    names = [f"T{i:04d}" for i in range(tickers)]
+    end = pd.Timestamp.now().normalize() - pd.offsets.BDay(1)
+    history = provider.download(names, start=end - pd.DateOffset(years=years), end=end)
+    day = provider.download(names, start=end + pd.offsets.BDay(1), end=end + pd.offsets.BDay(1))
+    rangeStart = end - pd.DateOffset(years=1)
+    columns = [("Close", name) for name in names[:5]]
+    directory = tempfile.mkdtemp(prefix="ipre-store-")
+    try:
+        rows = [bench_csv(directory, history, day, rangeStart, columns)]
+        for partitioning in partitionings:
+            for codec in codecs:
+                rows.append(bench_parquet(directory, history, day, rangeStart, columns, codec, partitioning,
+                                          rowGroupSize))
+    finally:
+        shutil.rmtree(directory)
+    for row in rows:
+        row.update({"tickers": tickers, "years": years, "days": int(history.shape[0])})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", type=int, default=27)
+    parser.add_argument("--years", type=int, default=8)
+    parser.add_argument("--codecs", nargs="+", default=["snappy", "zstd", "gzip", "none"])
+    parser.add_argument("--partitionings", nargs="+", default=["year"])
+    parser.add_argument("--row-group-size", type=int, default=64)
+    parser.add_argument("--json", action="store_true", help="print rows as JSON instead of a table")
+    args = parser.parse_args()
+    rows = run(args.tickers, args.years, args.codecs, args.partitionings, args.row_group_size)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{args.tickers} tickers, {rows[0]['days']} days")
+    print(f"{'layout':>24} {'write, s':>9} {'MB':>7} {'read, s':>8} {'1y x 5, s':>10} {'append, s':>10} {'append KB':>10}")
+    for row in rows:
+        print(f"{row['layout']:>24} {row['writeSeconds']:>9.3f} {row['bytes'] / 1e6:>7.2f} {row['readSeconds']:>8.3f} "
+              f"{row['rangeReadSeconds']:>10.3f} {row['appendSeconds']:>10.3f} {row['appendBytesWritten'] / 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+""" Time of multi-horizon returns: one `pct_change` per horizon and kind vs the one-pass cube.
+
+The `pct_change` layout is what `MarketReturns.get_returns` and the recommendation engine did
+for a single horizon, repeated for every horizon of `returns_cube.HORIZONS` and for log returns.
+Quotes come from the synthetic provider, so the benchmark runs offline.
+
+Usage, from the capital-markets-returns directory:
+    python benchmarks/returns_cube.py [--tickers 27 500 2000] [--years 10] [--repeat 3] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+import quote_providers  # noqa: E402
+import returns_cube  # noqa: E402
+
+
+def per_horizon(quotes: pd.DataFrame) -> dict:
+    returns = {}
+    for horizon in returns_cube.HORIZONS:
+        returns[returns_cube.field("simple", horizon)] = quotes.pct_change(periods=horizon)
+        returns[returns_cube.field("log", horizon)] = np.log(quotes / quotes.shift(horizon))
+    return returns
+
+
+def best_of(func, repeat: int) -> float:
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - started)
+    return min(seconds)
+
+
+def run(tickerCounts: list, years: int, repeat: int) -> list:
+    provider = quote_providers.SyntheticProvider()
+    end = pd.Timestamp.now().normalize()
+    rows = []
+    for tickers in tickerCounts:
+        names = [f"T{i:04d}" for i in range(tickers)]
+        quotes = provider.download(names, start=end - pd.DateOffset(years=years), end=end).loc[:, "Adj Close"]
+        cube = returns_cube.compute(quotes)
+        expected = quotes.pct_change(periods=20).dropna(how="all")
+        if not np.allclose(returns_cube.select(cube, 20).to_numpy(), expected.to_numpy(), equal_nan=True):
+            raise AssertionError("The cube differs from pct_change")
+        for layout, func in [("pct_change", lambda: per_horizon(quotes)), ("cube", lambda: returns_cube.compute(quotes))]:
+            rows.append({"tickers": tickers, "days": quotes.shape[0], "layout": layout,
+                         "seconds": best_of(func, repeat)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", nargs="+", type=int, default=[27, 500, 2000])
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print rows as JSON instead of a table")
+    args = parser.parse_args()
+    rows = run(args.tickers, args.years, args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'tickers':>7} {'days':>6} {'layout':>10} {'seconds':>8}")
+    for row in rows:
+        print(f"{row['tickers']:>7} {row['days']:>6} {row['layout']:>10} {row['seconds']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+""" Parallel batched quotes download with retries and partial-failure tolerance.
+
+The ticker universe is split into batches that a bounded thread pool downloads concurrently:
+    - every provider call waits for a token of a shared rate limiter
+    - a failed call is retried after a jittered exponential backoff
+      (`uniform(0, min(max backoff, base * 2 ** attempt))`)
+    - a batch that keeps raising is split in halves, so one bad ticker cannot fail its neighbours;
+      halves are tried once before they are split again, single tickers get every retry
+    - tickers without data after the retries, or failing on their own, are quarantined and reported;
+      they stay in the downloaded frame as empty columns, so every requested ticker is returned
+
+Optional environment variables:
+    - QUOTES_BATCH_SIZE -- tickers per provider call, defaults to 25
+    - QUOTES_FETCH_WORKERS -- concurrent provider calls, defaults to 4
+    - QUOTES_FETCH_RETRIES -- retries of a failed call, defaults to 3
+    - QUOTES_BACKOFF_SECONDS -- base backoff before the first retry, defaults to 1
+    - QUOTES_MAX_BACKOFF_SECONDS -- backoff cap, defaults to 30
+    - QUOTES_RATE_LIMIT -- provider calls per second, 0 for no limit, defaults to 2
+"""
+
+import concurrent.futures
+import logging
+import os
+import random
+import threading
+import time
+
+import pandas as pd
+
+import quote_providers
+
+logger = logging.getLogger("capital-markets-data")
+
+NO_DATA = "no data"
+
+
+class RateLimiter:
+    """ Token bucket shared by the fetch workers.
+
+    Attributes:
+        rate -- tokens added per second, 0 disables the limiter
+        burst -- max tokens available at once
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate: float = rate
+        self.burst: int = max(burst, 1)
+        self._tokens: float = self.burst
+        self._updated: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """ Take a token, sleeping until one is available. Returns the seconds waited. """
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class BatchFetcher:
+    """ Download quotes of many tickers in concurrent batches.
+
+    Public methods:
+        download() -- quotes of the requested tickers, empty for those that could not be fetched.
+        report() -- counters of all downloads and the tickers quarantined by them.
+
+    Attributes:
+        provider -- market data provider
+        batchSize -- tickers per provider call
+        workers -- concurrent provider calls
+        retries -- retries of a failed call
+        backoff -- base backoff in seconds
+        maxBackoff -- backoff cap in seconds
+        limiter -- rate limiter of provider calls
+        quarantined -- reason of every ticker that could not be fetched by its last download
+    """
+    def __init__(self, provider: quote_providers.QuoteProvider, batchSize: int = None, workers: int = None,
+                 retries: int = None, backoff: float = None, maxBackoff: float = None, rate: float = None):
+        self.provider: quote_providers.QuoteProvider = provider
+        self.batchSize: int = batchSize or int(os.environ.get("QUOTES_BATCH_SIZE", 25))
+        self.workers: int = workers or int(os.environ.get("QUOTES_FETCH_WORKERS", 4))
+        self.retries: int = retries if retries is not None else int(os.environ.get("QUOTES_FETCH_RETRIES", 3))
+        self.backoff: float = backoff if backoff is not None else float(os.environ.get("QUOTES_BACKOFF_SECONDS", 1))
+        self.maxBackoff: float = maxBackoff if maxBackoff is not None else float(
+            os.environ.get("QUOTES_MAX_BACKOFF_SECONDS", 30)
+        )
+        rate = rate if rate is not None else float(os.environ.get("QUOTES_RATE_LIMIT", 2))
+        self.limiter: RateLimiter = RateLimiter(rate, burst=self.workers)
+        self.quarantined: dict = {}
+        self._lock = threading.Lock()
+        self._counters: dict = {"calls": 0, "retries": 0, "splits": 0, "rateLimitSeconds": 0.0, "seconds": 0.0}
+
+    def _count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def delay(self, attempt: int) -> float:
+        """ Full-jitter exponential backoff before retry `attempt` (1-based). """
+        return random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def tickers_with_data(data: pd.DataFrame) -> list:
+        if data is None or data.shape[0] == 0:
+            return []
+        present = data.notna().any(axis=0)
+        return list(present[present].index.get_level_values(1).unique())
+
+    def _call(self, tickers: list, start, end) -> pd.DataFrame:
+        self._count("rateLimitSeconds", self.limiter.acquire())
+        self._count("calls")
+        return self.provider.download(tickers=tickers, start=start, end=end)
+
+    def _fetch_batch(self, batch: list, start, end, split: bool = False) -> tuple:
+        """ Download one batch: returns (frames, failures) with failures keyed by ticker. """
+        pending = list(batch)
+        frames = []
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self._count("retries")
+                time.sleep(self.delay(attempt))
+            try:
+                data = self._call(pending, start, end)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.warning(f"Fetching {len(pending)} tickers failed (attempt {attempt + 1}): {error}")
+                if split and len(pending) > 1:
+                    break
+                continue
+            error = None
+            fetched = self.tickers_with_data(data)
+            if fetched:
+                frames.append(data.loc[:, data.columns.get_level_values(1).isin(fetched)])
+            pending = [ticker for ticker in pending if ticker not in fetched]
+            if not pending:
+                break
+        if error is not None and len(pending) > 1:
+            # isolate the tickers that make the whole call fail
+            self._count("splits")
+            middle = len(pending) // 2
+            failures = {}
+            for half in (pending[:middle], pending[middle:]):
+                halfFrames, halfFailures = self._fetch_batch(half, start, end, split=True)
+                frames.extend(halfFrames)
+                failures.update(halfFailures)
+            return frames, failures
+        return frames, {ticker: error or NO_DATA for ticker in pending}
+
+    def download(self, tickers: list, start=None, end=None) -> pd.DataFrame:
+        """ Quotes of the requested tickers.
+
+        Counters add up over the downloads of the fetcher, e.g. an incremental download and a backfill.
+
+        Args:
+            tickers (list): asset tickers.
+            start, end (optional): date window.
+
+        Returns:
+            pd.DataFrame: quotes with (field, ticker) columns for every requested ticker; the columns of
+                tickers that failed are empty and the tickers are listed in `quarantined`.
+        """
+        started = time.perf_counter()
+        batches = [tickers[i:i + self.batchSize] for i in range(0, len(tickers), self.batchSize)]
+        frames = []
+        failures = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._fetch_batch, batch, start, end) for batch in batches]
+            for future in futures:
+                batchFrames, batchFailures = future.result()
+                frames.extend(batchFrames)
+                failures.update(batchFailures)
+        if not frames and all(reason == NO_DATA for reason in failures.values()):
+            # nothing traded in the window rather than every ticker failing
+            failures = {}
+        self.quarantined = {
+            **{ticker: reason for ticker, reason in self.quarantined.items() if ticker not in tickers},
+            **failures
+        }
+        self._count("seconds", time.perf_counter() - started)
+        if failures:
+            logger.warning(f"Quarantined {len(failures)} of {len(tickers)} tickers: {sorted(failures)}.")
+        if not frames:
+            if failures:
+                raise RuntimeError(f"No quotes could be fetched for any of {len(tickers)} tickers.")
+            return pd.DataFrame()
+        data = pd.concat(frames, axis=1).sort_index()
+        data = data.loc[:, ~data.columns.duplicated()]
+        # quarantined tickers come back as empty columns rather than missing ones
+        columns = pd.MultiIndex.from_product([data.columns.get_level_values(0).unique(), tickers])
+        return data.reindex(columns=columns).sort_index(axis=1)
+
+    def report(self) -> dict:
+        """ Counters of all downloads and the tickers quarantined by them. """
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "provider": self.provider.name,
+            "batchSize": self.batchSize,
+            "workers": self.workers,
+            "calls": counters.get("calls", 0),
+            "retries": counters.get("retries", 0),
+            "splits": counters.get("splits", 0),
+            "rateLimitSeconds": round(counters.get("rateLimitSeconds", 0.0), 3),
+            "seconds": round(counters.get("seconds", 0.0), 3),
+            "quarantined": dict(sorted(self.quarantined.items())),
+        }
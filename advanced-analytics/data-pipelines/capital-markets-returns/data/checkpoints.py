@@ -0,0 +1,127 @@
+""" Checkpoints of pipeline runs, so a retried run resumes after its last completed stage.
+
+A run is identified by its run ID. The Cloud Function uses the ID of its triggering event, which a
+retry of a failed or timed-out execution keeps, so a retry resumes the run and a new trigger starts
+a new one. Command line runs default to RUN_ID or the UTC date. Every completed stage is recorded
+as its own JSON object, `checkpoints/<pipeline>/<runId>/<stage>.json` in CHECKPOINT_BUCKET_NAME.
+The record holds fingerprints of the data the stage read and stored. Shards running in parallel
+record their stages without overwriting each other.
+
+A stage is skipped when it already completed in the same run from the same inputs. Stages are
+idempotent, so a stage that failed halfway simply runs again:
+    - fetched quotes are merged into the stored history by date
+    - unchanged datasets are not uploaded again, and Parquet partitions are replaced by date
+    - returns are uploaded after the last date of the stored returns; a manifest left behind by an
+      interrupted upload no longer matches its dataset, which is then uploaded again with it
+Only the shards still missing run again. A run whose last stage completed does nothing. Missing
+dates need no checkpoint: every run fetches the days after the last stored one and uploads the
+returns after the last stored date.
+
+Optional environment variables:
+    - RUN_ID -- ID of the run to start or resume, defaults to the event ID in the Cloud Function and
+      to the UTC date on the command line, e.g. `2024-06-28`; set it for every task of a fan-out
+    - CHECKPOINT_BUCKET_NAME -- bucket of the checkpoints, defaults to QUOTES_BUCKET_NAME
+    - CHECKPOINTS -- `false` to run every stage, defaults to `true`
+"""
+
+import datetime
+import json
+import logging
+import os
+
+import pandas as pd
+
+import object_store
+import run_telemetry
+
+logger = logging.getLogger("capital-markets-data")
+
+PREFIX = "checkpoints"
+
+
+def run_id() -> str:
+    """ RUN_ID, or the UTC date. """
+    return os.environ.get("RUN_ID") or datetime.datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def fingerprint(data: pd.DataFrame) -> dict:
+    """ Dates, rows and columns of a dataset, enough to tell whether a stage saw the same data. """
+    index = pd.DatetimeIndex(data.index)
+    return {
+        "firstDate": index[0].strftime("%Y-%m-%d") if len(index) else None,
+        "lastDate": index[-1].strftime("%Y-%m-%d") if len(index) else None,
+        "rows": int(data.shape[0]),
+        "columns": int(data.shape[1]),
+    }
+
+
+class Checkpoint:
+    """ Completed stages of a pipeline run.
+
+    Public methods:
+        load() -- record of a completed stage, None if there is none.
+        completed() -- record of a stage completed from the given inputs, None if it has to run.
+        complete() -- record a completed stage.
+        pending() -- stages of a list that still have to run.
+
+    Attributes:
+        pipeline -- pipeline name
+        runId -- ID of the run
+        bucket -- bucket name of the checkpoints
+        enabled -- whether completed stages are skipped and recorded
+    """
+    def __init__(self, pipeline: str, runId: str = None, bucket: str = None, enabled: bool = None):
+        self.pipeline: str = pipeline
+        self.runId: str = runId or run_id()
+        self.bucket: str = bucket or os.environ.get("CHECKPOINT_BUCKET_NAME", os.environ["QUOTES_BUCKET_NAME"])
+        self.enabled: bool = enabled if enabled is not None \
+            else os.environ.get("CHECKPOINTS", "true").lower() == "true"
+
+    def name(self, stage: str) -> str:
+        return f"{PREFIX}/{self.pipeline}/{self.runId}/{stage}.json"
+
+    def load(self, stage: str) -> dict:
+        """ Record of a completed stage, None if there is none or checkpoints are disabled. """
+        if not self.enabled:
+            return None
+        body = object_store.bucket(self.bucket).read_bytes(self.name(stage))
+        return json.loads(body) if body is not None else None
+
+    def completed(self, stage: str, inputs: dict = None) -> dict:
+        """ Record of a completed stage.
+
+        Args:
+            stage (str): stage name.
+            inputs (dict, optional): fingerprint of the data the stage reads now; a stage completed
+                from other data runs again.
+
+        Returns:
+            dict: the stage record, None if the stage has to run.
+        """
+        record = self.load(stage)
+        if record is None:
+            return None
+        if inputs is not None and record.get("inputs") != inputs:
+            logger.info(f"Stage {stage} of run {self.runId} completed from other data, running it again.")
+            return None
+        logger.info(f"Stage {stage} of run {self.runId} completed at {record['completedAt']}, skipping it.")
+        run_telemetry.add(resumedStages=1)
+        return record
+
+    def complete(self, stage: str, inputs: dict = None, **outputs) -> dict:
+        """ Record a completed stage with the fingerprints of its inputs and outputs. """
+        record = {
+            "pipeline": self.pipeline,
+            "runId": self.runId,
+            "stage": stage,
+            "completedAt": datetime.datetime.utcnow().isoformat(),
+            "inputs": inputs,
+            "outputs": outputs,
+        }
+        if self.enabled:
+            object_store.bucket(self.bucket).put(self.name(stage), json.dumps(record), "application/json")
+        return record
+
+    def pending(self, stages: list) -> list:
+        """ Stages of `stages` that did not complete yet, in the same order. """
+        return [stage for stage in stages if self.load(stage) is None]
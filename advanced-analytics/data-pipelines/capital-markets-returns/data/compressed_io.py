@@ -0,0 +1,149 @@
+""" Streaming, optionally compressed CSV objects.
+
+Writers encode a DataFrame a chunk of rows at a time into a gzip or zstd stream, so peak
+memory is bounded by the chunk size rather than the size of the dataset. Chunks hold a fixed
+number of cells, so wide universes are written in proportionally fewer rows at a time. Remote files opened
+through `fsspec`/`gcsfs` buffer one upload block at a time and send the blocks over a GCS
+resumable upload.
+
+Readers detect the codec from the first bytes of the object, so the same object name can hold
+plain, gzip or zstd CSV and no reader needs to be told which one it is. Missing values are written
+as `null`, which pandas reads as NaN and the BigQuery load transform leaves out.
+
+Optional environment variables of the writers:
+    - UPLOAD_COMPRESSION -- `none` (default), `gzip` or `zstd`
+    - UPLOAD_CHUNK_CELLS -- cells (rows x columns) encoded at a time, defaults to 100000
+    - UPLOAD_BLOCK_SIZE -- bytes per resumable upload request, rounded up to 256 KiB, defaults to 8 MiB
+"""
+
+import contextlib
+import gzip
+import hashlib
+import io
+import os
+
+import fsspec
+import pandas as pd
+import zstandard
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# GCS resumable uploads take whole multiples of 256 KiB per request
+UPLOAD_BLOCK_UNIT = 256 * 1024
+NA_REP = "null"
+
+__valid_codecs__ = {
+    "none": "text/csv",
+    "gzip": "application/gzip",
+    "zstd": "application/zstd",
+}
+
+
+def detect(head: bytes) -> str:
+    """ Codec of a stream starting with `head`. """
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return "none"
+
+
+def decompressed(f) -> io.RawIOBase:
+    """ Binary stream of the decompressed content of the seekable binary file `f`. """
+    codec = detect(f.read(len(ZSTD_MAGIC)))
+    f.seek(0)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+    return f
+
+
+def upload_block_size(blockSize: int = None) -> int:
+    """ Bytes per resumable upload request: UPLOAD_BLOCK_SIZE or 8 MiB, rounded up to 256 KiB. """
+    blockSize = blockSize or int(os.environ.get("UPLOAD_BLOCK_SIZE", 8 * 1024 * 1024))
+    return -(-blockSize // UPLOAD_BLOCK_UNIT) * UPLOAD_BLOCK_UNIT
+
+
+def read_csv(path: str, **kwargs) -> pd.DataFrame:
+    """ `pd.read_csv` of a local or remote object that may be gzip or zstd compressed.
+
+    Args:
+        path (str): local path or URL, e.g. `gs://bucket/file.csv`.
+        kwargs: `pd.read_csv` arguments.
+
+    Returns:
+        pd.DataFrame: parsed CSV.
+    """
+    with fsspec.open(path, "rb") as f:
+        return pd.read_csv(io.TextIOWrapper(decompressed(f), encoding="utf-8"), **kwargs)
+
+
+class CsvStreamWriter:
+    """ Write a DataFrame as CSV, a chunk of rows at a time, through an optional compressor.
+
+    Public methods:
+        write() -- encode a DataFrame into a binary file object.
+
+    Attributes:
+        codec -- `none`, `gzip` or `zstd`
+        chunkCells -- cells (rows x columns) encoded at a time
+        contentType -- content type of the written object
+        rawBytes -- uncompressed size of the last write
+        bytesWritten -- size of the last write after compression
+        contentHash -- sha256 of the uncompressed CSV of the last write, independent of the codec
+    """
+    def __init__(self, codec: str = None, chunkCells: int = None, level: int = None):
+        self.codec: str = codec or os.environ.get("UPLOAD_COMPRESSION", "none")
+        if self.codec not in __valid_codecs__:
+            raise ValueError(f"Unknown compression: {self.codec}")
+        self.chunkCells: int = chunkCells or int(os.environ.get("UPLOAD_CHUNK_CELLS", 100000))
+        self.level: int = level
+        self.contentType: str = __valid_codecs__[self.codec]
+        self.rawBytes: int = 0
+        self.bytesWritten: int = 0
+        self.contentHash: str = None
+
+    def _compressor(self, f):
+        if self.codec == "gzip":
+            return gzip.GzipFile(fileobj=f, mode="wb", compresslevel=self.level or 6, mtime=0)
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level or 3).stream_writer(f, closefd=False)
+        return contextlib.nullcontext(f)
+
+    def write(self, data: pd.DataFrame, f) -> str:
+        """ Encode `data` into the binary file object `f`, which is left open.
+
+        Returns:
+            str: `sha256:<hex>` of the uncompressed CSV.
+        """
+        digest = hashlib.sha256()
+        chunkRows = max(self.chunkCells // max(data.shape[1], 1), 1)
+        self.rawBytes = 0
+        start = f.tell() if hasattr(f, "tell") else 0
+        with self._compressor(f) as out:
+            for i in range(0, max(data.shape[0], 1), chunkRows):
+                chunk = data.iloc[i:i + chunkRows].to_csv(header=i == 0, na_rep=NA_REP).encode("utf-8")
+                digest.update(chunk)
+                self.rawBytes += len(chunk)
+                out.write(chunk)
+        self.bytesWritten = (f.tell() if hasattr(f, "tell") else self.rawBytes) - start
+        self.contentHash = f"sha256:{digest.hexdigest()}"
+        return self.contentHash
+
+    def upload(self, data: pd.DataFrame, path: str, blockSize: int = None) -> str:
+        """ Stream `data` to a local path or URL, e.g. `gs://bucket/file.csv`.
+
+        Args:
+            data (pd.DataFrame): data to write.
+            path (str): destination.
+            blockSize (int, optional): bytes per upload request. Defaults to UPLOAD_BLOCK_SIZE or 8 MiB.
+
+        Returns:
+            str: `sha256:<hex>` of the uncompressed CSV.
+        """
+        options = {"block_size": upload_block_size(blockSize)}
+        if path.startswith("gs://"):
+            options["content_type"] = self.contentType
+        with fsspec.open(path, "wb", **options) as f:
+            return self.write(data, f)
@@ -6,17 +6,70 @@ Required environment variables:
     - QUOTES_BLOB -- name of capital markets quotes file, e.g. `capital-markets-quotes.csv` 
     - RETURNS_BUCKET -- GCS bucket name with _historical_ returns data
     - RETURNS_BLOB -- name of returns file, e.g. `capital-markets-returns.csv`
+
+Optional environment variables:
+    - STATISTICS_BUCKET_NAME -- GCS bucket name for the asset statistics snapshot, defaults to QUOTES_BUCKET_NAME
+    - STATISTICS_BLOB_NAME -- name of the statistics snapshot, defaults to `capital-markets-statistics.json`
+    - MARKET_DATA_PROVIDER -- quotes source: `yahoo` (default), `synthetic` or `replay`, see `quote_providers.py`
+    - RAW_QUOTES_BLOB_NAME -- name of the stored OHLCV history the quotes are updated from incrementally,
+      defaults to QUOTES_BLOB_NAME with a `-raw` suffix, e.g. `capital-markets-quotes-raw.csv`
+    - QUOTES_OVERLAP_DAYS -- stored trading days fetched again to detect dividend and split adjustments, defaults to 5
+    - QUOTES_FULL_REFRESH -- `true` to download the whole history from `startDate`, defaults to `false`
+    - STORE_FORMAT -- comma-separated output formats: `csv` (default, one file per dataset) and/or `parquet`
+      (a date-partitioned dataset next to the CSV file, named like it without the extension),
+      see `partitioned_store.py` for STORE_PARTITIONING, STORE_CODEC, STORE_ROW_GROUP_SIZE
+    - FETCH_REPORT_BLOB_NAME -- name of the fetch report listing quarantined tickers, defaults to QUOTES_BLOB_NAME
+      with a `-fetch-report.json` suffix; see `batch_fetch.py` for batching, retry and rate limit settings
+    - QUALITY_REPORT_BLOB_NAME -- name of the data-quality report of the preprocessed quotes, defaults to
+      QUOTES_BLOB_NAME with a `-quality-report.json` suffix; see `data_quality.py` for the repair settings
+    - RETURNS_CUBE_BLOB_NAME -- name of the multi-horizon returns cube, defaults to RETURNS_BLOB_NAME with a
+      `-cube` suffix, e.g. `capital-markets-returns-cube.csv`; see `returns_cube.py`
+    - RETURNS_CUBE_FORMAT -- comma-separated formats of the cube: `parquet` (default, the date-partitioned
+      dataset `capital-markets-returns-cube` appended with the new rows) and/or `csv` (the whole cube
+      rewritten every run, ten times the size of the returns file)
+
+Every CSV dataset is uploaded with a `<name>-manifest.json` sidecar holding its schema version,
+first and last date, row count, columns and content hash, e.g. `capital-markets-returns-manifest.json`,
+so incremental steps can check what is stored without downloading it. CSV datasets are streamed
+to GCS in chunks, optionally gzip or zstd compressed, see `compressed_io.py` for UPLOAD_COMPRESSION,
+UPLOAD_CHUNK_CELLS and UPLOAD_BLOCK_SIZE. Keep RETURNS_BLOB_NAME uncompressed while the forecast DAG
+loads it with the Dataflow text template.
+
+Buckets are GCS buckets, or local directories under STORAGE_ROOT to run offline, see `object_store.py`.
+Datasets whose content did not change since the last upload are not uploaded again.
+
+The tickers come from UNIVERSE_FILE or settings.json; large universes are split into shards processed
+in parallel and merged into the same datasets, see `universe.py` and `sharding.py`. A shard run keeps
+every dataset under `shards/<shard>-of-<shards>/` in its bucket, as Parquet only.
+
+Runs are checkpointed per stage, so a retried run resumes after its last completed stage, see
+`checkpoints.py` for RUN_ID, CHECKPOINT_BUCKET_NAME and CHECKPOINTS.
+
+Every workflow run emits one record with its stage durations, rows, bytes read and written,
+provider calls and status, see `run_telemetry.py` for RUN_METRICS_FILE.
 """
 
 import datetime
+import hashlib
 import json
 import logging
 import os
 import sys
 
+import fsspec
+import numpy as np
 import pandas as pd
-import yfinance
-from google.cloud import storage
+
+import batch_fetch
+import checkpoints
+import compressed_io
+import data_quality
+import object_store
+import partitioned_store
+import quote_providers
+import returns_cube
+import run_telemetry
+import universe
 
 # Set logging
 logger = logging.getLogger("capital-markets-data")
@@ -27,15 +80,101 @@ logging.basicConfig(
     encoding="utf-8"
 )
 
+MANIFEST_SCHEMA_VERSION = 1
+
+
 class MarketData:
-    """ Parent class for initializing environment variables, GCS methods. """
+    """ Parent class for initializing environment variables, GCS methods.
+
+    The stages of a run share the tickers the run read once; without them, the universe or the
+    shard of this process is read from UNIVERSE_FILE or settings.json, see `universe.py`.
+    """
+
+    def __init__(self, tickers: list = None):
+        self.settings: dict = self.load_settings()
+        self.settings["tickers"] = tickers if tickers is not None else universe.tickers(self.settings["tickers"])
+        self.shard: int = universe.current_shard()
+        self.shards: int = universe.shard_count()
+        self.storeFormats: list = [name.strip() for name in os.environ.get("STORE_FORMAT", "csv").split(",")]
+        if self.shard is not None:
+            # shards hand their datasets over to the merge step, which writes the configured formats
+            self.storeFormats = ["parquet"]
+
+    @staticmethod
+    def load_settings() -> dict:
+        with open("settings.json", "r") as f:
+            return json.load(f)
+
+    def dataset_name(self, file_name: str) -> str:
+        """ Name of a dataset of this process, under the shard prefix when it runs a shard. """
+        return file_name if self.shard is None else universe.shard_name(file_name, self.shard, self.shards)
+
+    @staticmethod
+    def get_store(bucket: str, file_name: str) -> partitioned_store.PartitionedStore:
+        """ Partitioned Parquet dataset stored next to a CSV file, e.g. `gs://bucket/quotes` for `quotes.csv`. """
+        return partitioned_store.PartitionedStore(object_store.bucket(bucket).url(os.path.splitext(file_name)[0]))
+
+    def save(self, bucket: str, file_name: str, data: pd.DataFrame, newRows: pd.DataFrame = None,
+             formats: list = None) -> None:
+        """ Write a dataset in every configured format.
 
-    def __init__(self):
-        self.settings: dict = json.load(open("settings.json", "r"))
+        Args:
+            bucket (str): bucket name to upload the dataset to
+            file_name (str): CSV file name; the Parquet dataset is named like it without the extension
+            data (pd.DataFrame): the whole dataset
+            newRows (pd.DataFrame, optional): rows added or changed since the last run; when given, only
+                the Parquet partitions holding them are rewritten.
+            formats (list, optional): formats of this dataset, defaults to STORE_FORMAT.
+        """
+        formats = formats or self.storeFormats
+        if "csv" in formats:
+            self.upload_to_gcs(bucket=bucket, file_name=file_name, data=data)
+        if "parquet" in formats:
+            store = self.get_store(bucket, file_name)
+            if newRows is not None:
+                if newRows.shape[0] > 0:
+                    store.append(newRows)
+            elif data.shape[0] > 0:
+                store.write(data)
+            run_telemetry.add(bytesWritten=store.bytesWritten, bytesRead=store.bytesRead)
+
+    @staticmethod
+    def manifest_name(file_name: str) -> str:
+        """ Name of the manifest sidecar of a dataset, e.g. `returns-manifest.json` for `returns.csv`. """
+        return f"{os.path.splitext(file_name)[0]}-manifest.json"
+
+    @staticmethod
+    def data_hash(data: pd.DataFrame, codec: str) -> str:
+        """ Hash of the values, index, columns and compression of a dataset, cheap enough to compute
+        before every upload without encoding the CSV. """
+        digest = hashlib.sha256(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+        digest.update(json.dumps([str(column) for column in data.columns] + [codec]).encode("utf-8"))
+        return f"sha256:{digest.hexdigest()}"
+
+    @staticmethod
+    def describe(data: pd.DataFrame, writer: compressed_io.CsvStreamWriter, dataHash: str) -> dict:
+        """ Manifest of a dataset uploaded by `writer`. """
+        return {
+            "schemaVersion": MANIFEST_SCHEMA_VERSION,
+            "firstDate": pd.Timestamp(data.index[0]).strftime("%Y-%m-%d"),
+            "lastDate": pd.Timestamp(data.index[-1]).strftime("%Y-%m-%d"),
+            "rows": int(data.shape[0]),
+            "columnLevels": data.columns.nlevels,
+            "columns": [list(column) if isinstance(column, tuple) else column for column in data.columns],
+            "contentHash": writer.contentHash,
+            "dataHash": dataHash,
+            "compression": writer.codec,
+            "bytes": writer.bytesWritten,
+            "uncompressedBytes": writer.rawBytes,
+            "updatedAt": datetime.datetime.utcnow().isoformat(),
+        }
 
     @staticmethod
     def upload_to_gcs(bucket: str, file_name: str, data: pd.DataFrame) -> None:
-        """ Upload data to GCS.
+        """ Stream data to GCS as CSV, compressed with UPLOAD_COMPRESSION, together with its manifest.
+
+        Nothing is uploaded when the stored object and its manifest hold the same data; an upload
+        interrupted before its manifest was written is repeated.
 
         Args:
             bucket (str): bucket name to upload an object to
@@ -43,61 +182,273 @@ class MarketData:
             data (pd.DataFrame): dataframe to be uploaded.
         """
         if data.shape[0] > 0:
-            logger.info(f"Uploading {file_name} to GCS bucket {bucket}.")
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket)
-            bucket.blob(file_name).upload_from_string(data.to_csv(), 'text/csv')
+            writer = compressed_io.CsvStreamWriter()
+            dataHash = MarketData.data_hash(data, writer.codec)
+            manifest = MarketData.load_json_from_gcs(bucket, MarketData.manifest_name(file_name))
+            logger.info(f"Uploading {file_name} to bucket {bucket} ({writer.codec}).")
+            uploaded = object_store.bucket(bucket).put_stream(
+                file_name,
+                lambda f: writer.write(data, f),
+                contentType=writer.contentType,
+                contentHash=dataHash,
+                force=manifest is None or manifest.get("dataHash") != dataHash,
+                block_size=compressed_io.upload_block_size()
+            )
+            if not uploaded:
+                return
+            run_telemetry.add(bytesWritten=writer.bytesWritten)
+            MarketData.upload_json_to_gcs(
+                bucket=bucket,
+                file_name=MarketData.manifest_name(file_name),
+                data=MarketData.describe(data, writer, dataHash)
+            )
         else:
             logger.info("Skip uploading an empty dataframe.")
 
     @staticmethod
-    def load_from_gcs(bucket: str, file_name: str) -> pd.DataFrame:
-        """ Download data from GCS.
+    def upload_json_to_gcs(bucket: str, file_name: str, data: dict) -> None:
+        """ Upload JSON serializable data to GCS.
+
+        Args:
+            bucket (str): bucket name to upload an object to
+            file_name (str): file name to be stored on the bucket
+            data (dict): data to be uploaded.
+        """
+        logger.info(f"Uploading {file_name} to bucket {bucket}.")
+        body = json.dumps(data).encode("utf-8")
+        if object_store.bucket(bucket).put(file_name, body, 'application/json'):
+            run_telemetry.add(bytesWritten=len(body))
+
+    @staticmethod
+    def load_json_from_gcs(bucket: str, file_name: str) -> dict:
+        """ Download a JSON object from GCS, None if it does not exist. """
+        body = object_store.bucket(bucket).read_bytes(file_name)
+        if body is None:
+            return None
+        run_telemetry.add(bytesRead=len(body))
+        return json.loads(body)
+
+    def load_manifest(self, bucket: str, file_name: str) -> dict:
+        """ Manifest of a dataset: the CSV sidecar, or the Parquet dataset manifest without CSV output.
+
+        Returns:
+            dict: manifest with at least `lastDate` and `rows`; None if the dataset has no manifest.
+        """
+        if "csv" not in self.storeFormats:
+            return self.get_store(bucket, file_name).manifest()
+        manifest = self.load_json_from_gcs(bucket, self.manifest_name(file_name))
+        if manifest is not None and manifest.get("schemaVersion") != MANIFEST_SCHEMA_VERSION:
+            logger.info(f"Ignoring {self.manifest_name(file_name)} of schema version {manifest.get('schemaVersion')}.")
+            return None
+        return manifest
+
+    @staticmethod
+    def load_from_gcs(bucket: str, file_name: str, **kwargs) -> pd.DataFrame:
+        """ Download data from GCS, plain or compressed.
 
         Args:
             bucket (str): bucket name in GCS to load an object from
             fileName (str): file name to load from GCS
+            kwargs: extra `pd.read_csv` arguments, e.g. `header=[0, 1]` for (field, ticker) columns.
 
         Returns:
             pd.DataFrame: data loaded from GCS to dataframe.
         """
         logger.info(f"Dowloading {file_name} from GCS bucket {bucket}.")
-        data_path = "".join(["gs://", os.path.join(bucket, file_name)])
+        path = object_store.bucket(bucket).url(file_name)
         try:
-            data = pd.read_csv(data_path, index_col=0)
+            data = compressed_io.read_csv(path, index_col=0, **kwargs)
         except FileNotFoundError:
-            data = None
+            return None
+        if run_telemetry.active() is not None:
+            source = fsspec.open(path)
+            run_telemetry.add(bytesRead=source.fs.size(source.path))
         return data
 
 
 class MarketQuotes(MarketData):
-    """ Class for getting capital markets quotes from external source to GCS. """
+    """ Class for getting capital markets quotes from external source to GCS.
+
+    The raw OHLCV history is stored next to the preprocessed quotes, so every run fetches only
+    the days after the last stored date (plus a short overlap) and merges them into the history.
+    The whole history is downloaded again when there is nothing stored, the tickers or the start
+    date changed, or the fetched days leave a gap after the stored ones. Tickers whose past prices
+    the overlap shows adjusted for dividends or splits get their own history downloaded again.
+    """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, tickers: list = None):
+        super().__init__(tickers)
         self.quotes: pd.DataFrame = None
+        self.rawQuotes: pd.DataFrame = None
+        self.storedQuotes: pd.DataFrame = None
+        self.fetchedQuotes: pd.DataFrame = None
+        self.fullRefresh: bool = None
+        self.removedTickers: list = []
+        self.backfillTickers: list = []
+        self.adjustedTickers: list = []
+        self.provider: quote_providers.QuoteProvider = quote_providers.get_provider()
+        self.fetcher: batch_fetch.BatchFetcher = batch_fetch.BatchFetcher(self.provider)
+        self.quality: data_quality.DataQuality = data_quality.DataQuality()
         self.quotesBucket: str = os.environ["QUOTES_BUCKET_NAME"]
-        self.quotesFileName: str = os.environ["QUOTES_BLOB_NAME"]
+        quotesFileName = os.environ["QUOTES_BLOB_NAME"]
+        stem, extension = os.path.splitext(quotesFileName)
+        self.quotesFileName: str = self.dataset_name(quotesFileName)
+        self.rawQuotesFileName: str = self.dataset_name(
+            os.environ.get("RAW_QUOTES_BLOB_NAME", f"{stem}-raw{extension or '.csv'}"))
+        self.fetchReportFileName: str = self.dataset_name(
+            os.environ.get("FETCH_REPORT_BLOB_NAME", f"{stem}-fetch-report.json"))
+        self.qualityReportFileName: str = self.dataset_name(
+            os.environ.get("QUALITY_REPORT_BLOB_NAME", f"{stem}-quality-report.json"))
+        self.overlapDays: int = int(os.environ.get("QUOTES_OVERLAP_DAYS", 5))
+        self.forceFullRefresh: bool = os.environ.get("QUOTES_FULL_REFRESH", "false").lower() == "true"
+
+    def load_stored(self) -> pd.DataFrame:
+        """ Load the stored raw OHLCV history with (field, ticker) columns, None if there is none.
+
+        Tickers removed from the settings are dropped, so they are not carried into later runs.
+        """
+        if "parquet" in self.storeFormats:
+            store = self.get_store(self.quotesBucket, self.rawQuotesFileName)
+            stored = store.read()
+            run_telemetry.add(bytesRead=store.bytesRead)
+        else:
+            stored = super().load_from_gcs(self.quotesBucket, self.rawQuotesFileName, header=[0, 1], parse_dates=True)
+        if stored is None or stored.shape[0] == 0:
+            return None
+        stored.index = pd.DatetimeIndex(stored.index, name="Date")
+        kept = stored.columns.get_level_values(1).isin(self.settings["tickers"])
+        if not kept.all():
+            self.removedTickers = sorted(set(stored.columns.get_level_values(1)[~kept]))
+            logger.info(f"Dropping removed tickers {self.removedTickers} from the stored quotes.")
+            stored = stored.loc[:, kept]
+        return stored.sort_index()
+
+    def incremental_start(self, stored: pd.DataFrame):
+        """ First date to fetch incrementally, None when the whole history has to be downloaded. """
+        if self.forceFullRefresh:
+            logger.info("Full refresh of quotes is forced.")
+            return None
+        if stored is None:
+            logger.info("No stored quotes, downloading the whole history.")
+            return None
+        # tickers quarantined by the last run are backfilled on their own
+        missing = set(self.settings["tickers"]) - set(stored.columns.get_level_values(1)) - set(self.backfillTickers)
+        if missing:
+            logger.info(f"New tickers {sorted(missing)}, downloading the whole history.")
+            return None
+        if stored.index[0] > pd.Timestamp(self.settings["startDate"]) + pd.Timedelta(days=7):
+            logger.info(f"Start date moved before {stored.index[0].date()}, downloading the whole history.")
+            return None
+        return stored.index[max(stored.shape[0] - self.overlapDays, 0)]
+
+    def last_quarantined(self) -> list:
+        """ Tickers quarantined by the last run, listed in its stored fetch report. """
+        report = self.load_json_from_gcs(self.quotesBucket, self.fetchReportFileName)
+        quarantined = report.get("quarantined", {}) if report is not None else {}
+        return [ticker for ticker in self.settings["tickers"] if ticker in quarantined]
+
+    def backfill(self, fetched: pd.DataFrame, tickers: list) -> pd.DataFrame:
+        """ Add the whole history of some tickers to an incremental fetch, replacing their stored history.
+
+        Used for the tickers quarantined by the last run and those whose past prices were adjusted.
+        Tickers failing are quarantined and backfilled by the next run.
+        """
+        logger.info(f"Downloading the whole history of {tickers}.")
+        try:
+            history = self.fetcher.download(tickers=tickers, start=self.settings["startDate"])
+        except RuntimeError as e:
+            logger.warning(f"Backfill failed: {e}")
+            return fetched
+        return fetched.combine_first(history)
+
+    @staticmethod
+    def gap(stored: pd.DataFrame, fetched: pd.DataFrame) -> bool:
+        """ Whether the fetched days start after the last stored one, so days in between are missing. """
+        return len(fetched.index) > 0 and fetched.index[0] > stored.index[-1]
+
+    @staticmethod
+    def adjusted(stored: pd.DataFrame, fetched: pd.DataFrame) -> list:
+        """ Tickers whose past adjusted prices differ in the overlap, e.g. after a dividend or a split.
+
+        Prices missing on either side, e.g. of a quarantined ticker, are not compared.
+        """
+        dates = stored.index.intersection(fetched.index)[:-1]  # the last stored day may have been incomplete
+        if len(dates) == 0:
+            return []
+        tickers = stored["Adj Close"].columns.intersection(fetched["Adj Close"].columns)
+        before = stored["Adj Close"].loc[dates, tickers].to_numpy(dtype=float)
+        after = fetched["Adj Close"].loc[dates, tickers].to_numpy(dtype=float)
+        changed = ~np.isclose(before, after, rtol=1e-6) & ~np.isnan(before) & ~np.isnan(after)
+        return list(tickers[changed.any(axis=0)])
+
+    @staticmethod
+    def merge(stored: pd.DataFrame, fetched: pd.DataFrame) -> pd.DataFrame:
+        """ Replace the overlap of the stored history with the fetched window.
+
+        Stored prices are kept where the fetched window has none, e.g. for quarantined tickers.
+        """
+        if fetched.shape[0] == 0:
+            return stored
+        window = fetched.combine_first(stored.loc[stored.index >= fetched.index[0]])
+        merged = pd.concat([stored.loc[stored.index < fetched.index[0]], window])
+        return merged.reindex(sorted(merged.columns), axis=1)
 
     def fetch(self) -> pd.DataFrame:
-        """ Fetch and process quotes from YahooFinance.
+        """ Fetch quotes from the market data provider, YahooFinance by default.
+
+        Only the days missing from the stored history are fetched when possible, plus the whole
+        history of the tickers whose past prices were adjusted. Tickers are downloaded in concurrent
+        batches; those that keep failing are quarantined, see `batch_fetch.py`, and their whole
+        history is fetched again by the next incremental run.
 
         Returns:
             pd.DataFrame: historical quotes for select tickers.
         """
-        logger.info(f"Fetching YahooFinance quotes from {self.settings['startDate']}.")
-        self.quotes = yfinance.download(
-            tickers=self.settings["tickers"],
-            start=self.settings["startDate"],
-            progress=False
-        )
+        self.storedQuotes = self.load_stored()
+        self.backfillTickers = self.last_quarantined() if self.storedQuotes is not None else []
+        start = self.incremental_start(self.storedQuotes)
+        self.fullRefresh = start is None
+        if start is not None:
+            logger.info(f"Fetching {self.provider.name} quotes from {start.date()}.")
+            self.fetchedQuotes = self.fetcher.download(tickers=self.settings["tickers"], start=start)
+            if self.gap(self.storedQuotes, self.fetchedQuotes):
+                logger.info("Fetched quotes leave a gap after the stored ones, downloading the whole history.")
+                self.fullRefresh = True
+            else:
+                self.adjustedTickers = self.adjusted(self.storedQuotes, self.fetchedQuotes)
+                if self.adjustedTickers:
+                    logger.info(f"Stored prices of {self.adjustedTickers} were adjusted.")
+                refreshed = self.backfillTickers + [
+                    ticker for ticker in self.adjustedTickers if ticker not in self.backfillTickers
+                ]
+                if refreshed:
+                    self.fetchedQuotes = self.backfill(self.fetchedQuotes, refreshed)
+                self.quotes = self.merge(self.storedQuotes, self.fetchedQuotes)
+        if self.fullRefresh:
+            logger.info(f"Fetching {self.provider.name} quotes from {self.settings['startDate']}.")
+            self.fetchedQuotes = self.fetcher.download(
+                tickers=self.settings["tickers"],
+                start=self.settings["startDate"]
+            )
+            self.quotes = self.fetchedQuotes
+        logger.info(f"Fetched {self.fetchedQuotes.shape[0]} days of quotes, {self.quotes.shape[0]} days in total.")
+        self.rawQuotes = self.quotes
         return self.quotes
 
+    def changed_rows(self, data: pd.DataFrame) -> pd.DataFrame:
+        """ Rows of `data` changed by an incremental run, None after a full refresh or when tickers
+        were removed, so the Parquet datasets are rewritten without them. """
+        if self.fullRefresh or self.removedTickers:
+            return None
+        if self.fetchedQuotes.shape[0] == 0:
+            return data.iloc[0:0]
+        return data.loc[data.index >= self.fetchedQuotes.index[0]]
+
     def preprocess(self) -> pd.DataFrame:
         """ Preprocess raw data, sort columns, handle missing values.
 
-        Args:
-            data (pd.DataFrame): Raw data from YahooFinance.
+        Missing days of a ticker no longer drop the day for every ticker: each ticker keeps its own
+        listing window and short gaps are filled, see `data_quality.py`.
 
         Returns:
             pd.DataFrame: Clean, structured data.
@@ -105,7 +456,7 @@ class MarketQuotes(MarketData):
         logger.info("Preprocessing quotes.")
         self.quotes = self.quotes.loc[:, "Adj Close"]
         self.quotes = self.quotes.reindex(sorted(self.quotes.columns), axis=1)
-        self.quotes.dropna(how="any", axis=0, inplace=True)
+        self.quotes = self.quality.repair(self.quotes)
         return self.quotes
 
     def fit(self) -> pd.DataFrame:
@@ -115,24 +466,109 @@ class MarketQuotes(MarketData):
             pd.DataFrame: Clean, structured quotes for select tickers.
         """
         logger.info("Start MarketQuotes pipeline.")
-        self.fetch()
-        self.preprocess()
-        super().upload_to_gcs(
-            bucket=self.quotesBucket,
-            file_name=self.quotesFileName,
-            data=self.quotes
-        )
+        with run_telemetry.stage("fetch"):
+            self.fetch()
+            fetchReport = self.fetcher.report()
+            run_telemetry.add(
+                rowsIn=self.storedQuotes.shape[0] if self.storedQuotes is not None else 0,
+                rowsFetched=self.fetchedQuotes.shape[0],
+                rowsOut=self.quotes.shape[0],
+                providerCalls=fetchReport["calls"],
+                retries=fetchReport["retries"],
+                quarantinedTickers=len(fetchReport["quarantined"])
+            )
+            if fetchReport["quarantined"]:
+                run_telemetry.partial(f"{len(fetchReport['quarantined'])} tickers quarantined")
+            super().upload_json_to_gcs(
+                bucket=self.quotesBucket,
+                file_name=self.fetchReportFileName,
+                data={
+                    "generatedAt": datetime.datetime.utcnow().isoformat(),
+                    "fullRefresh": self.fullRefresh,
+                    "removedTickers": self.removedTickers,
+                    "adjustedTickers": self.adjustedTickers,
+                    "fetchedFrom": self.fetchedQuotes.index[0].strftime("%Y-%m-%d")
+                    if self.fetchedQuotes.shape[0] > 0 else None,
+                    **fetchReport
+                }
+            )
+        with run_telemetry.stage("preprocess"):
+            rowsIn = self.quotes.shape[0]
+            self.preprocess()
+            qualityReport = self.quality.report()
+            run_telemetry.add(rowsIn=rowsIn, rowsOut=self.quotes.shape[0], filledPrices=qualityReport["filledPrices"],
+                              spikes=qualityReport["spikes"], jumps=qualityReport["jumps"])
+            super().upload_json_to_gcs(
+                bucket=self.quotesBucket,
+                file_name=self.qualityReportFileName,
+                data={"generatedAt": datetime.datetime.utcnow().isoformat(), **qualityReport}
+            )
+        with run_telemetry.stage("upload-quotes"):
+            self.save(
+                bucket=self.quotesBucket,
+                file_name=self.quotesFileName,
+                data=self.quotes,
+                newRows=self.changed_rows(self.quotes)
+            )
+            self.save(
+                bucket=self.quotesBucket,
+                file_name=self.rawQuotesFileName,
+                data=self.rawQuotes,
+                newRows=self.changed_rows(self.rawQuotes)
+            )
+        return self.quotes
+
+    def restore(self, rawQuotes: dict) -> pd.DataFrame:
+        """ Quotes of a completed run, preprocessed again from the stored raw history.
+
+        Args:
+            rawQuotes (dict): fingerprint of the raw history stored by the run, see `checkpoints.fingerprint`.
+
+        Returns:
+            pd.DataFrame: clean quotes; None when the stored history changed since, and quotes have to be fetched.
+        """
+        self.storedQuotes = self.load_stored()
+        if self.storedQuotes is None or checkpoints.fingerprint(self.storedQuotes) != rawQuotes:
+            logger.info("Stored quotes changed since they were checkpointed, fetching them again.")
+            return None
+        logger.info("Restoring checkpointed quotes.")
+        self.quotes = self.rawQuotes = self.storedQuotes
+        with run_telemetry.stage("preprocess"):
+            self.preprocess()
         return self.quotes
 
 
 class MarketReturns(MarketData):
-    """ Class for calculating periodic returns from historical market quotes. """
-    def __init__(self, quotes):
-        super().__init__()
+    """ Class for calculating periodic returns from historical market quotes.
+
+    Returns of every horizon in `returns_cube.HORIZONS` are computed in one pass and stored as a
+    cube next to the returns file, so consumers read any horizon without recomputing it from quotes.
+    The cube is a Parquet dataset by default, so a run only appends its new rows.
+    """
+    def __init__(self, quotes, tickers: list = None):
+        super().__init__(tickers)
         self.returns: pd.DataFrame = None
-        self.remoteReturns: pd.DataFrame = None
+        self.cube: pd.DataFrame = None
+        self.remoteLastDate: pd.Timestamp = None
         self.returnsBucket: str = os.environ["RETURNS_BUCKET_NAME"]
-        self.returnsFileName: str = os.environ["RETURNS_BLOB_NAME"]
+        returnsFileName = os.environ["RETURNS_BLOB_NAME"]
+        returnsName, extension = os.path.splitext(returnsFileName)
+        self.returnsFileName: str = self.dataset_name(returnsFileName)
+        self.cubeFileName: str = self.dataset_name(
+            os.environ.get("RETURNS_CUBE_BLOB_NAME", f"{returnsName}-cube{extension}"))
+        self.cubeFormats: list = [name.strip() for name in os.environ.get("RETURNS_CUBE_FORMAT", "parquet").split(",")]
+
+    def get_cube(self, quotes: pd.DataFrame) -> pd.DataFrame:
+        """ Calculate simple and log returns of every horizon from quotes.
+
+        Args:
+            quotes (pd.DataFrame): most recent capital markets quotes
+        Returns:
+            pd.DataFrame: returns with (`<kind>_<horizon>`, ticker) columns.
+        """
+        logger.info(f"Calculating returns over {', '.join(map(str, returns_cube.HORIZONS))} days.")
+        self.cube = returns_cube.compute(quotes)
+        return self.cube
 
     def get_returns(self, quotes: pd.DataFrame, periods: int = 20) -> pd.DataFrame:
         """ Calculate returns from quotes.
@@ -144,21 +580,51 @@ class MarketReturns(MarketData):
             pd.DataFrame: MA(period) returns from fetched quotes.
         """
         logger.info(f"Calculating MA({periods}) returns from the most recent quotes.")
-        self.returns = quotes.pct_change(periods=periods).dropna(how='all')
+        if periods not in returns_cube.HORIZONS:
+            self.returns = quotes.pct_change(periods=periods).dropna(how='all')
+            return self.returns
+        if self.cube is None:
+            self.get_cube(quotes)
+        self.returns = returns_cube.select(self.cube, periods)
         return self.returns
 
+    def remote_last_date(self) -> pd.Timestamp:
+        """ Last date of the returns in GCS, read from the manifest rather than the data.
+
+        Returns files uploaded before manifests existed are downloaded once instead.
+        """
+        manifest = self.load_manifest(self.returnsBucket, self.returnsFileName)
+        if manifest is not None:
+            return pd.Timestamp(manifest["lastDate"]) if manifest["lastDate"] else None
+        if "csv" not in self.storeFormats:
+            return None
+        logger.info(f"No manifest of {self.returnsFileName}, loading the remote returns.")
+        remoteReturns = super().load_from_gcs(self.returnsBucket, self.returnsFileName)
+        if remoteReturns is None or remoteReturns.shape[0] == 0:
+            return None
+        return pd.Timestamp(remoteReturns.index[-1])
+
+    def new_cube_rows(self) -> pd.DataFrame:
+        """ Cube rows after the last date of the stored Parquet cube, None if it is not stored yet
+        or holds tickers removed since. """
+        manifest = self.get_store(self.returnsBucket, self.cubeFileName).manifest() \
+            if "parquet" in self.cubeFormats else None
+        if manifest is None or not manifest["lastDate"]:
+            return None
+        if set(manifest["columns"]) - set(partitioned_store.PartitionedStore.flatten(self.cube.iloc[0:0]).columns):
+            logger.info(f"{self.cubeFileName} holds removed tickers, rewriting it.")
+            return None
+        return self.cube.loc[pd.DatetimeIndex(self.cube.index) > pd.Timestamp(manifest["lastDate"])]
+
     def compare(self) -> pd.DataFrame:
-        """ Compare calculated market returns with one from GCS bucket
+        """ Compare calculated market returns with the last date in GCS.
 
         Returns:
             Difference of several rows to be uploaded (pd.DataFrame)
         """
-        logger.info("Comparing remote returns from GCS to most recent returns.")
-        if isinstance(self.remoteReturns, pd.DataFrame):
-            remote_date = self.remoteReturns.index[-1]
-            logger.info(f"Comparing calculated returns data with one from GCS bucket")
-            self.returns = self.returns.loc[remote_date:, :]
-            self.returns.drop(self.returns.index[0], axis=0, inplace=True)
+        if self.remoteLastDate is not None:
+            logger.info(f"Keeping returns after {self.remoteLastDate.date()}, the last date in GCS.")
+            self.returns = self.returns.loc[pd.DatetimeIndex(self.returns.index) > self.remoteLastDate]
         return self.returns
 
     def fit(self, quotes: pd.DataFrame):
@@ -171,20 +637,156 @@ class MarketReturns(MarketData):
             Updated batch of returns.
         """
         logger.info("Start MarketReturns pipeline.")
-        self.remoteReturns = super().load_from_gcs(self.returnsBucket, self.returnsFileName)
-        self.get_returns(quotes)
-        self.compare()
-        super().upload_to_gcs(
-            bucket=self.returnsBucket,
-            file_name=self.returnsFileName,
-            data=self.returns
-        )
+        with run_telemetry.stage("returns"):
+            self.get_cube(quotes)
+            self.get_returns(quotes)
+            run_telemetry.add(rowsIn=quotes.shape[0], rowsOut=self.cube.shape[0])
+        with run_telemetry.stage("compare"):
+            self.remoteLastDate = self.remote_last_date()
+            self.compare()
+            run_telemetry.add(rowsOut=self.returns.shape[0])
+        with run_telemetry.stage("upload-returns"):
+            # the CSV file holds the new rows for BigQuery, the Parquet dataset the whole history
+            self.save(
+                bucket=self.returnsBucket,
+                file_name=self.returnsFileName,
+                data=self.returns,
+                newRows=self.returns
+            )
+            self.save(
+                bucket=self.returnsBucket,
+                file_name=self.cubeFileName,
+                data=self.cube,
+                newRows=self.new_cube_rows(),
+                formats=self.cubeFormats
+            )
         return self.returns
 
 
-def workflow():
-    quotes = MarketQuotes().fit()
-    returns = MarketReturns().fit(quotes)
+class MarketStatistics(MarketData):
+    """ Class for precomputing per-ticker statistics served by the recommendation engine. """
+    def __init__(self, tickers: list = None):
+        super().__init__(tickers)
+        self.statistics: dict = None
+        self.statisticsBucket: str = os.environ.get("STATISTICS_BUCKET_NAME", os.environ["QUOTES_BUCKET_NAME"])
+        self.statisticsFileName: str = self.dataset_name(
+            os.environ.get("STATISTICS_BLOB_NAME", "capital-markets-statistics.json"))
+
+    @staticmethod
+    def to_timestamps(index: pd.DatetimeIndex) -> np.ndarray:
+        """ Convert dates into milliseconds since epoch, the format of `Series.to_json()`. """
+        return ((index - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).to_numpy()
+
+    def get_statistics(self, rawQuotes: pd.DataFrame, historyMonths: int = 5) -> dict:
+        """ Calculate day, year and history statistics for every ticker at once.
+
+        Prices are adjusted for dividends and splits like the `yfinance.Ticker.history` quotes of the
+        live statistics routes, so the snapshot serves the same prices.
+
+        Args:
+            rawQuotes (pd.DataFrame): OHLCV quotes from YahooFinance with (field, ticker) columns.
+            historyMonths (int): length of the open price history. Defaults to 5.
+
+        Returns:
+            dict: statistics keyed by ticker.
+        """
+        logger.info("Calculating asset statistics snapshot.")
+        rawQuotes = quote_providers.adjust(rawQuotes)
+        close = rawQuotes["Close"]
+        tickers = close.columns
+        values = close.to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        # position of every valid price counted from the end of its column: 1 is the last one
+        fromEnd = np.cumsum(valid[::-1], axis=0)[::-1]
+        lastRow = np.argmax(valid & (fromEnd == 1), axis=0)
+        columns = np.arange(len(tickers))
+        currentPrice = np.where(valid & (fromEnd == 1), values, 0.0).sum(axis=0)
+        previousClose = np.where(valid & (fromEnd == 2), values, 0.0).sum(axis=0)
+        dayLow = rawQuotes["Low"].loc[:, tickers].to_numpy(dtype=float)[lastRow, columns]
+        dayHigh = rawQuotes["High"].loc[:, tickers].to_numpy(dtype=float)[lastRow, columns]
+        volume = rawQuotes["Volume"].loc[:, tickers].to_numpy(dtype=float)[lastRow, columns]
+
+        lastDate = close.index[-1]
+        yearWindow = close.index >= lastDate - pd.DateOffset(years=1)
+        yearLow = rawQuotes["Low"].loc[yearWindow, tickers].min()
+        yearHigh = rawQuotes["High"].loc[yearWindow, tickers].max()
+        opens = rawQuotes["Open"].loc[close.index >= lastDate - pd.DateOffset(months=historyMonths), tickers]
+        timestamps = self.to_timestamps(opens.index)
+        timestamp = int(self.to_timestamps(close.index[-1:])[0] // 1000)
+
+        self.statistics = {}
+        for i, ticker in enumerate(tickers):
+            if valid[:, i].sum() < 2:
+                logger.warning(f"Not enough quotes to calculate statistics for {ticker}.")
+                continue
+            history = opens[ticker].to_numpy(dtype=float)
+            known = ~np.isnan(history)
+            self.statistics[ticker] = {
+                "previous_close": float(previousClose[i]),
+                "current_price": float(currentPrice[i]),
+                "change_for_day": float(currentPrice[i] * 100.0 / previousClose[i] - 100.0),
+                "change_for_day_sum": float(currentPrice[i] - previousClose[i]),
+                "volume": None if np.isnan(volume[i]) else float(volume[i]),
+                "day_range_low": None if np.isnan(dayLow[i]) else float(dayLow[i]),
+                "day_range_high": None if np.isnan(dayHigh[i]) else float(dayHigh[i]),
+                "year_range_low": float(yearLow[ticker]),
+                "year_range_high": float(yearHigh[ticker]),
+                "timestamp": timestamp,
+                "history": dict(zip(map(str, timestamps[known].tolist()), history[known].tolist())),
+            }
+        return self.statistics
+
+    def fit(self, rawQuotes: pd.DataFrame) -> dict:
+        """ Calculate the statistics snapshot and upload it to GCS.
+
+        Args:
+            rawQuotes (pd.DataFrame): OHLCV quotes from YahooFinance with (field, ticker) columns.
+
+        Returns:
+            dict: statistics keyed by ticker.
+        """
+        logger.info("Start MarketStatistics pipeline.")
+        with run_telemetry.stage("statistics"):
+            self.get_statistics(rawQuotes)
+            run_telemetry.add(rowsIn=rawQuotes.shape[0], rowsOut=len(self.statistics))
+            super().upload_json_to_gcs(
+                bucket=self.statisticsBucket,
+                file_name=self.statisticsFileName,
+                data={"generatedAt": datetime.datetime.utcnow().isoformat(), "statistics": self.statistics}
+            )
+        return self.statistics
+
+
+def workflow(runId: str = None) -> pd.DataFrame:
+    """ Fetch quotes, update the statistics snapshot and the returns.
+
+    Stages completed by an earlier attempt of the same run are not run again, see `checkpoints.py`.
+
+    Args:
+        runId (str, optional): ID of the run, defaults to RUN_ID or the UTC date.
+
+    Returns:
+        pd.DataFrame: returns added since the last run, empty when the run had already completed.
+    """
+    with run_telemetry.RunTelemetry("capital-markets-returns"):
+        checkpoint = checkpoints.Checkpoint("capital-markets-returns", runId)
+        if checkpoint.completed("returns") is not None:
+            logger.info(f"Run {checkpoint.runId} already completed.")
+            return pd.DataFrame()
+        marketQuotes = MarketQuotes()
+        tickers = marketQuotes.settings["tickers"]
+        stage = checkpoint.completed("quotes")
+        quotes = marketQuotes.restore(stage["outputs"]["rawQuotes"]) if stage is not None else None
+        if quotes is None:
+            quotes = marketQuotes.fit()
+            checkpoint.complete("quotes", rawQuotes=checkpoints.fingerprint(marketQuotes.rawQuotes))
+        inputs = checkpoints.fingerprint(quotes)
+        if checkpoint.completed("statistics", inputs) is None:
+            MarketStatistics(tickers).fit(marketQuotes.rawQuotes)
+            checkpoint.complete("statistics", inputs)
+        returns = MarketReturns(quotes, tickers).fit(quotes)
+        checkpoint.complete("returns", inputs, returns=checkpoints.fingerprint(returns))
+        return returns
 
 
 if __name__ == '__main__':
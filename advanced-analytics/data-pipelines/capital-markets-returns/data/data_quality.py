@@ -0,0 +1,203 @@
+""" Vectorized validation and repair of quotes.
+
+Rows are no longer dropped for the whole universe when one ticker misses a day. Every step works
+on the whole (dates x tickers) array at once, in O(dates x tickers) time:
+    - non-positive and infinite prices are invalid and treated as missing
+    - every ticker has a listing window from its first to its last observed price; prices outside it
+      (before an IPO, after a delisting) stay missing
+    - gaps inside the window are forward-filled for at most QUALITY_MAX_FILL_DAYS days
+    - daily log returns are scored with robust z-scores, `(r - median) / (1.4826 * MAD)` per ticker,
+      the median and MAD taken over returns between observed prices only;
+      a price whose return and the next return both exceed QUALITY_ZSCORE in opposite directions and
+      mostly cancel out is a spike and is replaced by the previous price, other such returns are
+      reported as jumps and kept
+    - rows without any price are dropped
+
+Every run produces a report with the counts, the listing windows and the largest events.
+
+Optional environment variables:
+    - QUALITY_MAX_FILL_DAYS -- consecutive missing days filled with the last price, defaults to 5
+    - QUALITY_ZSCORE -- robust z-score above which a daily return is flagged, defaults to 10
+    - QUALITY_REPAIR_SPIKES -- `false` to only report spikes, defaults to `true`
+"""
+
+import json
+import logging
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("capital-markets-data")
+
+# scales the median absolute deviation to the standard deviation of normally distributed returns
+MAD_SCALE = 1.4826
+MAX_REPORTED_EVENTS = 1000
+
+
+def forward_fill(values: np.ndarray, limit: int) -> tuple:
+    """ Fill missing values with the last observed value of their column, at most `limit` rows ahead.
+
+    Returns:
+        tuple: filled values and the mask of filled cells.
+    """
+    rows = np.arange(values.shape[0], dtype=np.int32)[:, None]
+    observed = ~np.isnan(values)
+    last = np.maximum.accumulate(np.where(observed, rows, -1), axis=0)
+    fill = ~observed & (last >= 0) & (rows - last <= limit)
+    columns = np.broadcast_to(np.arange(values.shape[1], dtype=np.int32), values.shape)
+    filled = values.copy()
+    filled[fill] = values[last[fill], columns[fill]]
+    return filled, fill
+
+
+def robust_scale(returns: np.ndarray) -> tuple:
+    """ Median and `1.4826 * MAD` of every column, ignoring NaN; `returns` is overwritten. """
+    # tickers without returns have a NaN median, which is expected rather than worth a warning
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(returns, axis=0)
+        returns -= median
+        np.abs(returns, out=returns)
+        mad = np.nanmedian(returns, axis=0) * MAD_SCALE
+    return median, mad
+
+
+class DataQuality:
+    """ Validate and repair a (dates x tickers) frame of prices.
+
+    Public methods:
+        repair() -- clean prices without dropping rows for the whole universe.
+        report() -- counts, listing windows and events of the last repair.
+
+    Attributes:
+        maxFillDays -- consecutive missing days filled with the last price
+        zThreshold -- robust z-score above which a daily return is flagged
+        repairSpikes -- whether spikes are replaced by the previous price
+    """
+    def __init__(self, maxFillDays: int = None, zThreshold: float = None, repairSpikes: bool = None):
+        self.maxFillDays: int = maxFillDays if maxFillDays is not None \
+            else int(os.environ.get("QUALITY_MAX_FILL_DAYS", 5))
+        self.zThreshold: float = zThreshold or float(os.environ.get("QUALITY_ZSCORE", 10))
+        self.repairSpikes: bool = repairSpikes if repairSpikes is not None \
+            else os.environ.get("QUALITY_REPAIR_SPIKES", "true").lower() == "true"
+        self._report: dict = {}
+
+    def detect(self, prices: np.ndarray, observed: np.ndarray) -> tuple:
+        """ Spikes and jumps of forward-filled prices.
+
+        Returns:
+            tuple: masks of spike prices and of jump returns, and the robust z-scores of daily log returns.
+        """
+        returns = np.full(prices.shape, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.log(prices, out=returns)
+        returns[1:] -= returns[:-1].copy()
+        returns[0] = np.nan
+        # returns over filled prices are zeros that would understate the dispersion
+        scored = returns.copy()
+        scored[1:][~(observed[1:] & observed[:-1])] = np.nan
+        median, mad = robust_scale(scored)
+        del scored
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = (returns - median) / mad
+        scores[:, ~(mad > 0)] = 0.0
+        with np.errstate(invalid="ignore"):
+            flagged = np.abs(scores) > self.zThreshold
+        spikes = np.zeros(prices.shape, dtype=bool)
+        with np.errstate(invalid="ignore"):
+            spikes[:-1] = flagged[:-1] & flagged[1:] & (np.sign(returns[:-1]) == -np.sign(returns[1:])) \
+                & (np.abs(returns[:-1] + returns[1:]) < 0.5 * np.abs(returns[:-1]))
+        jumps = flagged & ~spikes
+        jumps[1:] &= ~spikes[:-1]
+        return spikes, jumps, scores
+
+    def repair(self, prices: pd.DataFrame) -> pd.DataFrame:
+        """ Clean prices.
+
+        Args:
+            prices (pd.DataFrame): prices, one column per ticker, sorted by date.
+
+        Returns:
+            pd.DataFrame: prices missing only outside listing windows and in gaps longer than
+                `maxFillDays`; tickers without any price and rows without any price are dropped.
+        """
+        values = prices.to_numpy(dtype=float, copy=True)
+        with np.errstate(invalid="ignore"):
+            invalid = ~np.isnan(values) & ~(np.isfinite(values) & (values > 0))
+        values[invalid] = np.nan
+        observed = ~np.isnan(values)
+        rows = np.arange(values.shape[0])[:, None]
+        listed = observed.any(axis=0)
+        first = np.where(listed, observed.argmax(axis=0), values.shape[0])
+        last = np.where(listed, values.shape[0] - 1 - observed[::-1].argmax(axis=0), -1)
+        window = (rows >= first) & (rows <= last)
+
+        filled, fill = forward_fill(values, self.maxFillDays)
+        spikes, jumps, scores = self.detect(filled, observed)
+        if self.repairSpikes and spikes.any():
+            values[spikes] = np.nan
+            filled, fill = forward_fill(values, self.maxFillDays)
+        filled[~window] = np.nan
+        fill &= window & ~spikes
+        missing = window & np.isnan(filled)
+
+        clean = pd.DataFrame(filled, index=prices.index, columns=prices.columns, copy=False)
+        clean = clean if listed.all() else clean.loc[:, listed]
+        clean = clean.dropna(how="all")
+        self._report = self._describe(prices, clean, first, last, listed, invalid, fill, missing, spikes, jumps, scores)
+        logger.info(
+            f"Data quality: kept {clean.shape[0]} of {prices.shape[0]} days, filled {int(fill.sum())} prices, "
+            f"{int(missing.sum())} missing, {int(spikes.sum())} spikes, {int(jumps.sum())} jumps."
+        )
+        return clean
+
+    def _describe(self, prices, clean, first, last, listed, invalid, fill, missing, spikes, jumps, scores) -> dict:
+        dates = pd.DatetimeIndex(prices.index)
+        days = len(dates)
+        tickers = pd.DataFrame({
+            "firstDate": dates[np.minimum(first, days - 1)].strftime("%Y-%m-%d") if days else [],
+            "lastDate": dates[np.maximum(last, 0)].strftime("%Y-%m-%d") if days else [],
+            "invalid": invalid.sum(axis=0),
+            "filled": fill.sum(axis=0),
+            "missing": missing.sum(axis=0),
+            "spikes": spikes.sum(axis=0),
+            "jumps": jumps.sum(axis=0),
+        }, index=prices.columns.astype(str))
+        # only tickers listed for part of the period or with any finding are reported one by one
+        notable = listed & ((first > 0) | (last < days - 1) | (invalid | fill | missing | spikes | jumps).any(axis=0))
+        events = spikes | jumps
+        positions = np.flatnonzero(events)
+        if positions.size > MAX_REPORTED_EVENTS:
+            magnitude = np.abs(scores.ravel()[positions])
+            positions = positions[np.argpartition(-magnitude, MAX_REPORTED_EVENTS)[:MAX_REPORTED_EVENTS]]
+        eventRows, eventColumns = np.unravel_index(positions, events.shape)
+        eventList = pd.DataFrame({
+            "date": dates[eventRows].strftime("%Y-%m-%d"),
+            "ticker": prices.columns[eventColumns].astype(str),
+            "type": np.where(spikes[eventRows, eventColumns], "spike", "jump"),
+            "zScore": np.round(scores[eventRows, eventColumns], 2),
+        }).sort_values(["date", "ticker"])
+        return {
+            "maxFillDays": self.maxFillDays,
+            "zThreshold": self.zThreshold,
+            "repairSpikes": self.repairSpikes,
+            "days": days,
+            "keptDays": int(clean.shape[0]),
+            "completeDays": int(clean.notna().all(axis=1).sum()),
+            "tickers": int(prices.shape[1]),
+            "emptyTickers": sorted(map(str, prices.columns[~listed])),
+            "invalidPrices": int(invalid.sum()),
+            "filledPrices": int(fill.sum()),
+            "missingPrices": int(missing.sum()),
+            "spikes": int(spikes.sum()),
+            "jumps": int(jumps.sum()),
+            # through JSON, so the report holds plain Python numbers
+            "listing": json.loads(tickers.loc[notable].to_json(orient="index")),
+            "events": json.loads(eventList.to_json(orient="records")),
+        }
+
+    def report(self) -> dict:
+        """ Counts, listing windows and events of the last repair. """
+        return dict(self._report)
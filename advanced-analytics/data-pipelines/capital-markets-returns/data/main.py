@@ -1,7 +1,11 @@
-from data_providers import (MarketQuotes, MarketReturns)
+from data_providers import workflow
 import logging
+import os
 import sys
 
+import sharding
+import universe
+
 
 logger = logging.getLogger("capital-markets-data")
 logging.basicConfig(
@@ -12,9 +16,12 @@ logging.basicConfig(
 )
 
 def capital_markets_returns(data, context):
-    """ Cloud Function for fetching quotes, calculating returns, updating data in the GCS. """
-    quotes = MarketQuotes().fit()
-    try: 
-        returns = MarketReturns(quotes).fit(quotes)
-    except TypeError: 
+    """ Cloud Function for fetching quotes, calculating returns, updating data in the GCS.
+
+    With UNIVERSE_SHARDS above 1 the shards run in parallel processes and are merged, see `sharding.py`.
+    The run is identified by the triggering event, so a retry of the event resumes it, see `checkpoints.py`.
+    """
+    runId = os.environ.get("RUN_ID") or getattr(context, "event_id", None)
+    returns = sharding.run(runId=runId) if universe.shard_count() > 1 else workflow(runId)
+    if returns.shape[0] == 0:
         logger.info(f"No additional data to load. Fetching completed.")
@@ -0,0 +1,283 @@
+""" Sharded runs of the capital markets workflow for large ticker universes.
+
+The universe is split into deterministic shards, see `universe.py`. Every shard fetches, repairs
+and summarizes its own tickers and keeps its quotes, raw quotes, reports and statistics under
+`shards/<shard>-of-<shards>/` in the usual buckets, as Parquet datasets with their own incremental
+history. A merge step then assembles the snapshot under the usual names: quotes, raw quotes, the
+fetch report and statistics are concatenated, and returns are calculated from the merged quotes,
+so the forecast DAG and the recommendation engine do not see the shards.
+
+Shards run in a local process pool, the stand-in for a fan-out of Cloud Function or Cloud Run job
+tasks: one task per shard running `run_shard()`, e.g. `python sharding.py --shard $CLOUD_RUN_TASK_INDEX`,
+followed by a task running `python sharding.py --merge`. Data quality reports stay per shard.
+
+Changing UNIVERSE_SHARDS moves tickers to new shards, which download their whole history once.
+
+Every shard records its completion as a checkpoint of the run, see `checkpoints.py`, so a retried
+run only runs the shards still missing, and the merge only starts once all shards of the run completed.
+Fan-out tasks of one run share its RUN_ID, e.g. `--run-id 2024-06-28`.
+
+Optional environment variables:
+    - SHARD_WORKERS -- processes of the local pool, defaults to one per shard like a fan-out; every
+      process holds the data of its shard only, and fetching mostly waits on the provider
+
+Usage:
+    python sharding.py [--shards 8] [--workers 4] [--run-id ID]  # the missing shards, then the merge
+    python sharding.py --shard 3 [--shards 8] [--run-id ID]     # a single shard
+    python sharding.py --merge [--shards 8] [--run-id ID]       # the merge of the stored shards
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import logging
+import os
+
+import pandas as pd
+
+import checkpoints
+import data_providers
+import run_telemetry
+import universe
+
+logger = logging.getLogger("capital-markets-data")
+
+PIPELINE = "capital-markets-returns"
+
+
+def shard_stage(shard: int, shards: int) -> str:
+    """ Checkpoint stage of a shard, e.g. `shard-003-of-016`. """
+    return f"shard-{shard:03d}-of-{shards:03d}"
+
+
+def run_shard(shard: int, shards: int, runId: str = None, tickers: list = None) -> dict:
+    """ Fetch, repair and summarize the tickers of one shard and store them for the merge.
+
+    Nothing is done when the shard already completed in the run.
+
+    Args:
+        shard (int): shard to process, from 0.
+        shards (int): number of shards.
+        runId (str, optional): ID of the run, defaults to RUN_ID or the UTC date.
+        tickers (list, optional): tickers of the shard, read from the universe when not given.
+
+    Returns:
+        dict: shard, number of tickers, status and seconds of the shard run.
+    """
+    checkpoint = checkpoints.Checkpoint(PIPELINE, runId)
+    if checkpoint.completed(shard_stage(shard, shards)) is not None:
+        return {"shard": shard, "tickers": None, "status": "resumed", "seconds": 0.0}
+    saved = {name: os.environ.get(name) for name in ("UNIVERSE_SHARD", "UNIVERSE_SHARDS")}
+    os.environ.update({"UNIVERSE_SHARD": str(shard), "UNIVERSE_SHARDS": str(shards)})
+    try:
+        with run_telemetry.RunTelemetry(f"{PIPELINE}-shard", runId=runId) as run:
+            marketQuotes = data_providers.MarketQuotes(tickers)
+            tickers = marketQuotes.settings["tickers"]
+            if not tickers:
+                logger.info(f"Shard {shard} of {shards} has no tickers.")
+            else:
+                marketQuotes.fit()
+                data_providers.MarketStatistics(tickers).fit(marketQuotes.rawQuotes)
+            outputs = {"rawQuotes": checkpoints.fingerprint(marketQuotes.rawQuotes)} if tickers else {}
+            checkpoint.complete(shard_stage(shard, shards), **outputs)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return {"shard": shard, "tickers": len(tickers), "status": run.status, "seconds": run.seconds}
+
+
+def pending_shards(checkpoint: checkpoints.Checkpoint, shards: int) -> list:
+    """ Shards that did not complete in the run of `checkpoint`. """
+    stages = {shard_stage(shard, shards): shard for shard in range(shards)}
+    return [stages[stage] for stage in checkpoint.pending(list(stages))]
+
+
+def run_shards(shards: int, workers: int = None, runId: str = None, tickers: list = None) -> list:
+    """ Run the shards missing from a run in a pool of processes.
+
+    Every shard gets its part of `tickers`, or reads the universe itself when they are not given.
+
+    Returns:
+        list: `run_shard()` results ordered by shard; the first failure is raised after all shards ended.
+    """
+    checkpoint = checkpoints.Checkpoint(PIPELINE, runId)
+    pending = pending_shards(checkpoint, shards)
+    if len(pending) < shards:
+        logger.info(f"{shards - len(pending)} of {shards} shards completed in run {checkpoint.runId}.")
+        run_telemetry.add(resumedStages=shards - len(pending))
+    if not pending:
+        return []
+    parts = universe.split(tickers, shards) if tickers is not None else [None] * shards
+    workers = workers or int(os.environ.get("SHARD_WORKERS", len(pending)))
+    logger.info(f"Running {len(pending)} of {shards} shards in {workers} processes.")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_shard, shard, shards, checkpoint.runId, parts[shard]) for shard in pending]
+        concurrent.futures.wait(futures)
+    return [future.result() for future in futures]
+
+
+def read_shard(bucket: str, file_name: str, shard: int, shards: int) -> pd.DataFrame:
+    """ Dataset stored by a shard run. """
+    store = data_providers.MarketData.get_store(bucket, universe.shard_name(file_name, shard, shards))
+    data = store.read()
+    run_telemetry.add(bytesRead=store.bytesRead)
+    if data is None:
+        raise RuntimeError(f"Shard {shard} of {shards} has no {file_name}, run it before the merge.")
+    data.index = pd.DatetimeIndex(data.index, name="Date")
+    return data
+
+
+def merge_fetch_reports(reports: list) -> dict:
+    """ Fetch report of the universe from the reports of its shards. """
+    fetchedFrom = [report["fetchedFrom"] for report in reports if report["fetchedFrom"]]
+    return {
+        **reports[0],
+        "generatedAt": datetime.datetime.utcnow().isoformat(),
+        "shards": len(reports),
+        "fullRefresh": any(report["fullRefresh"] for report in reports),
+        "removedTickers": sorted(ticker for report in reports for ticker in report.get("removedTickers", [])),
+        "adjustedTickers": sorted(ticker for report in reports for ticker in report.get("adjustedTickers", [])),
+        "fetchedFrom": min(fetchedFrom) if fetchedFrom else None,
+        **{name: sum(report[name] for report in reports) for name in ("calls", "retries", "splits")},
+        "rateLimitSeconds": round(sum(report["rateLimitSeconds"] for report in reports), 3),
+        "seconds": max(report["seconds"] for report in reports),
+        "quarantined": dict(sorted(item for report in reports for item in report["quarantined"].items())),
+    }
+
+
+def changed_rows(data: pd.DataFrame, fetchReport: dict) -> pd.DataFrame:
+    """ Rows of merged `data` changed by the shard runs, None when a shard refreshed its whole history
+    or dropped removed tickers. """
+    if fetchReport["fullRefresh"] or fetchReport["removedTickers"]:
+        return None
+    if fetchReport["fetchedFrom"] is None:
+        return data.iloc[0:0]
+    return data.loc[data.index >= pd.Timestamp(fetchReport["fetchedFrom"])]
+
+
+def merge(shards: int, runId: str = None, tickers: list = None) -> pd.DataFrame:
+    """ Assemble the quotes, statistics and returns of the universe from the stored shards.
+
+    Args:
+        shards (int): number of shards.
+        runId (str, optional): ID of the run, defaults to RUN_ID or the UTC date.
+        tickers (list, optional): tickers of the universe, read from UNIVERSE_FILE or settings.json when not given.
+
+    Returns:
+        pd.DataFrame: returns added since the last run, empty when the run had already completed.
+    """
+    if universe.current_shard() is not None:
+        raise ValueError("The merge runs over all shards, unset UNIVERSE_SHARD.")
+    checkpoint = checkpoints.Checkpoint(PIPELINE, runId)
+    if checkpoint.completed("returns") is not None:
+        logger.info(f"Run {checkpoint.runId} already completed.")
+        return pd.DataFrame()
+    if checkpoint.enabled:
+        pending = pending_shards(checkpoint, shards)
+        if pending:
+            raise RuntimeError(f"Shards {pending} of {shards} did not complete in run {checkpoint.runId}.")
+    marketQuotes = data_providers.MarketQuotes(tickers)
+    tickers = marketQuotes.settings["tickers"]
+    marketStatistics = data_providers.MarketStatistics(tickers)
+    parts = [shard for shard, part in enumerate(universe.split(tickers, shards)) if part]
+    logger.info(f"Merging {len(parts)} shards of {len(tickers)} tickers.")
+    with run_telemetry.stage("merge-quotes"):
+        quotes, rawQuotes, reports = [], [], []
+        for shard in parts:
+            quotes.append(read_shard(marketQuotes.quotesBucket, marketQuotes.quotesFileName, shard, shards))
+            rawQuotes.append(read_shard(marketQuotes.quotesBucket, marketQuotes.rawQuotesFileName, shard, shards))
+            reports.append(marketQuotes.load_json_from_gcs(
+                marketQuotes.quotesBucket, universe.shard_name(marketQuotes.fetchReportFileName, shard, shards)))
+        marketQuotes.quotes = pd.concat(quotes, axis=1).sort_index().sort_index(axis=1)
+        marketQuotes.rawQuotes = pd.concat(rawQuotes, axis=1).sort_index().sort_index(axis=1)
+        fetchReport = merge_fetch_reports(reports)
+        run_telemetry.add(rowsOut=marketQuotes.quotes.shape[0], quarantinedTickers=len(fetchReport["quarantined"]))
+        if fetchReport["quarantined"]:
+            run_telemetry.partial(f"{len(fetchReport['quarantined'])} tickers quarantined")
+        marketQuotes.upload_json_to_gcs(marketQuotes.quotesBucket, marketQuotes.fetchReportFileName, fetchReport)
+    with run_telemetry.stage("upload-quotes"):
+        marketQuotes.save(
+            bucket=marketQuotes.quotesBucket,
+            file_name=marketQuotes.quotesFileName,
+            data=marketQuotes.quotes,
+            newRows=changed_rows(marketQuotes.quotes, fetchReport)
+        )
+        marketQuotes.save(
+            bucket=marketQuotes.quotesBucket,
+            file_name=marketQuotes.rawQuotesFileName,
+            data=marketQuotes.rawQuotes,
+            newRows=changed_rows(marketQuotes.rawQuotes, fetchReport)
+        )
+    with run_telemetry.stage("statistics"):
+        marketStatistics.statistics = {}
+        for shard in parts:
+            snapshot = marketStatistics.load_json_from_gcs(
+                marketStatistics.statisticsBucket,
+                universe.shard_name(marketStatistics.statisticsFileName, shard, shards)
+            )
+            if snapshot is None:
+                raise RuntimeError(f"Shard {shard} of {shards} has no {marketStatistics.statisticsFileName}.")
+            marketStatistics.statistics.update(snapshot["statistics"])
+        run_telemetry.add(rowsOut=len(marketStatistics.statistics))
+        marketStatistics.upload_json_to_gcs(
+            bucket=marketStatistics.statisticsBucket,
+            file_name=marketStatistics.statisticsFileName,
+            data={"generatedAt": datetime.datetime.utcnow().isoformat(), "statistics": marketStatistics.statistics}
+        )
+    returns = data_providers.MarketReturns(marketQuotes.quotes, tickers).fit(marketQuotes.quotes)
+    checkpoint.complete("returns", checkpoints.fingerprint(marketQuotes.quotes), returns=checkpoints.fingerprint(returns))
+    return returns
+
+
+def run(shards: int = None, workers: int = None, runId: str = None) -> pd.DataFrame:
+    """ Run the missing shards in parallel, then merge them; the sharded counterpart of `data_providers.workflow`.
+
+    Args:
+        shards (int, optional): number of shards, defaults to UNIVERSE_SHARDS.
+        workers (int, optional): processes of the pool, defaults to SHARD_WORKERS.
+        runId (str, optional): ID of the run, defaults to RUN_ID or the UTC date.
+
+    Returns:
+        pd.DataFrame: returns added since the last run, empty when the run had already completed.
+    """
+    shards = shards or universe.shard_count()
+    with run_telemetry.RunTelemetry(PIPELINE):
+        checkpoint = checkpoints.Checkpoint(PIPELINE, runId)
+        if checkpoint.completed("returns") is not None:
+            logger.info(f"Run {checkpoint.runId} already completed.")
+            return pd.DataFrame()
+        # the universe is read once per run and split between the shards
+        tickers = universe.tickers(data_providers.MarketData.load_settings()["tickers"])
+        with run_telemetry.stage("shards"):
+            results = run_shards(shards, workers, checkpoint.runId, tickers)
+            run_telemetry.add(shards=len(results), shardSeconds=round(sum(result["seconds"] for result in results), 3))
+        return merge(shards, checkpoint.runId, tickers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, help="number of shards, defaults to UNIVERSE_SHARDS")
+    parser.add_argument("--workers", type=int, help="processes of the local pool, defaults to SHARD_WORKERS")
+    parser.add_argument("--run-id", help="run to start or resume, defaults to RUN_ID or the UTC date")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--shard", type=int, help="run this shard only")
+    group.add_argument("--merge", action="store_true", help="merge the stored shards only")
+    args = parser.parse_args()
+    shards = args.shards or universe.shard_count()
+    if args.run_id:
+        # inherited by the shard processes
+        os.environ["RUN_ID"] = args.run_id
+    if args.shard is not None:
+        run_shard(args.shard, shards)
+    elif args.merge:
+        with run_telemetry.RunTelemetry(PIPELINE):
+            merge(shards)
+    else:
+        run(shards, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+""" Ticker universe and its deterministic shards.
+
+The universe is read from UNIVERSE_FILE, of any size, or is the `tickers` list of settings.json.
+Tickers are assigned to shards by a stable hash of the symbol, `crc32(ticker) % shards`, so:
+    - a ticker lands in the same shard in every run and every process, whatever the file order
+    - adding or removing tickers does not move the others, and the stored history of every
+      shard stays valid for incremental updates
+Shards are balanced for large universes; a few dozen tickers may split unevenly.
+
+The file is not cached: every run reads it once and hands the tickers down to its stages and shards,
+so a warm Cloud Function instance picks up an edited UNIVERSE_FILE with its next run.
+
+A process runs a single shard when UNIVERSE_SHARD is set: it only handles the tickers of that shard
+and keeps its datasets under `shards/<shard>-of-<shards>/` in the usual buckets, see `sharding.py`.
+
+Optional environment variables:
+    - UNIVERSE_FILE -- local path or URL (e.g. `gs://bucket/universe.csv`) of the tickers: a JSON list
+      or `{"tickers": [...]}`, or text with one ticker per line, the first column of a CSV file;
+      blank lines, `#` comments and a `ticker` or `symbol` header are skipped
+    - UNIVERSE_SHARDS -- number of shards, defaults to 1
+    - UNIVERSE_SHARD -- shard handled by this process, from 0 to UNIVERSE_SHARDS - 1; unset for the
+      whole universe
+"""
+
+import json
+import logging
+import os
+import zlib
+
+import fsspec
+
+logger = logging.getLogger("capital-markets-data")
+
+SHARD_PREFIX = "shards"
+HEADERS = ("ticker", "symbol")
+
+
+def load(path: str) -> list:
+    """ Unique tickers of a universe file, in file order. """
+    with fsspec.open(path, "r") as f:
+        text = f.read()
+    if path.endswith(".json"):
+        data = json.loads(text)
+        tickers = data["tickers"] if isinstance(data, dict) else data
+    else:
+        tickers = [line.split(",")[0].strip().strip('"') for line in text.splitlines()]
+        tickers = [ticker for ticker in tickers
+                   if ticker and not ticker.startswith("#") and ticker.lower() not in HEADERS]
+    tickers = list(dict.fromkeys(tickers))
+    logger.info(f"Loaded {len(tickers)} tickers from {path}.")
+    return tickers
+
+
+def shard_count() -> int:
+    shards = int(os.environ.get("UNIVERSE_SHARDS", 1))
+    if shards < 1:
+        raise ValueError(f"UNIVERSE_SHARDS must be at least 1, got {shards}")
+    return shards
+
+
+def current_shard() -> int:
+    """ Shard handled by this process, None when it handles the whole universe. """
+    value = os.environ.get("UNIVERSE_SHARD")
+    if value is None or value == "":
+        return None
+    shard, shards = int(value), shard_count()
+    if not 0 <= shard < shards:
+        raise ValueError(f"UNIVERSE_SHARD must be between 0 and {shards - 1}, got {shard}")
+    return shard
+
+
+def shard_of(ticker: str, shards: int) -> int:
+    """ Shard of a ticker, stable across runs, processes and universe changes. """
+    return zlib.crc32(ticker.encode("utf-8")) % shards
+
+
+def split(tickers: list, shards: int) -> list:
+    """ Tickers of every shard, in universe order.
+
+    Returns:
+        list: one list of tickers per shard, possibly empty.
+    """
+    parts = [[] for _ in range(shards)]
+    for ticker in tickers:
+        parts[shard_of(ticker, shards)].append(ticker)
+    return parts
+
+
+def shard_name(file_name: str, shard: int, shards: int) -> str:
+    """ Name of a dataset of a shard, e.g. `shards/003-of-016/capital-markets-quotes.csv`. """
+    return f"{SHARD_PREFIX}/{shard:03d}-of-{shards:03d}/{file_name}"
+
+
+def tickers(default: list) -> list:
+    """ Tickers handled by this process: the universe, or its shard when UNIVERSE_SHARD is set.
+
+    Args:
+        default (list): tickers used without UNIVERSE_FILE, e.g. those of settings.json.
+    """
+    path = os.environ.get("UNIVERSE_FILE")
+    universe = load(path) if path else list(default)
+    shard = current_shard()
+    if shard is None:
+        return universe
+    return split(universe, shard_count())[shard]
@@ -0,0 +1,10 @@
+""" Pipeline modules import each other by name, as in the deployed Cloud Function.
+
+Usage, from the capital-markets-returns directory:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
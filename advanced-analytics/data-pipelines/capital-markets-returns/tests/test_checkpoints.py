@@ -0,0 +1,117 @@
+import concurrent.futures
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import checkpoints
+import data_providers
+import quote_providers
+import sharding
+
+TICKERS = ["AAA", "BBB", "CCC", "DDD", "EEE", "FFF"]
+SHARDS = 3
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """ Offline pipeline on synthetic quotes and local buckets; yields the provider calls made. """
+    for bucket in ("quotes", "returns"):
+        (tmp_path / "storage" / bucket).mkdir(parents=True)
+    with open(tmp_path / "settings.json", "w") as f:
+        json.dump({"tickers": TICKERS, "startDate": "2023-01-01"}, f)
+    monkeypatch.chdir(tmp_path)
+    for name, value in {
+        "STORAGE_ROOT": str(tmp_path / "storage"),
+        "QUOTES_BUCKET_NAME": "quotes",
+        "QUOTES_BLOB_NAME": "capital-markets-quotes.csv",
+        "RETURNS_BUCKET_NAME": "returns",
+        "RETURNS_BLOB_NAME": "capital-markets-returns.csv",
+        "MARKET_DATA_PROVIDER": "synthetic",
+        "QUOTES_RATE_LIMIT": "0",
+        "RUN_METRICS_FILE": str(tmp_path / "runs.jsonl"),
+        "RUN_ID": "2024-06-28",
+    }.items():
+        monkeypatch.setenv(name, value)
+    for name in ("UNIVERSE_FILE", "UNIVERSE_SHARD", "UNIVERSE_SHARDS", "CHECKPOINTS", "CHECKPOINT_BUCKET_NAME"):
+        monkeypatch.delenv(name, raising=False)
+
+    calls = []
+    download = quote_providers.SyntheticProvider.download
+
+    def counted(self, tickers, **kwargs):
+        calls.append((os.environ.get("UNIVERSE_SHARD"), list(tickers)))
+        return download(self, tickers, **kwargs)
+
+    monkeypatch.setattr(quote_providers.SyntheticProvider, "download", counted)
+    # shards run one after another in this process, so the failures injected below reach them
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", concurrent.futures.ThreadPoolExecutor)
+    return calls
+
+
+def stored_returns(tmp_path) -> pd.DataFrame:
+    return pd.read_csv(tmp_path / "storage" / "returns" / "capital-markets-returns.csv", index_col=0)
+
+
+class TestWorkflowResume:
+    def test_retry_after_failed_returns_makes_no_provider_calls(self, pipeline, tmp_path, monkeypatch):
+        fit = data_providers.MarketReturns.fit
+        monkeypatch.setattr(data_providers.MarketReturns, "fit", lambda self, quotes: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            data_providers.workflow()
+        assert len(pipeline) > 0
+        checkpoint = checkpoints.Checkpoint("capital-markets-returns")
+        assert checkpoint.pending(["quotes", "statistics", "returns"]) == ["returns"]
+
+        pipeline.clear()
+        monkeypatch.setattr(data_providers.MarketReturns, "fit", fit)
+        returns = data_providers.workflow()
+
+        assert pipeline == []
+        assert returns.shape[0] > 0
+        pd.testing.assert_index_equal(stored_returns(tmp_path).columns, pd.Index(TICKERS))
+        assert checkpoint.pending(["returns"]) == []
+
+    def test_completed_run_does_nothing(self, pipeline):
+        data_providers.workflow()
+        pipeline.clear()
+
+        assert data_providers.workflow().shape[0] == 0
+        assert pipeline == []
+
+    def test_new_run_fetches_again(self, pipeline, monkeypatch):
+        data_providers.workflow()
+        pipeline.clear()
+
+        monkeypatch.setenv("RUN_ID", "2024-06-29")
+        data_providers.workflow()
+
+        assert len(pipeline) == 1
+
+
+class TestShardedResume:
+    def test_only_the_failed_shard_runs_again(self, pipeline, tmp_path, monkeypatch):
+        fit = data_providers.MarketStatistics.fit
+
+        def failing(self, rawQuotes):
+            if os.environ.get("UNIVERSE_SHARD") == "1":
+                raise ConnectionError("shard 1 lost its worker")
+            return fit(self, rawQuotes)
+
+        monkeypatch.setattr(data_providers.MarketStatistics, "fit", failing)
+        with pytest.raises(ConnectionError):
+            sharding.run(shards=SHARDS, workers=1)
+        checkpoint = checkpoints.Checkpoint(sharding.PIPELINE)
+        assert sharding.pending_shards(checkpoint, SHARDS) == [1]
+        with pytest.raises(RuntimeError, match="did not complete"):
+            sharding.merge(SHARDS)
+
+        pipeline.clear()
+        monkeypatch.setattr(data_providers.MarketStatistics, "fit", fit)
+        returns = sharding.run(shards=SHARDS, workers=1)
+
+        assert {shard for shard, tickers in pipeline} == {"1"}
+        assert sharding.pending_shards(checkpoint, SHARDS) == []
+        assert returns.shape[0] > 0
+        pd.testing.assert_index_equal(stored_returns(tmp_path).columns, pd.Index(TICKERS))
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+import data_quality
+
+DAYS = 60
+
+
+def walk(seed: int, days: int = DAYS) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, days)))
+
+
+class TestDataQualityRepair:
+    def setup_method(self):
+        self.dates = pd.bdate_range("2024-01-01", periods=DAYS, name="Date")
+        self.prices = pd.DataFrame({"AAA": walk(1), "BBB": walk(2)}, index=self.dates)
+        self.quality = data_quality.DataQuality(maxFillDays=3, zThreshold=10, repairSpikes=True)
+
+    def test_keeps_clean_prices(self):
+        clean = self.quality.repair(self.prices)
+
+        pd.testing.assert_frame_equal(clean, self.prices)
+        report = self.quality.report()
+        assert report["filledPrices"] == report["missingPrices"] == report["spikes"] == report["jumps"] == 0
+        assert report["listing"] == {}
+
+    def test_late_listing_stays_missing_before_the_first_price(self):
+        self.prices.iloc[:10, 1] = np.nan
+
+        clean = self.quality.repair(self.prices)
+
+        assert clean.shape == self.prices.shape
+        assert clean["BBB"].iloc[:10].isna().all()
+        assert clean["BBB"].iloc[10:].notna().all()
+        report = self.quality.report()
+        assert report["filledPrices"] == 0
+        assert report["completeDays"] == DAYS - 10
+        assert report["listing"]["BBB"]["firstDate"] == self.dates[10].strftime("%Y-%m-%d")
+
+    def test_short_gap_is_forward_filled(self):
+        self.prices.iloc[20:22, 0] = np.nan
+
+        clean = self.quality.repair(self.prices)
+
+        assert clean["AAA"].iloc[20] == clean["AAA"].iloc[21] == self.prices["AAA"].iloc[19]
+        report = self.quality.report()
+        assert report["filledPrices"] == 2
+        assert report["missingPrices"] == 0
+        assert report["listing"]["AAA"]["filled"] == 2
+
+    def test_gap_longer_than_max_fill_days_is_filled_up_to_the_limit(self):
+        self.prices.iloc[20:25, 0] = np.nan
+
+        clean = self.quality.repair(self.prices)
+
+        assert (clean["AAA"].iloc[20:23] == self.prices["AAA"].iloc[19]).all()
+        assert clean["AAA"].iloc[23:25].isna().all()
+        assert clean["AAA"].iloc[25] == self.prices["AAA"].iloc[25]
+        report = self.quality.report()
+        assert report["filledPrices"] == 3
+        assert report["missingPrices"] == 2
+
+    def test_one_day_spike_is_replaced_by_the_previous_price(self):
+        self.prices.iloc[30, 0] *= 3
+
+        clean = self.quality.repair(self.prices)
+
+        assert clean["AAA"].iloc[30] == self.prices["AAA"].iloc[29]
+        report = self.quality.report()
+        assert report["spikes"] == 1
+        assert report["jumps"] == 0
+        assert report["events"] == [{
+            "date": self.dates[30].strftime("%Y-%m-%d"),
+            "ticker": "AAA",
+            "type": "spike",
+            "zScore": report["events"][0]["zScore"],
+        }]
+        assert report["events"][0]["zScore"] > 10
+
+    def test_spike_is_only_reported_without_repair(self):
+        self.prices.iloc[30, 0] *= 3
+        quality = data_quality.DataQuality(maxFillDays=3, zThreshold=10, repairSpikes=False)
+
+        clean = quality.repair(self.prices)
+
+        assert clean["AAA"].iloc[30] == self.prices["AAA"].iloc[30]
+        assert quality.report()["spikes"] == 1
+
+    def test_lasting_jump_is_reported_and_kept(self):
+        self.prices.iloc[30:, 0] *= 2
+
+        clean = self.quality.repair(self.prices)
+
+        pd.testing.assert_series_equal(clean["AAA"], self.prices["AAA"])
+        report = self.quality.report()
+        assert report["jumps"] == 1
+        assert report["spikes"] == 0
+        assert [(event["date"], event["type"]) for event in report["events"]] == \
+            [(self.dates[30].strftime("%Y-%m-%d"), "jump")]
+
+    def test_invalid_prices_are_treated_as_missing(self):
+        self.prices.iloc[40, 0] = 0.0
+        self.prices.iloc[41, 1] = -5.0
+        self.prices.iloc[42, 1] = np.inf
+
+        clean = self.quality.repair(self.prices)
+
+        assert clean["AAA"].iloc[40] == self.prices["AAA"].iloc[39]
+        assert clean["BBB"].iloc[41] == clean["BBB"].iloc[42] == self.prices["BBB"].iloc[40]
+        report = self.quality.report()
+        assert report["invalidPrices"] == 3
+        assert report["filledPrices"] == 3
+        assert report["spikes"] == report["jumps"] == 0
+
+    def test_drops_tickers_without_any_price_and_days_before_every_listing(self):
+        self.prices["CCC"] = np.nan
+        self.prices.iloc[0] = np.nan
+
+        clean = self.quality.repair(self.prices)
+
+        assert list(clean.columns) == ["AAA", "BBB"]
+        assert clean.index[0] == self.dates[1]
+        report = self.quality.report()
+        assert report["emptyTickers"] == ["CCC"]
+        assert report["keptDays"] == DAYS - 1
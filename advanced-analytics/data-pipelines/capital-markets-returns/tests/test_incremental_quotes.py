@@ -0,0 +1,76 @@
+import json
+
+import pandas as pd
+import pytest
+
+import data_providers
+import quote_providers
+
+TICKERS = ["AAA", "BBB", "CCC"]
+START_DATE = "2023-01-01"
+
+
+@pytest.fixture
+def calls(tmp_path, monkeypatch):
+    """ Offline quotes on synthetic prices and a local bucket; yields the provider downloads made. """
+    (tmp_path / "storage" / "quotes").mkdir(parents=True)
+    with open(tmp_path / "settings.json", "w") as f:
+        json.dump({"tickers": TICKERS, "startDate": START_DATE}, f)
+    monkeypatch.chdir(tmp_path)
+    for name, value in {
+        "STORAGE_ROOT": str(tmp_path / "storage"),
+        "QUOTES_BUCKET_NAME": "quotes",
+        "QUOTES_BLOB_NAME": "capital-markets-quotes.csv",
+        "MARKET_DATA_PROVIDER": "synthetic",
+        "QUOTES_RATE_LIMIT": "0",
+    }.items():
+        monkeypatch.setenv(name, value)
+    for name in ("UNIVERSE_FILE", "UNIVERSE_SHARD", "UNIVERSE_SHARDS", "STORE_FORMAT", "QUOTES_FULL_REFRESH"):
+        monkeypatch.delenv(name, raising=False)
+
+    downloads = []
+    download = quote_providers.SyntheticProvider.download
+
+    def counted(self, tickers, start=None, **kwargs):
+        downloads.append((sorted(tickers), pd.Timestamp(start)))
+        return download(self, tickers, start=start, **kwargs)
+
+    monkeypatch.setattr(quote_providers.SyntheticProvider, "download", counted)
+    return downloads
+
+
+def stored_raw_quotes(tmp_path) -> str:
+    return str(tmp_path / "storage" / "quotes" / "capital-markets-quotes-raw.csv")
+
+
+class TestAdjustedTickers:
+    def test_only_the_adjusted_ticker_is_downloaded_again(self, calls, tmp_path):
+        data_providers.MarketQuotes().fit()
+        path = stored_raw_quotes(tmp_path)
+        stored = pd.read_csv(path, header=[0, 1], index_col=0, parse_dates=True)
+        # the stored prices of BBB predate a dividend the provider has adjusted for since
+        stored[("Adj Close", "BBB")] *= 0.98
+        stored.to_csv(path)
+        calls.clear()
+
+        quotes = data_providers.MarketQuotes()
+        quotes.fit()
+
+        assert [tickers for tickers, start in calls] == [TICKERS, ["BBB"]]
+        assert calls[0][1] > pd.Timestamp(START_DATE)
+        assert calls[1][1] == pd.Timestamp(START_DATE)
+        assert quotes.adjustedTickers == ["BBB"]
+        assert not quotes.fullRefresh
+        expected = quote_providers.SyntheticProvider().download(["BBB"], start=START_DATE)[("Adj Close", "BBB")]
+        pd.testing.assert_series_equal(quotes.rawQuotes[("Adj Close", "BBB")], expected, check_freq=False)
+
+    def test_unchanged_history_is_not_downloaded_again(self, calls):
+        data_providers.MarketQuotes().fit()
+        calls.clear()
+
+        quotes = data_providers.MarketQuotes()
+        quotes.fit()
+
+        assert [tickers for tickers, start in calls] == [TICKERS]
+        assert quotes.adjustedTickers == []
+        assert not quotes.fullRefresh
@@ -0,0 +1,30 @@
+import importlib.util
+import os
+
+SYNC = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "common", "shared", "sync.py"
+)
+
+
+def load_sync():
+    spec = importlib.util.spec_from_file_location("shared_sync", SYNC)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestSharedModules:
+    def setup_method(self):
+        self.sync = load_sync()
+
+    def test_copies_match_their_source(self):
+        assert self.sync.drifted() == [], \
+            "shared modules were edited in place, edit data-pipelines/common/shared and run its sync.py"
+
+    def test_copies_differ_only_by_the_logger_name(self):
+        source = self.sync.render("object_store", "capital-markets-data")
+        engine = self.sync.render("object_store", "recommendation-engine")
+
+        assert 'logger = logging.getLogger("capital-markets-data")' in source
+        assert [line for line in source.splitlines() if line not in engine.splitlines()] == \
+            ['logger = logging.getLogger("capital-markets-data")']
@@ -0,0 +1,22 @@
+import universe
+
+
+class TestUniverseFile:
+    def test_edited_file_is_read_again(self, tmp_path, monkeypatch):
+        path = tmp_path / "universe.csv"
+        path.write_text("ticker\nAAA\nBBB\n")
+        monkeypatch.setenv("UNIVERSE_FILE", str(path))
+        monkeypatch.delenv("UNIVERSE_SHARD", raising=False)
+        assert universe.tickers(["ZZZ"]) == ["AAA", "BBB"]
+
+        path.write_text("ticker\nAAA\nCCC\n# BBB was delisted\n")
+
+        assert universe.tickers(["ZZZ"]) == ["AAA", "CCC"]
+
+    def test_shard_keeps_its_part_of_the_universe(self, tmp_path, monkeypatch):
+        tickers = [f"T{i:03d}" for i in range(40)]
+        monkeypatch.delenv("UNIVERSE_FILE", raising=False)
+        monkeypatch.setenv("UNIVERSE_SHARDS", "4")
+        monkeypatch.setenv("UNIVERSE_SHARD", "2")
+
+        assert universe.tickers(tickers) == universe.split(tickers, 4)[2]
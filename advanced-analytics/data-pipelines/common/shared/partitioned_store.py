@@ -0,0 +1,260 @@
+""" Date-partitioned Parquet store for daily market data.
+
+A dataset is a directory (local or `gs://`) with one Parquet file per year or month and a
+small `_manifest.json`. Appending a day rewrites only the partition holding it, and readers
+load only the partitions, row groups and columns they ask for:
+
+    {"schemaVersion": 1, "partitioning": "year", "columnLevels": 1, "columns": ["AAPL", ...],
+     "rows": 1835, "firstDate": "2017-01-03", "lastDate": "2024-01-12", "contentHash": "sha256:...",
+     "partitions": {"2024": {"file": "2024.parquet", "rows": 8, "bytes": 9120, "columns": [...],
+                             "firstDate": "2024-01-02", "lastDate": "2024-01-12",
+                             "contentHash": "sha256:..."}, ...}}
+
+Two-level (field, ticker) columns are stored as `field/ticker` names.
+
+`partitioned_store.py` reads optional env variables:
+    - STORE_PARTITIONING -- `year` (default) or `month`
+    - STORE_CODEC -- Parquet compression: `snappy` (default), `zstd`, `gzip`, `brotli`, `lz4` or `none`
+    - STORE_ROW_GROUP_SIZE -- rows per Parquet row group, defaults to 64; smaller groups let date
+      range reads skip more rows, larger groups compress better
+"""
+
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+
+import fsspec
+import pandas as pd
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+MANIFEST = "_manifest.json"
+INDEX = "Date"
+SEPARATOR = "/"
+
+__valid_partitionings__ = {
+    "year": "%Y",
+    "month": "%Y-%m",
+}
+
+
+class PartitionedStore:
+    """ Parquet dataset partitioned by date with a JSON manifest.
+
+    Public methods:
+        write() -- replace the dataset.
+        append() -- insert or replace days, rewriting only the partitions they fall into.
+        read() -- load a date range and a subset of columns.
+        manifest() -- the dataset manifest, None if the dataset does not exist.
+
+    Attributes:
+        path -- dataset directory, local or `gs://bucket/prefix`
+        partitioning -- `year` or `month`
+        codec -- Parquet compression codec
+        rowGroupSize -- rows per Parquet row group
+        bytesWritten -- bytes of the partitions and manifests written by this instance
+        bytesRead -- bytes of the partitions read by this instance
+    """
+    def __init__(self, path: str, partitioning: str = None, codec: str = None, rowGroupSize: int = None):
+        self.path: str = path.rstrip("/")
+        self.partitioning: str = partitioning or os.environ.get("STORE_PARTITIONING", "year")
+        if self.partitioning not in __valid_partitionings__:
+            raise ValueError(f"Unknown partitioning: {self.partitioning}")
+        self.codec: str = codec or os.environ.get("STORE_CODEC", "snappy")
+        self.rowGroupSize: int = rowGroupSize or int(os.environ.get("STORE_ROW_GROUP_SIZE", 64))
+        self.fs, self.root = fsspec.core.url_to_fs(self.path)
+        self.bytesWritten: int = 0
+        self.bytesRead: int = 0
+
+    def file_path(self, name: str) -> str:
+        return SEPARATOR.join([self.root, name])
+
+    def manifest(self) -> dict:
+        try:
+            with self.fs.open(self.file_path(MANIFEST), "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        if manifest.get("schemaVersion") != SCHEMA_VERSION:
+            raise ValueError(f"Unsupported store schema version {manifest.get('schemaVersion')} in {self.path}")
+        return manifest
+
+    @staticmethod
+    def flatten(data: pd.DataFrame) -> pd.DataFrame:
+        flat = data.copy()
+        if isinstance(data.columns, pd.MultiIndex):
+            flat.columns = [SEPARATOR.join(map(str, column)) for column in data.columns]
+        else:
+            flat.columns = [str(column) for column in data.columns]
+        flat.index = pd.DatetimeIndex(flat.index, name=INDEX)
+        return flat
+
+    @staticmethod
+    def unflatten(data: pd.DataFrame, columnLevels: int) -> pd.DataFrame:
+        if columnLevels > 1:
+            data.columns = pd.MultiIndex.from_tuples([tuple(column.split(SEPARATOR, 1)) for column in data.columns])
+        return data
+
+    def partition_keys(self, index: pd.DatetimeIndex) -> pd.Index:
+        return index.strftime(__valid_partitionings__[self.partitioning])
+
+    def _write_partition(self, key: str, data: pd.DataFrame) -> dict:
+        name = f"{key}.parquet"
+        buffer = io.BytesIO()
+        data.to_parquet(
+            buffer,
+            engine="pyarrow",
+            compression=None if self.codec == "none" else self.codec,
+            row_group_size=self.rowGroupSize,
+            index=True,
+        )
+        body = buffer.getvalue()
+        with self.fs.open(self.file_path(name), "wb") as f:
+            f.write(body)
+        self.bytesWritten += len(body)
+        return {
+            "file": name,
+            "rows": int(data.shape[0]),
+            "bytes": len(body),
+            "contentHash": f"sha256:{hashlib.sha256(body).hexdigest()}",
+            "columns": list(data.columns),
+            "firstDate": data.index[0].strftime("%Y-%m-%d"),
+            "lastDate": data.index[-1].strftime("%Y-%m-%d"),
+        }
+
+    def _write_manifest(self, partitions: dict, columnLevels: int) -> dict:
+        partitions = dict(sorted(partitions.items()))
+        columns = list(dict.fromkeys(column for partition in partitions.values() for column in partition["columns"]))
+        manifest = {
+            "schemaVersion": SCHEMA_VERSION,
+            "partitioning": self.partitioning,
+            "columnLevels": columnLevels,
+            "columns": sorted(columns),
+            "rows": sum(partition["rows"] for partition in partitions.values()),
+            "firstDate": next(iter(partitions.values()))["firstDate"] if partitions else None,
+            "lastDate": list(partitions.values())[-1]["lastDate"] if partitions else None,
+            # changes whenever any partition changes
+            "contentHash": "sha256:" + hashlib.sha256(
+                "".join(partition.get("contentHash", "") for partition in partitions.values()).encode("utf-8")
+            ).hexdigest(),
+            "updatedAt": datetime.datetime.utcnow().isoformat(),
+            "partitions": partitions,
+        }
+        body = json.dumps(manifest, indent=1)
+        with self.fs.open(self.file_path(MANIFEST), "w") as f:
+            f.write(body)
+        self.bytesWritten += len(body)
+        return manifest
+
+    def write(self, data: pd.DataFrame) -> dict:
+        """ Replace the dataset with `data`.
+
+        Args:
+            data (pd.DataFrame): rows indexed by date.
+
+        Returns:
+            dict: the new manifest.
+        """
+        previous = self.manifest()
+        self.fs.makedirs(self.root, exist_ok=True)
+        flat = self.flatten(data.sort_index())
+        columnLevels = data.columns.nlevels
+        partitions = {}
+        for key, part in flat.groupby(self.partition_keys(flat.index)):
+            partitions[key] = self._write_partition(key, part)
+        manifest = self._write_manifest(partitions, columnLevels)
+        for key, partition in (previous or {}).get("partitions", {}).items():
+            if key not in partitions:
+                self.fs.rm(self.file_path(partition["file"]))
+        logger.info(f"Wrote {flat.shape[0]} rows in {len(partitions)} partitions to {self.path}.")
+        return manifest
+
+    def append(self, data: pd.DataFrame) -> dict:
+        """ Insert `data`, replacing stored rows with the same dates.
+
+        Only the partitions that `data` falls into are read and rewritten.
+
+        Args:
+            data (pd.DataFrame): rows indexed by date.
+
+        Returns:
+            dict: the new manifest.
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            return self.write(data)
+        if data.columns.nlevels != manifest["columnLevels"]:
+            raise ValueError(f"Expected {manifest['columnLevels']} column levels, got {data.columns.nlevels}")
+        flat = self.flatten(data.sort_index())
+        partitions = dict(manifest["partitions"])
+        for key, part in flat.groupby(self.partition_keys(flat.index)):
+            if key in partitions:
+                stored = self._read_partition(partitions[key]["file"], None, None, None)
+                self.bytesRead += partitions[key]["bytes"]
+                part = pd.concat([stored.loc[~stored.index.isin(part.index)], part]).sort_index()
+            partitions[key] = self._write_partition(key, part)
+        logger.info(f"Appended {flat.shape[0]} rows to {self.path}.")
+        return self._write_manifest(partitions, manifest["columnLevels"])
+
+    def read(self, start=None, end=None, columns: list = None) -> pd.DataFrame:
+        """ Load a date range and a subset of columns.
+
+        Partitions outside the range are not opened, and row groups outside it are not read.
+
+        Args:
+            start, end (optional): inclusive date range.
+            columns (list, optional): column names, or (field, ticker) tuples for two-level datasets.
+
+        Returns:
+            pd.DataFrame: rows indexed by date; None if the dataset does not exist.
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            return None
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        wanted = None
+        if columns is not None:
+            wanted = [SEPARATOR.join(column) if isinstance(column, tuple) else str(column) for column in columns]
+        frames = []
+        for partition in manifest["partitions"].values():
+            if start is not None and pd.Timestamp(partition["lastDate"]) < start:
+                continue
+            if end is not None and pd.Timestamp(partition["firstDate"]) > end:
+                continue
+            present = [column for column in wanted if column in partition["columns"]] if wanted is not None else None
+            frames.append(self._read_partition(partition["file"], start, end, present))
+            self.bytesRead += partition["bytes"]
+        if not frames:
+            data = pd.DataFrame(columns=wanted or manifest["columns"], index=pd.DatetimeIndex([], name=INDEX))
+        else:
+            data = pd.concat(frames).sort_index()
+        if wanted is not None:
+            data = data.reindex(columns=wanted)
+        data = data.loc[start:end] if start is not None or end is not None else data
+        return self.unflatten(data, manifest["columnLevels"])
+
+    def _read_partition(self, name: str, start, end, columns: list) -> pd.DataFrame:
+        with self.fs.open(self.file_path(name), "rb") as f:
+            parquetFile = pq.ParquetFile(f)
+            dateColumn = parquetFile.schema_arrow.get_field_index(INDEX)
+            rowGroups = []
+            for i in range(parquetFile.num_row_groups):
+                statistics = parquetFile.metadata.row_group(i).column(dateColumn).statistics
+                if statistics is not None and statistics.has_min_max:
+                    if start is not None and pd.Timestamp(statistics.max) < start:
+                        continue
+                    if end is not None and pd.Timestamp(statistics.min) > end:
+                        continue
+                rowGroups.append(i)
+            table = parquetFile.read_row_groups(
+                rowGroups, columns=None if columns is None else columns + [INDEX], use_pandas_metadata=True
+            )
+        data = table.to_pandas()
+        data.index = pd.DatetimeIndex(data.index, name=INDEX)
+        return data
@@ -0,0 +1,95 @@
+""" Multi-horizon returns cube.
+
+Returns of every horizon are computed in one vectorized pass over the price matrix: each
+horizon is a single shifted division of the whole (dates x tickers) array, and log returns
+are taken from the same ratios. The cube is a frame with (field, ticker) columns, fields
+named `<kind>_<horizon>` such as `simple_20` or `log_5`, so it is stored like the raw quotes
+and a Parquet reader loads only the horizon it asks for:
+
+            simple_1        ...  log_252
+            AAPL    SPY     ...  AAPL    SPY
+    Date
+    2024-01-12  0.0018 -0.0007  ...  0.2417  0.1913
+"""
+
+import numpy as np
+import pandas as pd
+
+import compressed_io
+import partitioned_store
+
+HORIZONS = (1, 5, 20, 60, 252)
+KINDS = ("simple", "log")
+CSV_SUFFIXES = (".csv", ".csv.gz", ".csv.zst")
+
+
+def field(kind: str, horizon: int) -> str:
+    return f"{kind}_{horizon}"
+
+
+def compute(quotes: pd.DataFrame, horizons: tuple = HORIZONS, kinds: tuple = KINDS) -> pd.DataFrame:
+    """ Returns of every ticker over every horizon.
+
+    Args:
+        quotes (pd.DataFrame): prices, one column per ticker, sorted by date.
+        horizons (tuple): horizons in rows (trading days). Defaults to 1, 5, 20, 60 and 252.
+        kinds (tuple): `simple` and/or `log` returns. Defaults to both.
+
+    Returns:
+        pd.DataFrame: returns with (field, ticker) columns; rows without any return are left out.
+    """
+    prices = quotes.to_numpy(dtype=float)
+    rows, tickers = prices.shape
+    blocks = []
+    fields = []
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for horizon in horizons:
+            ratios = np.full((rows, tickers), np.nan)
+            if horizon < rows:
+                ratios[horizon:] = prices[horizon:] / prices[:-horizon]
+            for kind in kinds:
+                blocks.append(ratios - 1.0 if kind == "simple" else np.log(ratios))
+                fields.append(field(kind, horizon))
+    values = np.concatenate(blocks, axis=1) if blocks else np.empty((rows, 0))
+    cube = pd.DataFrame(values, index=quotes.index, columns=pd.MultiIndex.from_product([fields, quotes.columns]))
+    return cube.dropna(how="all")
+
+
+def select(cube: pd.DataFrame, horizon: int, kind: str = "simple") -> pd.DataFrame:
+    """ Returns of one horizon, one column per ticker, without the dates before the horizon is reached. """
+    return cube[field(kind, horizon)].dropna(how="all")
+
+
+def read(path: str, horizon: int, kind: str = "simple", tickers: list = None) -> pd.DataFrame:
+    """ Load returns of one horizon from a stored cube.
+
+    Args:
+        path (str): cube CSV file, or partitioned Parquet dataset of which only the horizon's
+            columns are read.
+        horizon (int): horizon in trading days.
+        kind (str): `simple` or `log`. Defaults to `simple`.
+        tickers (list, optional): tickers to load. Defaults to all.
+
+    Returns:
+        pd.DataFrame: returns, one column per ticker; None if the cube does not exist.
+    """
+    name = field(kind, horizon)
+    if path.endswith(CSV_SUFFIXES):
+        try:
+            cube = compressed_io.read_csv(path, index_col=0, header=[0, 1], parse_dates=True)
+        except FileNotFoundError:
+            return None
+    else:
+        store = partitioned_store.PartitionedStore(path)
+        manifest = store.manifest()
+        if manifest is None:
+            return None
+        if tickers is None:
+            prefix = name + partitioned_store.SEPARATOR
+            tickers = [column[len(prefix):] for column in manifest["columns"] if column.startswith(prefix)]
+        cube = store.read(columns=[(name, ticker) for ticker in tickers])
+    if name not in cube.columns.get_level_values(0):
+        raise ValueError(f"The returns cube has no {name} returns")
+    returns = select(cube, horizon, kind)
+    # tickers missing from the cube come back as empty columns, like those of a Parquet cube
+    return returns.reindex(columns=tickers) if tickers is not None else returns
@@ -0,0 +1,90 @@
+""" Copy the shared modules into the deployables that use them.
+
+The modules of this directory are the single source of their copies in the Cloud Functions and
+the recommendation engine, which are deployed from their own directories and import them by
+name. A copy only differs from its source by the logger name of its deployable. Edit the modules
+here and run this script; `--check` fails when a copy drifted apart from its source, so the tests
+and the builds catch copies edited in place.
+
+Usage, from any directory:
+    python sync.py            # copy the shared modules into every deployable
+    python sync.py --check    # list the copies that differ from their source, exit 1 if any
+"""
+
+import argparse
+import os
+import re
+import sys
+
+SHARED = os.path.dirname(os.path.abspath(__file__))
+ADVANCED_ANALYTICS = os.path.dirname(os.path.dirname(os.path.dirname(SHARED)))
+
+# deployable directory, relative to advanced-analytics -- (logger name, shared modules it uses)
+DEPLOYABLES = {
+    "data-pipelines/capital-markets-returns/data": ("capital-markets-data", [
+        "compressed_io", "object_store", "partitioned_store", "quote_providers", "returns_cube", "run_telemetry"
+    ]),
+    "data-pipelines/investor-risk-preferences/data": ("investor-risk-preferences", [
+        "object_store", "run_telemetry"
+    ]),
+    "recommendation-engine": ("recommendation-engine", [
+        "compressed_io", "object_store", "partitioned_store", "quote_providers", "returns_cube"
+    ]),
+}
+
+LOGGER = re.compile(r"^logger = logging\.getLogger\(__name__\)$", re.MULTILINE)
+
+
+def render(module: str, loggerName: str) -> str:
+    """ Source of a shared module as copied into a deployable logging as `loggerName`. """
+    with open(os.path.join(SHARED, f"{module}.py")) as f:
+        source = f.read()
+    return LOGGER.sub(f'logger = logging.getLogger("{loggerName}")', source)
+
+
+def copies() -> list:
+    """ (copy path, expected source) of every shared module in every deployable. """
+    return [
+        (os.path.join(ADVANCED_ANALYTICS, deployable, f"{module}.py"), render(module, loggerName))
+        for deployable, (loggerName, modules) in DEPLOYABLES.items()
+        for module in modules
+    ]
+
+
+def drifted() -> list:
+    """ Paths of the copies missing or differing from their source. """
+    paths = []
+    for path, source in copies():
+        if not os.path.exists(path):
+            paths.append(path)
+            continue
+        with open(path) as f:
+            if f.read() != source:
+                paths.append(path)
+    return paths
+
+
+def sync() -> list:
+    """ Write the copies differing from their source, returns their paths. """
+    paths = drifted()
+    for path, source in copies():
+        if path in paths:
+            with open(path, "w") as f:
+                f.write(source)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only list the copies differing from their source")
+    args = parser.parse_args()
+    paths = drifted() if args.check else sync()
+    for path in paths:
+        print(f"{'drifted' if args.check else 'updated'}: {os.path.relpath(path, ADVANCED_ANALYTICS)}")
+    if args.check and paths:
+        print("Edit the modules in data-pipelines/common/shared and run its sync.py.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,47 @@
 from investor_data import InvestorData
-from google.cloud import storage
+import object_store
 import os
+import run_telemetry
 
 
 def investor_risk_preferences(request, context) -> str:
     """ Generates investor risk preference data and stores to GCS.
+
+    The bucket is a local directory under STORAGE_ROOT when it is set, and unchanged data is not uploaded again.
+    Every run emits a structured record with its stages and status; a failed run is reported there and
+    raised, so the invocation is marked as failed, see `run_telemetry.py`.
     """
-    try:
+    with run_telemetry.RunTelemetry("investor-risk-preferences"):
         BUCKET_NAME = os.environ["BUCKET_NAME"]
         BLOB_NAME = os.environ["BLOB_NAME"]
-        investors = InvestorData()
-        investors.gen_all_features()
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(BUCKET_NAME)
-        bucket.blob(BLOB_NAME).upload_from_string(
-            investors._investor_data[["risk",
-                                    "clientID",
-                                    "dateID",
-                                    "avgMonthlyIncome",
-                                    "education",
-                                    "expSavings",
-                                    "expTransport",
-                                    "expGroceries",
-                                    "expLeisure",
-                                    "expShopping",
-                                    "expUtilities",
-                                    "expOther",
-                                    "cardLevel",
-                                    "amountDeposit",
-                                    "amountLoan",
-                                    "avgTransaction",
-                                    "avgNumTransactions",
-                                    "largestSingleTransaction"]].to_csv(index=False, header=None),
-            'text/csv')
-        print(f'Data has been written to {BUCKET_NAME}/{BLOB_NAME}.')
-        return 'OK'
-    except Exception as e:
-        print(e)
-        return 'Error'
+        with run_telemetry.stage("generate"):
+            investors = InvestorData()
+            investors.gen_all_features()
+            body = investors._investor_data[["risk",
+                                             "clientID",
+                                             "dateID",
+                                             "avgMonthlyIncome",
+                                             "education",
+                                             "expSavings",
+                                             "expTransport",
+                                             "expGroceries",
+                                             "expLeisure",
+                                             "expShopping",
+                                             "expUtilities",
+                                             "expOther",
+                                             "cardLevel",
+                                             "amountDeposit",
+                                             "amountLoan",
+                                             "avgTransaction",
+                                             "avgNumTransactions",
+                                             "largestSingleTransaction"]].to_csv(index=False, header=None)
+            run_telemetry.add(rowsOut=investors._investor_data.shape[0])
+        with run_telemetry.stage("upload"):
+            body = body.encode("utf-8")
+            uploaded = object_store.bucket(BUCKET_NAME).put(BLOB_NAME, body, 'text/csv')
+            if uploaded:
+                run_telemetry.add(bytesWritten=len(body))
+                print(f'Data has been written to {BUCKET_NAME}/{BLOB_NAME}.')
+            else:
+                print(f'Data in {BUCKET_NAME}/{BLOB_NAME} is unchanged.')
+    return 'OK'
@@ -0,0 +1,194 @@
+""" Structured telemetry of pipeline runs.
+
+A run times its stages and sums counters such as rowsIn, rowsOut, bytesRead, bytesWritten,
+providerCalls and retries per stage; the run totals sum them over the stages, except row counts,
+which only mean something per stage. When a run ends it emits one record:
+    - as a single JSON line on stderr, stored by Cloud Logging as a structured entry; stdout is
+      left to the output of command line tools such as the benchmarks
+    - appended to a local JSON-lines metrics file, so runs of a machine can be compared
+
+    {"pipeline": "capital-markets-returns", "runId": "20240628T010002-5f3a9c", "status": "ok",
+     "seconds": 41.2, "counters": {"bytesRead": 1814021, "bytesWritten": 1920344, ...},
+     "stages": [{"name": "fetch", "seconds": 12.9, "status": "ok", "counters": {...}}, ...]}
+
+The status is `ok`, `partial` when the run completed without some of its inputs (e.g. quarantined
+tickers) or `error`, with the exception type and message. The module-level `stage()` and `add()`
+report to the active run and do nothing without one, so pipeline classes work the same when they
+are used on their own.
+
+The temporary directory of a Cloud Function lives in memory and is lost with its instance, so
+deployed runs are compared across days from their Cloud Logging entries rather than the file.
+
+Optional environment variables:
+    - RUN_METRICS_FILE -- JSON-lines file the run records are appended to, defaults to
+      `pipeline-runs.jsonl` in the temporary directory, the only writable one of Cloud Functions
+"""
+
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("investor-risk-preferences")
+
+_active = None
+# per-stage only, a sum over the stages of a run is meaningless
+STAGE_COUNTERS = ("rowsIn", "rowsOut", "rowsFetched")
+
+
+def new_run_id() -> str:
+    """ Sortable, unique run ID, e.g. `20240628T010002-5f3a9c`. """
+    return f"{datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+class RunTelemetry:
+    """ Stage durations and counters of one pipeline run.
+
+    Public methods:
+        stage() -- context manager timing a stage.
+        add() -- add to counters of the open stage and of the run.
+        partial() -- mark the run as completed without some of its inputs.
+        record() -- the run record.
+        emit() -- write the record as one JSON line to stderr and append it to the metrics file.
+
+    Used as a context manager, the run is active while the context is open and its record is
+    emitted when it closes; an exception marks it as failed and is raised again.
+
+    Attributes:
+        pipeline -- pipeline name
+        runId -- unique run ID
+        metricsFile -- JSON-lines file the record is appended to
+        status -- `running`, `ok`, `partial` or `error`
+    """
+    def __init__(self, pipeline: str, runId: str = None, metricsFile: str = None):
+        self.pipeline: str = pipeline
+        self.runId: str = runId or new_run_id()
+        self.metricsFile: str = metricsFile or os.environ.get(
+            "RUN_METRICS_FILE", os.path.join(tempfile.gettempdir(), "pipeline-runs.jsonl"))
+        self.status: str = "running"
+        self.startedAt: str = None
+        self.finishedAt: str = None
+        self.seconds: float = None
+        self.error: dict = None
+        self.reasons: list = []
+        self.counters: dict = {}
+        self.stages: list = []
+        self._openStages: list = []
+        self._started: float = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        global _active
+        self.startedAt = datetime.datetime.utcnow().isoformat()
+        self._started = time.perf_counter()
+        _active = self
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        global _active
+        _active = None
+        self.seconds = round(time.perf_counter() - self._started, 3)
+        self.finishedAt = datetime.datetime.utcnow().isoformat()
+        if exc is not None:
+            self.status = "error"
+            self.error = {"type": excType.__name__, "message": str(exc)}
+        elif self.status == "running":
+            self.status = "ok"
+        self.emit()
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """ Time the stage `name`; counters added while it is open are attributed to it. """
+        entry = {"name": name, "seconds": None, "status": "running", "counters": {}}
+        with self._lock:
+            self.stages.append(entry)
+            self._openStages.append(entry)
+        started = time.perf_counter()
+        try:
+            yield entry
+            entry["status"] = "ok"
+        except BaseException:
+            entry["status"] = "error"
+            raise
+        finally:
+            entry["seconds"] = round(time.perf_counter() - started, 3)
+            with self._lock:
+                self._openStages.remove(entry)
+
+    def add(self, **counters) -> None:
+        """ Add to counters of the innermost open stage and of the run, e.g. `add(bytesWritten=1024)`. """
+        with self._lock:
+            for name, value in counters.items():
+                if self._openStages:
+                    stageCounters = self._openStages[-1]["counters"]
+                    stageCounters[name] = stageCounters.get(name, 0) + value
+                if name not in STAGE_COUNTERS:
+                    self.counters[name] = self.counters.get(name, 0) + value
+
+    def partial(self, reason: str) -> None:
+        """ Mark the run as completed without some of its inputs. """
+        self.status = "partial"
+        self.reasons.append(reason)
+
+    def record(self) -> dict:
+        return {
+            "pipeline": self.pipeline,
+            "runId": self.runId,
+            "status": self.status,
+            "startedAt": self.startedAt,
+            "finishedAt": self.finishedAt,
+            "seconds": self.seconds,
+            "reasons": self.reasons,
+            "error": self.error,
+            "counters": self.counters,
+            "stages": self.stages,
+        }
+
+    def emit(self) -> dict:
+        """ Write the record as one JSON line to stderr and append it to the metrics file. """
+        record = self.record()
+        line = json.dumps(record, default=str)
+        severity = "ERROR" if self.status == "error" else "WARNING" if self.status == "partial" else "INFO"
+        print(json.dumps({"severity": severity, "message": f"{self.pipeline} run {self.runId}: {self.status}",
+                          "run": record}, default=str), file=sys.stderr, flush=True)
+        try:
+            directory = os.path.dirname(self.metricsFile)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.metricsFile, "a") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write run metrics to {self.metricsFile}: {e}")
+        return record
+
+
+def active() -> RunTelemetry:
+    """ The run in progress, None outside of runs. """
+    return _active
+
+
+def stage(name: str):
+    """ `RunTelemetry.stage()` of the active run, a no-op context without one. """
+    run = _active
+    return run.stage(name) if run is not None else contextlib.nullcontext()
+
+
+def add(**counters) -> None:
+    """ `RunTelemetry.add()` of the active run, nothing without one. """
+    run = _active
+    if run is not None:
+        run.add(**counters)
+
+
+def partial(reason: str) -> None:
+    """ `RunTelemetry.partial()` of the active run, nothing without one. """
+    run = _active
+    if run is not None:
+        run.partial(reason)
@@ -0,0 +1,84 @@
+""" Payload size and parse time of price histories: `{timestamp: price}` objects vs the columnar layout.
+
+Histories come from the synthetic provider, so the benchmark runs offline. Parse time covers
+deserializing the body and building the `{int timestamp: Decimal price}` dict the backend uses.
+
+Usage, from the recommendation engine directory:
+    python benchmarks/history_payloads.py [--periods 5mo 1y 5y] [--repeat 200]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+import msgpack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import columnar  # noqa: E402
+import quote_providers  # noqa: E402
+
+
+def parse_object(body: bytes) -> dict:
+    return {int(timestamp): round(Decimal(price), 2) for timestamp, price in json.loads(body).items()}
+
+
+def parse_columnar(payload: dict) -> dict:
+    return {timestamp: round(Decimal(price), 2) for timestamp, price in columnar.decode(payload).items()}
+
+
+def encodings(prices) -> dict:
+    """ Body and parser of every encoding of one history. """
+    objectBody = prices.to_json().encode("utf-8")
+    payload = columnar.encode(prices)
+    columnarBody, _ = columnar.negotiate(payload)
+    msgpackBody, _ = columnar.negotiate(payload, accept="application/msgpack")
+    return {
+        "object": (objectBody, parse_object),
+        "object+gzip": (gzip.compress(objectBody), lambda body: parse_object(gzip.decompress(body))),
+        "columnar": (columnarBody, lambda body: parse_columnar(json.loads(body))),
+        "columnar+gzip": (gzip.compress(columnarBody), lambda body: parse_columnar(json.loads(gzip.decompress(body)))),
+        "msgpack": (msgpackBody, lambda body: parse_columnar(msgpack.unpackb(body))),
+        "msgpack+gzip": (gzip.compress(msgpackBody), lambda body: parse_columnar(msgpack.unpackb(gzip.decompress(body)))),
+    }
+
+
+def run(periods: list, repeat: int, ticker: str = "AAPL") -> list:
+    provider = quote_providers.SyntheticProvider()
+    rows = []
+    for period in periods:
+        prices = provider.history(ticker, period=period)["Open"]
+        for name, (body, parse) in encodings(prices).items():
+            seconds = min(timeit.repeat(lambda: parse(body), number=repeat, repeat=3)) / repeat
+            rows.append({
+                "period": period,
+                "points": int(prices.shape[0]),
+                "encoding": name,
+                "bytes": len(body),
+                "parseMicroseconds": round(seconds * 1e6, 1),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--periods", nargs="+", default=["5mo", "1y", "5y"])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print rows as JSON instead of a table")
+    args = parser.parse_args()
+    rows = run(args.periods, args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'period':>6} {'points':>6} {'encoding':>14} {'bytes':>8} {'parse, us':>10}")
+    for row in rows:
+        print(f"{row['period']:>6} {row['points']:>6} {row['encoding']:>14} {row['bytes']:>8} "
+              f"{row['parseMicroseconds']:>10}")
+
+
+if __name__ == "__main__":
+    main()
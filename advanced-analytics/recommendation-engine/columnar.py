@@ -0,0 +1,83 @@
+""" Compact columnar encoding of price histories.
+
+`{timestamp: price}` objects repeat a 13-digit timestamp string for every point. The columnar
+layout sends the first timestamp once, the gaps between points as small integers in units of
+a common step, and one array per value column:
+
+    {"start": 1609718400000, "step": 86400000, "deltas": [0, 1, 1, 3, ...],
+     "columns": {"price": [133.09, 128.48, 127.31, ...]}}
+
+Timestamps are recovered as `start + step * cumsum(deltas)`. Responses are negotiated as JSON
+or msgpack (`Accept: application/msgpack`) and gzip-compressed when the client accepts it.
+"""
+
+import gzip
+import json
+import math
+
+import msgpack
+import numpy as np
+import pandas as pd
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+# smaller bodies do not gain from compression
+GZIP_MIN_SIZE = 512
+
+
+def encode(data) -> dict:
+    """ Encode a date-indexed series (as `price`) or frame (one column per field, lower case).
+
+    Args:
+        data (pd.Series or pd.DataFrame): values indexed by date.
+
+    Returns:
+        dict: columnar payload.
+    """
+    frame = data.to_frame("price") if isinstance(data, pd.Series) else data.rename(columns=str.lower)
+    timestamps = np.asarray((frame.index - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1), dtype=np.int64)
+    gaps = np.diff(timestamps)
+    step = int(np.gcd.reduce(gaps)) if gaps.shape[0] > 0 else 1
+    step = step or 1
+    return {
+        "start": int(timestamps[0]) if timestamps.shape[0] > 0 else None,
+        "step": step,
+        "deltas": ([0] + (gaps // step).tolist()) if timestamps.shape[0] > 0 else [],
+        "columns": {
+            name: [None if value is None or math.isnan(value) else value for value in frame[name].tolist()]
+            for name in frame.columns
+        },
+    }
+
+
+def decode(payload: dict) -> dict:
+    """ Decode a columnar payload into `{timestamp: {column: value}}`, or `{timestamp: price}`. """
+    timestamps = (payload["start"] or 0) + payload["step"] * np.cumsum(payload["deltas"], dtype=np.int64)
+    columns = payload["columns"]
+    if list(columns) == ["price"]:
+        return dict(zip(timestamps.tolist(), columns["price"]))
+    rows = zip(*columns.values())
+    return {timestamp: dict(zip(columns, row)) for timestamp, row in zip(timestamps.tolist(), rows)}
+
+
+def negotiate(payload: dict, accept: str = None, acceptEncoding: str = None) -> tuple:
+    """ Serialize a payload as msgpack or JSON, gzip-compressed when accepted.
+
+    Args:
+        payload (dict): response payload.
+        accept (str, optional): value of the Accept header.
+        acceptEncoding (str, optional): value of the Accept-Encoding header.
+
+    Returns:
+        tuple: body bytes and response headers.
+    """
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if accept and any(contentType in accept for contentType in MSGPACK_TYPES):
+        body = msgpack.packb(payload)
+        headers["Content-Type"] = "application/msgpack"
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    if acceptEncoding and "gzip" in acceptEncoding and len(body) >= GZIP_MIN_SIZE:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
@@ -0,0 +1,86 @@
+""" Server-side reduction of price histories for charts.
+
+    - lttb() -- Largest-Triangle-Three-Buckets, keeps the points that preserve the visual shape of a line
+    - resample_ohlc() -- daily quotes aggregated into daily, weekly or monthly OHLCV bars
+"""
+
+import numpy as np
+import pandas as pd
+
+__valid_resolutions__ = {
+    "daily": "D",
+    "weekly": "W",
+    "monthly": "M",
+}
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """ Select `threshold` points of a line with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and the last points are always kept. Every other bucket contributes the point
+    forming the largest triangle with the point selected in the previous bucket and the
+    average of the next bucket.
+
+    Args:
+        x (np.ndarray): increasing x coordinates.
+        y (np.ndarray): y coordinates without NaN.
+        threshold (int): number of points to keep, at least 3.
+
+    Returns:
+        np.ndarray: sorted indices of the selected points.
+    """
+    n = x.shape[0]
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(float)
+    y = y.astype(float)
+    every = (n - 2) / (threshold - 2)
+    # bucket i spans [edges[i], edges[i + 1]) for i in 0 .. threshold - 3
+    edges = np.minimum(np.floor(np.arange(threshold) * every).astype(int) + 1, n - 1)
+    edges[-1] = n
+    cx = np.concatenate([[0.0], np.cumsum(x)])
+    cy = np.concatenate([[0.0], np.cumsum(y)])
+    counts = np.maximum(edges[2:] - edges[1:-1], 1)
+    averageX = (cx[edges[2:]] - cx[edges[1:-1]]) / counts
+    averageY = (cy[edges[2:]] - cy[edges[1:-1]]) / counts
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        areas = np.abs(
+            (x[a] - averageX[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (averageY[i] - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(series: pd.Series, points: int) -> pd.Series:
+    """ Reduce a date-indexed series to at most `points` values with LTTB. """
+    series = series.dropna()
+    if points is None or series.shape[0] <= points:
+        return series
+    x = (series.index - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    return series.iloc[lttb(np.asarray(x), series.to_numpy(dtype=float), points)]
+
+
+def resample_ohlc(frame: pd.DataFrame, resolution: str) -> pd.DataFrame:
+    """ Aggregate daily quotes into OHLCV bars.
+
+    Bars are labelled with the first trading day they contain.
+
+    Args:
+        frame (pd.DataFrame): daily Open, High, Low, Close and Volume indexed by date.
+        resolution (str): `daily`, `weekly` or `monthly`.
+
+    Returns:
+        pd.DataFrame: Open, High, Low, Close, Volume bars.
+    """
+    frame = frame.dropna(subset=["Close"])
+    periods = frame.index.to_period(__valid_resolutions__[resolution])
+    bars = frame.groupby(periods).agg({"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"})
+    firstDays = pd.Series(frame.index, index=frame.index).groupby(periods).first()
+    bars.index = pd.DatetimeIndex(firstDays.to_numpy(), name=frame.index.name)
+    return bars
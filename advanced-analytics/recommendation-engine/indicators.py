@@ -0,0 +1,112 @@
+""" Technical indicators computed for a whole universe in one vectorized pass.
+
+The input is a close price matrix (dates x tickers). Rolling windows are evaluated with
+cumulative sums, so every indicator costs O(dates x tickers) regardless of the window length.
+Windows run over each ticker's own quotes, so a day one ticker has no quote for, e.g. a
+holiday of its exchange, does not leave its indicators at the value before the gap:
+    - moving averages of the close price
+    - RSI as the ratio of average gains to average losses over the window (Cutler's RSI,
+      the simple-average variant that a cumulative sum can evaluate)
+    - annualized rolling volatility of daily returns
+    - current and maximum drawdown from the running peak
+    - beta of daily returns to the benchmark
+"""
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK = "SPY"
+MOVING_AVERAGE_WINDOWS = (20, 50, 200)
+RSI_WINDOW = 14
+VOLATILITY_WINDOW = 20
+TRADING_DAYS = 252
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """ Trailing sums over `window` rows; NaN where the window holds a NaN or is incomplete. """
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    counts = np.cumsum(valid, axis=0)
+    result = np.full(values.shape, np.nan)
+    if values.shape[0] < window:
+        return result
+    windowSums = sums[window - 1:].copy()
+    windowSums[1:] -= sums[:-window]
+    windowCounts = counts[window - 1:].copy()
+    windowCounts[1:] -= counts[:-window]
+    result[window - 1:] = np.where(windowCounts == window, windowSums, np.nan)
+    return result
+
+
+def compact(values: np.ndarray) -> np.ndarray:
+    """ Non-NaN values of every column moved to its top rows in their order, NaN below. """
+    order = np.argsort(np.isnan(values), axis=0, kind="stable")
+    return np.take_along_axis(values, order, axis=0)
+
+
+def last_valid(values: np.ndarray) -> np.ndarray:
+    """ Last non-NaN value of every column. """
+    valid = ~np.isnan(values)
+    fromEnd = np.cumsum(valid[::-1], axis=0)[::-1]
+    found = valid.any(axis=0)
+    return np.where(found, np.where(valid & (fromEnd == 1), values, 0.0).sum(axis=0), np.nan)
+
+
+def compute(closes: pd.DataFrame, benchmark: str = BENCHMARK) -> pd.DataFrame:
+    """ Latest indicator values of every ticker.
+
+    Args:
+        closes (pd.DataFrame): daily close prices, one column per ticker.
+        benchmark (str): ticker the betas are computed against. Defaults to SPY.
+
+    Returns:
+        pd.DataFrame: one row per ticker, NaN where the history is too short.
+    """
+    prices = closes.sort_index().to_numpy(dtype=float)
+    # rows of each ticker's own quotes, for the windows of every indicator but beta
+    quotes = compact(prices)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # beta pairs same-day returns, returns across gaps are left out rather than spanning several days
+        returns = np.full(prices.shape, np.nan)
+        returns[1:] = prices[1:] / prices[:-1] - 1.0
+        quoteReturns = np.full(quotes.shape, np.nan)
+        quoteReturns[1:] = quotes[1:] / quotes[:-1] - 1.0
+        result = {}
+        for window in MOVING_AVERAGE_WINDOWS:
+            result[f"ma_{window}"] = last_valid(rolling_sum(quotes, window) / window)
+
+        changes = np.full(quotes.shape, np.nan)
+        changes[1:] = quotes[1:] - quotes[:-1]
+        gains = rolling_sum(np.where(np.isnan(changes), np.nan, np.maximum(changes, 0.0)), RSI_WINDOW)
+        losses = rolling_sum(np.where(np.isnan(changes), np.nan, np.maximum(-changes, 0.0)), RSI_WINDOW)
+        rsi = np.where(losses == 0.0, np.where(gains == 0.0, 50.0, 100.0), 100.0 - 100.0 / (1.0 + gains / losses))
+        result[f"rsi_{RSI_WINDOW}"] = last_valid(np.where(np.isnan(gains), np.nan, rsi))
+
+        sums = rolling_sum(quoteReturns, VOLATILITY_WINDOW)
+        squares = rolling_sum(quoteReturns ** 2, VOLATILITY_WINDOW)
+        variance = np.maximum(squares - sums ** 2 / VOLATILITY_WINDOW, 0.0) / (VOLATILITY_WINDOW - 1)
+        result[f"volatility_{VOLATILITY_WINDOW}"] = last_valid(np.sqrt(variance * TRADING_DAYS))
+
+        peaks = np.fmax.accumulate(prices, axis=0)
+        drawdowns = prices / peaks - 1.0
+        result["drawdown"] = last_valid(drawdowns)
+        maxDrawdowns = np.min(np.where(np.isnan(drawdowns), np.inf, drawdowns), axis=0)
+        result["max_drawdown"] = np.where(np.isinf(maxDrawdowns), np.nan, maxDrawdowns)
+
+        result["beta"] = np.full(prices.shape[1], np.nan)
+        if benchmark in closes.columns:
+            market = returns[:, [closes.columns.get_loc(benchmark)]]
+            pairs = ~np.isnan(returns) & ~np.isnan(market)
+            n = pairs.sum(axis=0)
+            x = np.where(pairs, market, 0.0)
+            y = np.where(pairs, returns, 0.0)
+            covariance = (x * y).sum(axis=0) - x.sum(axis=0) * y.sum(axis=0) / n
+            marketVariance = (x ** 2).sum(axis=0) - x.sum(axis=0) ** 2 / n
+            result["beta"] = np.where(n > 2, covariance / marketVariance, np.nan)
+    return pd.DataFrame(result, index=closes.columns)
+
+
+def to_dict(frame: pd.DataFrame) -> dict:
+    """ Indicators keyed by ticker with NaN mapped to None. """
+    values = frame.astype(object).where(frame.notna(), None)
+    return {ticker: {name: value for name, value in row.items()} for ticker, row in values.iterrows()}
@@ -0,0 +1,263 @@
+""" Asynchronous job service for long-running analytics.
+
+Heavy computations (backtests, projections, batch recommendations) are submitted as jobs,
+executed by a local worker pool and polled for status and results, so they never tie up
+the threads serving synchronous requests.
+
+`jobs.py` reads optional env variables:
+    - JOBS_QUEUE -- queue backend: `memory` (default) or `local`, a spool directory
+      standing in for a managed queue such as Cloud Tasks or Pub/Sub
+    - JOBS_QUEUE_DIR -- spool directory of the `local` queue, defaults to /tmp/ipre-jobs
+    - JOBS_WORKERS -- number of worker threads, defaults to 2
+    - JOBS_RESULT_TTL -- seconds to keep finished jobs and their results, defaults to 3600
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("recommendation-engine")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    """ State of a single submitted computation.
+
+    Attributes:
+        jobId -- unique job ID
+        method -- name of the registered method to run
+        params -- keyword arguments of the method
+        key -- hash of method and params used for deduplication
+    """
+    def __init__(self, method: str, params: dict, key: str):
+        self.jobId: str = uuid.uuid4().hex
+        self.method: str = method
+        self.params: dict = params
+        self.key: str = key
+        self.status: str = QUEUED
+        self.progress: float = 0.0
+        self.result = None
+        self.error: str = None
+        self.submittedAt: float = time.time()
+        self.startedAt: float = None
+        self.finishedAt: float = None
+
+    def expired(self, ttl: float) -> bool:
+        return self.finishedAt is not None and time.time() - self.finishedAt > ttl
+
+    def to_dict(self) -> dict:
+        return {
+            "jobId": self.jobId,
+            "method": self.method,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "submittedAt": self.submittedAt,
+            "startedAt": self.startedAt,
+            "finishedAt": self.finishedAt,
+        }
+
+
+class MemoryQueue:
+    """ In-process FIFO queue of job messages. """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, message: dict) -> None:
+        self._queue.put(message)
+
+    def get(self, timeout: float = 1.0) -> dict:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalQueue:
+    """ Spool-directory queue, a local stand-in for a managed message queue.
+
+    Every message is a JSON file; a worker claims a message by atomically renaming it,
+    so it is delivered once. Job state lives in the submitting process, so use one
+    consumer process per spool directory.
+    """
+
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def put(self, message: dict) -> None:
+        name = f"{time.time_ns():020d}-{message['jobId']}"
+        tmpPath = os.path.join(self.directory, name + ".tmp")
+        with open(tmpPath, "w") as f:
+            json.dump(message, f)
+        os.replace(tmpPath, os.path.join(self.directory, name + ".json"))
+
+    def get(self, timeout: float = 1.0) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.directory, name)
+                claimedPath = path[:-len(".json")] + ".claimed"
+                try:
+                    os.rename(path, claimedPath)
+                except FileNotFoundError:
+                    continue  # claimed by another consumer
+                with open(claimedPath, "r") as f:
+                    message = json.load(f)
+                os.remove(claimedPath)
+                return message
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+
+def get_queue(backend: str = None):
+    """ Create the job queue selected by the JOBS_QUEUE env variable.
+
+    Args:
+        backend (str, optional): `memory` or `local`. Defaults to JOBS_QUEUE or `memory`.
+
+    Returns:
+        MemoryQueue or LocalQueue: job queue.
+    """
+    backend = backend or os.environ.get("JOBS_QUEUE", "memory")
+    if backend == "memory":
+        return MemoryQueue()
+    if backend == "local":
+        return LocalQueue(os.environ.get("JOBS_QUEUE_DIR", "/tmp/ipre-jobs"))
+    raise ValueError(f"Unknown job queue backend: {backend}")
+
+
+class JobManager:
+    """ Submit, deduplicate and execute jobs on a local worker pool.
+
+    Public methods:
+        submit() -- enqueue a job or return an identical one that is still valid.
+        get() -- look up a job by ID.
+
+    Attributes:
+        methods -- mapping of method names to callables allowed to run as jobs
+    """
+    def __init__(self, methods: dict, jobQueue=None, workers: int = None, resultTTL: float = None):
+        self.methods: dict = methods
+        self.queue = jobQueue if jobQueue is not None else get_queue()
+        self.workers: int = workers or int(os.environ.get("JOBS_WORKERS", 2))
+        self.resultTTL: float = resultTTL or float(os.environ.get("JOBS_RESULT_TTL", 3600))
+        self.jobs: dict = {}
+        self.jobsByKey: dict = {}
+        self._lock = threading.Lock()
+        self._threads: list = []
+
+    @staticmethod
+    def make_key(method: str, params: dict) -> str:
+        """ Hash method name and parameters into a deduplication key. """
+        payload = json.dumps([method, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def submit(self, method: str, params: dict) -> Job:
+        """ Enqueue a job unless an identical one is queued, running or has a fresh result.
+
+        Args:
+            method (str): name of a registered method.
+            params (dict): keyword arguments of the method.
+
+        Returns:
+            Job: new or deduplicated job.
+        """
+        if method not in self.methods:
+            raise KeyError(method)
+        key = self.make_key(method, params)
+        with self._lock:
+            self._purge()
+            job = self.jobsByKey.get(key)
+            if job is not None and job.status != FAILED:
+                logger.debug(f"Job {job.jobId} reused for {method}.")
+                return job
+            job = Job(method, params, key)
+            self.jobs[job.jobId] = job
+            self.jobsByKey[key] = job
+        self._start_workers()
+        self.queue.put({"jobId": job.jobId, "method": method, "params": params})
+        logger.debug(f"Job {job.jobId} submitted for {method}.")
+        return job
+
+    def get(self, jobId: str) -> Job:
+        """ Look up a job, dropping it if its result has expired.
+
+        Args:
+            jobId (str): job ID returned by submit().
+
+        Returns:
+            Job: the job or None if unknown or expired.
+        """
+        with self._lock:
+            job = self.jobs.get(jobId)
+            if job is not None and job.expired(self.resultTTL):
+                self._drop(job)
+                job = None
+        return job
+
+    def _drop(self, job: Job) -> None:
+        self.jobs.pop(job.jobId, None)
+        if self.jobsByKey.get(job.key) is job:
+            del self.jobsByKey[job.key]
+
+    def _purge(self) -> None:
+        for job in [job for job in self.jobs.values() if job.expired(self.resultTTL)]:
+            self._drop(job)
+
+    def _start_workers(self) -> None:
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for _ in range(self.workers - len(self._threads)):
+                thread = threading.Thread(target=self._work, name="ipre-job-worker", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            message = self.queue.get()
+            if message is None:
+                continue
+            with self._lock:
+                job = self.jobs.get(message["jobId"])
+            if job is None:
+                logger.warning(f"Dropping message for unknown job {message['jobId']}.")
+                continue
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        def report(fraction: float) -> None:
+            job.progress = min(max(float(fraction), 0.0), 1.0)
+
+        func = self.methods[job.method]
+        kwargs = dict(job.params)
+        if "progress" in inspect.signature(func).parameters:
+            kwargs["progress"] = report
+        job.status = RUNNING
+        job.startedAt = time.time()
+        # the status comes last, a finished job polled in between always has its end time
+        try:
+            job.result = func(**kwargs)
+            job.progress = 1.0
+            job.finishedAt = time.time()
+            job.status = DONE
+        except Exception as e:
+            logger.exception(f"Job {job.jobId} failed.")
+            job.error = str(e)
+            job.finishedAt = time.time()
+            job.status = FAILED
+        logger.debug(f"Job {job.jobId} {job.status} in {job.finishedAt - job.startedAt:.3f}s.")
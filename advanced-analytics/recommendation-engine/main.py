@@ -5,13 +5,27 @@ The IPRE service takes two arguments:
     2/ riskAversion (optional, float) -- risk-aversion factor in a range from 0.0 to 1.0.
 
 The IPRE service returns recommendation of investment products with portfolio analytics
-in a form of JSON. """
+in a form of JSON.
+
+Long-running computations are submitted to `/jobs/` and polled via `/jobs/<job_id>`,
+`/jobs/<job_id>/result` instead of blocking a serving thread: single recommendations, batches
+of them (`uuids`), Monte Carlo projections (`years`, `paths`, `seed`) and backtests.
+
+Price updates of watched tickers are pushed as server-sent events from `/stat/stream`. """
 
 import os
 
-from flask import Flask, request
+from flask import Flask, Response, g, request
 
+import columnar
+import downsampling
+import jobs
+import price_stream
+import profiler
+import quote_providers
 import recommendation_engine
+import search
+import singleflight
 import statistics
 
 __valid_uuids__ = [
@@ -20,20 +34,124 @@ __valid_uuids__ = [
     "user-0000000000000999"
 ]
 
+# jobs recommending to a single investor, their params are validated like `/recommend/`
+SINGLE_INVESTOR_JOBS = ('make_recommendation', 'project_portfolio', 'backtest_recommendation')
+MAX_BATCH_UUIDS = 1000
+MAX_PROJECTION_YEARS = 50
+PROJECTION_PATHS = (100, 100000)
+
 app = Flask(__name__)
 
+job_manager = jobs.JobManager(
+    methods={name: getattr(recommendation_engine, name) for name in recommendation_engine.__valid_methods__}
+)
+
+request_profiler = profiler.Profiler()
+
+# identical concurrent requests share one computation
+flights = singleflight.SingleFlight()
+
+price_updates = price_stream.PriceStream(statistics.cache)
+
+ticker_index = search.SearchIndex(statistics.tickers_description, statistics.tickers_exchange)
+
+
+@app.before_request
+def begin_profiling():
+    if request_profiler.active and not request.path.startswith('/admin/'):
+        g.profile_token = request_profiler.begin(request.path)
+
+
+@app.teardown_request
+def end_profiling(exc):
+    if 'profile_token' in g:
+        request_profiler.end(g.pop('profile_token'))
+
+
+def validate_recommendation_args(uuid, riskAversion):
+    """ Returns an error message for invalid recommendation arguments, None otherwise. """
+    if not uuid:
+        return 'UUID is not specified'
+    if uuid not in __valid_uuids__:
+        return 'Received unexpected UUID'
+    if riskAversion and (riskAversion < 0.0 or riskAversion > 1.0):
+        return 'Received invalid risk aversion'
+    return None
+
+
+def parse_job_params(method, params):
+    """ Returns an error message and the validated keyword arguments of a job. """
+    try:
+        riskAversion = params.get('riskAversion')
+        riskAversion = float(riskAversion) if riskAversion is not None else None
+    except (TypeError, ValueError):
+        return 'Received invalid risk aversion', None
+    if method == 'make_recommendations':
+        uuids = params.get('uuids')
+        if not isinstance(uuids, list) or not uuids:
+            return 'UUIDs are not specified', None
+        if len(uuids) > MAX_BATCH_UUIDS:
+            return f'Received more than {MAX_BATCH_UUIDS} UUIDs', None
+        for uuid in uuids:
+            error = validate_recommendation_args(uuid, riskAversion)
+            if error:
+                return error, None
+        return None, {'uuids': list(dict.fromkeys(uuids)), 'riskAversion': riskAversion}
+    if method not in SINGLE_INVESTOR_JOBS:
+        return None, params
+    error = validate_recommendation_args(params.get('uuid'), riskAversion)
+    if error:
+        return error, None
+    kwargs = {'uuid': params['uuid'], 'riskAversion': riskAversion}
+    if method == 'project_portfolio':
+        try:
+            years = int(params.get('years', 10))
+            paths = int(params.get('paths', 10000))
+            seed = int(params['seed']) if params.get('seed') is not None else None
+        except (TypeError, ValueError):
+            return 'Received invalid projection settings', None
+        if not 1 <= years <= MAX_PROJECTION_YEARS:
+            return 'Received invalid number of years', None
+        if not PROJECTION_PATHS[0] <= paths <= PROJECTION_PATHS[1]:
+            return 'Received invalid number of paths', None
+        kwargs.update(years=years, paths=paths, seed=seed)
+    return None, kwargs
+
+
+def parse_history_args(args):
+    """ Returns an error message and the period, points, resolution and layout of a history request. """
+    period = args.get('period', '5mo')
+    points = args.get('points', None, type=int)
+    resolution = args.get('resolution')
+    layout = args.get('format', 'object')
+    if quote_providers.period_offset(period) is None and period != 'max':
+        return 'Received invalid period', None
+    if 'points' in args and (points is None or points < 3):
+        return 'Received invalid number of points', None
+    if resolution is not None and resolution not in downsampling.__valid_resolutions__:
+        return 'Received invalid resolution', None
+    if resolution is not None and points is not None:
+        return 'Specify either a number of points or a resolution', None
+    if layout not in ('object', 'columnar'):
+        return 'Received invalid format', None
+    return None, (period, points, resolution, layout)
+
+
+def columnar_response(payload):
+    body, headers = columnar.negotiate(payload, request.headers.get('Accept'), request.headers.get('Accept-Encoding'))
+    return Response(body, headers=headers)
+
 
 @app.route('/', methods=['GET'])
 def re_engine():
     uuid = request.args.get('uuid')
     riskAversion = request.args.get('riskAversion', None, type=float)
-    if not uuid:
-        return 'UUID is not specified', 400
-    if uuid not in __valid_uuids__:
-        return 'Received unexpected UUID', 400
-    if riskAversion and (riskAversion < 0.0 or riskAversion > 1.0):
-        return 'Received invalid risk aversion', 400
-    result = recommendation_engine.make_recommendation(
+    error = validate_recommendation_args(uuid, riskAversion)
+    if error:
+        return error, 400
+    result = flights.do(
+        ('make_recommendation', uuid, riskAversion),
+        recommendation_engine.make_recommendation,
         uuid=uuid,
         riskAversion=riskAversion,
     )
@@ -42,26 +160,193 @@ def re_engine():
 
 @app.route('/stat/', methods=['GET'])
 def basic_stat():
-    asset_name = request.args.get('asset_name')
+    asset_name = request.args.get('asset_name', '').strip()
     if not asset_name:
         return 'Asset name is not specified', 400
-    return statistics.basic(asset_name)
+    return flights.do(('basic', asset_name), statistics.basic, asset_name)
+
+
+@app.route('/stat/batch', methods=['GET', 'POST'])
+def batch_stat():
+    """ Basic statistics for several assets: `?asset_name=A,B,C` or POST `{"asset_names": [...]}`. """
+    if request.method == 'POST':
+        asset_names = (request.get_json(silent=True) or {}).get('asset_names')
+        if not isinstance(asset_names, list):
+            return 'Asset names must be a list', 400
+    else:
+        asset_names = request.args.get('asset_name', '').split(',')
+    asset_names = list(dict.fromkeys(str(name).strip() for name in asset_names if str(name).strip()))
+    if not asset_names:
+        return 'Asset name is not specified', 400
+    return flights.do(('batch', *sorted(asset_names)), statistics.batch, sorted(asset_names))
 
 
 @app.route('/stat/detailed/', methods=['GET'])
 def detailed_stat():
-    asset_name = request.args.get('asset_name')
+    asset_name = request.args.get('asset_name', '').strip()
     if not asset_name:
         return 'Asset name is not specified', 400
-    return statistics.detailed(asset_name)
+    return flights.do(('detailed', asset_name), statistics.detailed, asset_name)
+
+
+@app.route('/stat/indicators/', methods=['GET'])
+def indicators_stat():
+    """ Technical indicators for `?asset_name=A,B,C`, or for the whole universe without asset names. """
+    asset_names = [name.strip() for name in request.args.get('asset_name', '').split(',') if name.strip()]
+    asset_names = list(dict.fromkeys(asset_names)) or None
+    return flights.do(
+        ('indicators', *(asset_names or [])), statistics.technical_indicators, asset_names
+    )
 
 
 @app.route('/stat/history/', methods=['GET'])
 def history():
-    asset_name = request.args.get('asset_name')
+    """ History for `period` (default 5mo), reduced to `points` prices or aggregated to `resolution` bars.
+
+    `format=columnar` returns the compact columnar layout, as JSON or msgpack, optionally gzipped.
+    """
+    asset_name = request.args.get('asset_name', '').strip()
+    if not asset_name:
+        return 'Asset name is not specified', 400
+    error, history_args = parse_history_args(request.args)
+    if error:
+        return error, 400
+    period, points, resolution, layout = history_args
+    result = flights.do(
+        ('history', asset_name, *history_args),
+        statistics.history, asset_name, period, points, resolution, layout,
+    )
+    return columnar_response(result) if layout == 'columnar' else result
+
+
+@app.route('/stat/full/', methods=['GET'])
+def full_stat():
+    """ Detailed statistics with the history for `period`, optionally reduced to `points` or in `format=columnar`. """
+    asset_name = request.args.get('asset_name', '').strip()
     if not asset_name:
         return 'Asset name is not specified', 400
-    return statistics.history(asset_name)
+    error, history_args = parse_history_args(request.args)
+    if error:
+        return error, 400
+    period, points, resolution, layout = history_args
+    if resolution is not None:
+        return 'Resolution is not supported for full statistics', 400
+    result = flights.do(('full', asset_name, period, points, layout), statistics.full, asset_name, period, points, layout)
+    return columnar_response(result) if layout == 'columnar' else result
+
+
+@app.route('/stat/stream', methods=['GET'])
+def stream_stat():
+    """ Streams `{"TICKER": {"p": price, "c": change for day %, "t": ms timestamp}}` deltas as SSE. """
+    asset_names = [name.strip() for name in request.args.get('asset_name', '').split(',') if name.strip()]
+    if not asset_names:
+        return 'Asset name is not specified', 400
+    subscription = price_updates.subscribe(asset_names)
+    if subscription is None:
+        return 'Too many price streams', 503, {'Retry-After': str(max(int(price_updates.interval), 1))}
+    return Response(
+        price_updates.events(subscription),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/search', methods=['GET'])
+def search_tickers():
+    """ Prefix and fuzzy search over ticker symbols and long names: `?q=app&limit=10&fuzzy=true`. """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return 'Search query is not specified', 400
+    limit = request.args.get('limit', 10, type=int)
+    if limit is None or limit < 1 or limit > 100:
+        return 'Received invalid limit', 400
+    fuzzy = request.args.get('fuzzy', 'true').lower() != 'false'
+    return {'results': ticker_index.search(query, limit=limit, fuzzy=fuzzy)}
+
+
+@app.route('/jobs/', methods=['POST'])
+def submit_job():
+    """ Submits `{"method": ..., "params": {...}}` and returns the job status with 202. """
+    body = request.get_json(silent=True) or {}
+    method = body.get('method')
+    params = body.get('params') or {}
+    if method not in job_manager.methods:
+        return 'Received unexpected method', 400
+    if not isinstance(params, dict):
+        return 'Job params must be an object', 400
+    error, params = parse_job_params(method, params)
+    if error:
+        return error, 400
+    job = job_manager.submit(method, params)
+    return job.to_dict(), 202, {'Location': f'/jobs/{job.jobId}'}
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return 'Job not found', 404
+    return job.to_dict()
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return 'Job not found', 404
+    if job.status == jobs.FAILED:
+        return job.to_dict(), 500
+    if job.status != jobs.DONE:
+        return job.to_dict(), 202
+    return job.result
+
+
+@app.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def profile():
+    """ Arms (POST), reports (GET) or stops (DELETE) a profiling session.
+
+    POST accepts JSON `{"mode": "sampling"|"cprofile", "requests": N | "seconds": T,
+    "interval": 0.005, "tracemalloc": false}`. GET with `format=collapsed` returns
+    the collapsed stacks as plain text for flame graph tools.
+    """
+    if not request_profiler.enabled:
+        return 'Not found', 404
+    if not request_profiler.authorized(request.headers.get('Authorization')):
+        return 'Unauthorized', 401
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        try:
+            session = request_profiler.start(
+                mode=body.get('mode', 'sampling'),
+                requests=int(body['requests']) if body.get('requests') else None,
+                seconds=float(body['seconds']) if body.get('seconds') else None,
+                interval=float(body.get('interval', 0.005)),
+                traceMemory=bool(body.get('tracemalloc', False)),
+            )
+        except (TypeError, ValueError) as e:
+            return str(e), 400
+        except RuntimeError as e:
+            return str(e), 409
+        return session.to_dict(), 202
+    if request.method == 'DELETE':
+        request_profiler.stop()
+    report = request_profiler.report()
+    if request.args.get('format') == 'collapsed':
+        return report.get('collapsed', ''), 200, {'Content-Type': 'text/plain'}
+    return report
+
+
+@app.route('/admin/coalescing', methods=['GET'])
+def coalescing():
+    """ Reports single-flight metrics of request computations and quote refreshes. """
+    if not request_profiler.enabled:
+        return 'Not found', 404
+    if not request_profiler.authorized(request.headers.get('Authorization')):
+        return 'Unauthorized', 401
+    return {
+        'requests': flights.metrics(),
+        'quotes': statistics.cache.flights.metrics(),
+    }
 
 
 if __name__ == '__main__':
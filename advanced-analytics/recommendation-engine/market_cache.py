@@ -0,0 +1,229 @@
+""" Shared in-process cache of daily market data.
+
+One year of daily OHLCV is kept per ticker and every statistics function reads from the same
+frame, so outbound calls drop from one per request to one per ticker per refresh. Entries
+expire quickly while the US market is open and are kept until the next session once it closed.
+
+`market_cache.py` reads optional env variables:
+    - MARKET_CACHE_OPEN_TTL -- seconds to keep quotes during market hours, defaults to 60
+    - MARKET_CACHE_CLOSED_TTL -- max seconds to keep quotes outside market hours, defaults to 43200
+    - MARKET_CACHE_MAX_ENTRIES -- max number of tickers kept, defaults to 512; expired entries are
+      dropped first, then the least recently fetched ones
+"""
+
+import datetime
+import logging
+import os
+import threading
+import time
+import zoneinfo
+
+import pandas as pd
+
+import quote_providers
+import singleflight
+
+logger = logging.getLogger("recommendation-engine")
+
+MARKET_TIMEZONE = zoneinfo.ZoneInfo("America/New_York")
+MARKET_OPEN = datetime.time(9, 30)
+# closing prices keep settling for a while after the bell
+MARKET_SETTLED = datetime.time(16, 20)
+# max number of values derived from quotes, e.g. resampled histories
+DERIVED_ENTRIES = 1024
+
+
+def market_is_open(now: datetime.datetime = None) -> bool:
+    """ Whether quotes may still change: a weekday between the open and the settled close. """
+    now = (now or datetime.datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_SETTLED
+
+
+def last_settled_session(now: datetime.datetime = None) -> datetime.date:
+    """ Date of the last trading session whose closing prices settled, ignoring exchange holidays. """
+    now = (now or datetime.datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    day = now.date() if now.time() >= MARKET_SETTLED else now.date() - datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    return day
+
+
+def next_market_open(now: datetime.datetime = None) -> datetime.datetime:
+    """ Start of the next trading session, ignoring exchange holidays. """
+    now = (now or datetime.datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    day = now.date() if now.time() < MARKET_OPEN else now.date() + datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, MARKET_OPEN, tzinfo=MARKET_TIMEZONE)
+
+
+class MarketDataCache:
+    """ Per-ticker cache of daily OHLCV frames with a market-hours aware TTL.
+
+    Public methods:
+        get() -- cached frame for a ticker, fetched on a miss or after expiry.
+        get_many() -- cached frames for several tickers, misses fetched in one bulk download.
+        history() -- trailing window of the cached frame for a yfinance period.
+        memoize() -- value derived from the quotes of a ticker, kept as long as the quotes.
+        invalidate() -- drop one or all tickers.
+
+    Attributes:
+        provider -- market data provider, see `quote_providers.py`
+        period -- yfinance period held for every ticker
+        openTTL -- seconds to keep an entry while the market is open
+        closedTTL -- upper bound for keeping an entry while the market is closed
+        maxEntries -- max number of tickers kept
+        flights -- coalesces concurrent refreshes of the same ticker
+    """
+    def __init__(self, provider: quote_providers.QuoteProvider = None, period: str = "1y",
+                 openTTL: float = None, closedTTL: float = None, maxEntries: int = None):
+        self.provider: quote_providers.QuoteProvider = provider or quote_providers.get_provider()
+        self.period: str = period
+        self.openTTL: float = openTTL or float(os.environ.get("MARKET_CACHE_OPEN_TTL", 60))
+        self.closedTTL: float = closedTTL or float(os.environ.get("MARKET_CACHE_CLOSED_TTL", 43200))
+        self.maxEntries: int = maxEntries or int(os.environ.get("MARKET_CACHE_MAX_ENTRIES", 512))
+        self.entries: dict = {}
+        self.derived: dict = {}
+        self.fetches: int = 0
+        self.flights: singleflight.SingleFlight = singleflight.SingleFlight()
+        self._lock = threading.Lock()
+
+    def fetch(self, ticker: str, period: str) -> pd.DataFrame:
+        return self.provider.history(ticker, period=period)
+
+    def fetch_many(self, tickers: list, period: str) -> dict:
+        data = self.provider.download(tickers, period=period, auto_adjust=True)
+        if data.shape[0] == 0:
+            return {}
+        fetched = set(data.columns.get_level_values(1))
+        return {ticker: data.xs(ticker, axis=1, level=1) for ticker in tickers if ticker in fetched}
+
+    def ttl(self, now: datetime.datetime = None) -> float:
+        """ Seconds a freshly fetched entry stays valid. """
+        now = now or datetime.datetime.now(MARKET_TIMEZONE)
+        if market_is_open(now):
+            return self.openTTL
+        untilOpen = (next_market_open(now) - now).total_seconds()
+        return max(min(self.closedTTL, untilOpen), self.openTTL)
+
+    @staticmethod
+    def clean(frame: pd.DataFrame) -> pd.DataFrame:
+        frame = frame.dropna(subset=["Close"])
+        if frame.index.tz is not None:
+            # daily bars are keyed by exchange-local dates, align single and bulk downloads
+            frame = frame.tz_localize(None)
+        return frame
+
+    def _count_fetch(self) -> None:
+        with self._lock:
+            self.fetches += 1
+
+    def put(self, ticker: str, frame: pd.DataFrame) -> pd.DataFrame:
+        frame = self.clean(frame)
+        if frame.shape[0] > 0:
+            now = time.time()
+            with self._lock:
+                # tickers are requested by clients, keep the most recently fetched ones only
+                self.entries.pop(ticker, None)
+                if len(self.entries) >= self.maxEntries:
+                    self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+                    while len(self.entries) >= self.maxEntries:
+                        self.entries.pop(next(iter(self.entries)))
+                self.entries[ticker] = (now + self.ttl(), frame)
+        return frame
+
+    def get(self, ticker: str) -> pd.DataFrame:
+        """ Daily OHLCV frame for the cached period.
+
+        Args:
+            ticker (str): asset ticker.
+
+        Returns:
+            pd.DataFrame: daily quotes with non-empty Close prices.
+        """
+        entry = self.entries.get(ticker)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        return self.flights.do(("quotes", ticker), self._refresh, ticker)
+
+    def _refresh(self, ticker: str) -> pd.DataFrame:
+        entry = self.entries.get(ticker)
+        if entry is not None and entry[0] > time.time():
+            # refreshed by a call that finished just before this one started
+            return entry[1]
+        logger.debug(f"Refreshing {self.period} quotes for {ticker}.")
+        self._count_fetch()
+        return self.put(ticker, self.fetch(ticker, self.period))
+
+    def get_many(self, tickers: list) -> dict:
+        """ Daily OHLCV frames for several tickers.
+
+        Args:
+            tickers (list): asset tickers.
+
+        Returns:
+            dict: frames keyed by ticker; tickers without data are left out.
+        """
+        now = time.time()
+        frames, missing = {}, []
+        for ticker in tickers:
+            entry = self.entries.get(ticker)
+            if entry is not None and entry[0] > now:
+                frames[ticker] = entry[1]
+            else:
+                missing.append(ticker)
+        if missing:
+            logger.debug(f"Refreshing {self.period} quotes for {len(missing)} tickers in one download.")
+            self._count_fetch()
+            for ticker, frame in self.fetch_many(missing, self.period).items():
+                frame = self.put(ticker, frame)
+                if frame.shape[0] > 0:
+                    frames[ticker] = frame
+        return frames
+
+    def history(self, ticker: str, period: str) -> pd.DataFrame:
+        """ Trailing window of daily quotes for a yfinance period.
+
+        Periods longer than the cached one are fetched directly and are not cached.
+        """
+        offset = quote_providers.period_offset(period)
+        cachedOffset = quote_providers.period_offset(self.period)
+        today = pd.Timestamp.now()
+        if offset is None or today - offset < today - cachedOffset:
+            self._count_fetch()
+            return self.clean(self.fetch(ticker, period))
+        frame = self.get(ticker)
+        return frame.loc[frame.index >= frame.index[-1] - offset]
+
+    def memoize(self, key: tuple, compute, *args):
+        """ Value derived from quotes, computed once per quote refresh.
+
+        Args:
+            key (tuple): ticker, or None for values derived from several tickers, followed by
+                the parameters of the derived value.
+            compute (callable): function computing the value from `args`.
+
+        Returns:
+            Cached or freshly computed value.
+        """
+        entry = self.derived.get(key)
+        now = time.time()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        value = compute(*args)
+        with self._lock:
+            if len(self.derived) >= DERIVED_ENTRIES:
+                self.derived = {k: v for k, v in self.derived.items() if v[0] > now}
+                while len(self.derived) >= DERIVED_ENTRIES:
+                    self.derived.pop(next(iter(self.derived)))
+            self.derived[key] = (now + self.ttl(), value)
+        return value
+
+    def invalidate(self, ticker: str = None) -> None:
+        with self._lock:
+            if ticker is None:
+                self.entries.clear()
+                self.derived.clear()
+            else:
+                self.entries.pop(ticker, None)
+                self.derived = {key: value for key, value in self.derived.items() if key[0] not in (ticker, None)}
@@ -0,0 +1,225 @@
+""" Object storage: GCS buckets or local directories behind one interface.
+
+A store is selected by the URL scheme of its root, `gs://bucket[/prefix]` for GCS and a path
+or `file://` URL for a local directory. Bucket names are resolved with `bucket()`: they map to
+GCS buckets, or to `<STORAGE_ROOT>/<bucket>` directories when STORAGE_ROOT is set, so the
+pipelines and the recommendation engine run and can be benchmarked fully offline.
+
+Every write records the content hash of the object, as GCS custom metadata or a hidden
+`.<name>.metadata.json` file locally, and is skipped when the stored object already has the
+same hash, so unchanged outputs are not uploaded again.
+
+Optional environment variables:
+    - STORAGE_ROOT -- local directory holding one subdirectory per bucket; GCS is used when not set
+"""
+
+import abc
+import contextlib
+import hashlib
+import json
+import logging
+import os
+
+import fsspec
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+
+logger = logging.getLogger("recommendation-engine")
+
+SEPARATOR = "/"
+HASH_KEY = "contentHash"
+
+
+def content_hash(body: bytes) -> str:
+    return f"sha256:{hashlib.sha256(body).hexdigest()}"
+
+
+class ObjectStore(abc.ABC):
+    """ Base class of object stores.
+
+    Public methods:
+        url() -- URL of an object for `fsspec`-based readers such as `pd.read_csv`.
+        put() -- write bytes unless the object already holds them.
+        put_stream() -- write an object through a file object unless its content hash is unchanged.
+        read_bytes() -- content of an object, None if it does not exist.
+        stored_hash() -- content hash recorded with an object, None if unknown.
+
+    Attributes:
+        root -- URL or path of the store
+    """
+    def __init__(self, root: str):
+        self.root: str = root.rstrip(SEPARATOR)
+
+    def url(self, name: str) -> str:
+        return SEPARATOR.join([self.root, name])
+
+    @abc.abstractmethod
+    def stored_hash(self, name: str) -> str:
+        """ Content hash recorded with an object, None if unknown. """
+
+    @abc.abstractmethod
+    def read_bytes(self, name: str) -> bytes:
+        """ Content of an object, None if it does not exist. """
+
+    @abc.abstractmethod
+    def _write(self, name: str, body: bytes, contentType: str, contentHash: str) -> None:
+        """ Write an object with its content type and hash. """
+
+    @abc.abstractmethod
+    def _open_write(self, name: str, contentType: str, contentHash: str, **options):
+        """ Writable file object of an object, stored with its content type and hash. """
+
+    def unchanged(self, name: str, contentHash: str) -> bool:
+        if contentHash is not None and self.stored_hash(name) == contentHash:
+            logger.info(f"Skip uploading unchanged {self.url(name)}.")
+            return True
+        return False
+
+    def put(self, name: str, body, contentType: str = "application/octet-stream") -> bool:
+        """ Write `body` unless the object already holds it.
+
+        Args:
+            name (str): object name.
+            body (bytes or str): content, strings are UTF-8 encoded.
+            contentType (str): content type of the object.
+
+        Returns:
+            bool: whether the object was written.
+        """
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        contentHash = content_hash(body)
+        if self.unchanged(name, contentHash):
+            return False
+        self._write(name, body, contentType, contentHash)
+        return True
+
+    def put_stream(self, name: str, write, contentType: str, contentHash: str = None, force: bool = False,
+                   **options) -> bool:
+        """ Write an object by calling `write(f)` with a binary file object.
+
+        Args:
+            name (str): object name.
+            write (callable): writes the content into the file object it is given.
+            contentType (str): content type of the object.
+            contentHash (str, optional): hash identifying the content; the write is skipped when the
+                object was written with the same hash.
+            force (bool): write even if the content hash is unchanged, e.g. to repair a sidecar.
+            options: backend specific `fsspec.open` options, e.g. `block_size`.
+
+        Returns:
+            bool: whether the object was written.
+        """
+        if not force and self.unchanged(name, contentHash):
+            return False
+        with self._open_write(name, contentType, contentHash, **options) as f:
+            write(f)
+        return True
+
+
+class GCSStore(ObjectStore):
+    """ Objects of a GCS bucket, optionally under a prefix. """
+    scheme = "gs"
+
+    def __init__(self, root: str):
+        super().__init__(root)
+        path = self.root[len("gs://"):]
+        self.bucketName, _, self.prefix = path.partition(SEPARATOR)
+        self._bucket: storage.Bucket = None
+
+    @property
+    def bucket(self) -> storage.Bucket:
+        if self._bucket is None:
+            self._bucket = storage.Client().bucket(self.bucketName)
+        return self._bucket
+
+    def key(self, name: str) -> str:
+        return SEPARATOR.join([self.prefix, name]) if self.prefix else name
+
+    def stored_hash(self, name: str) -> str:
+        blob = self.bucket.get_blob(self.key(name))
+        return (blob.metadata or {}).get(HASH_KEY) if blob is not None else None
+
+    def read_bytes(self, name: str) -> bytes:
+        try:
+            return self.bucket.blob(self.key(name)).download_as_bytes()
+        except NotFound:
+            return None
+
+    def _write(self, name: str, body: bytes, contentType: str, contentHash: str) -> None:
+        blob = self.bucket.blob(self.key(name))
+        blob.metadata = {HASH_KEY: contentHash}
+        blob.upload_from_string(body, contentType)
+
+    def _open_write(self, name: str, contentType: str, contentHash: str, **options):
+        metadata = {HASH_KEY: contentHash} if contentHash else None
+        return fsspec.open(self.url(name), "wb", content_type=contentType, metadata=metadata, **options)
+
+
+class LocalStore(ObjectStore):
+    """ Files of a local directory; content hashes are kept in hidden sidecar files. """
+    scheme = "file"
+
+    def __init__(self, root: str):
+        super().__init__(root[len("file://"):] if root.startswith("file://") else root)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split(SEPARATOR))
+
+    def metadata_path(self, name: str) -> str:
+        directory, base = os.path.split(self.path(name))
+        return os.path.join(directory, f".{base}.metadata.json")
+
+    def stored_hash(self, name: str) -> str:
+        try:
+            with open(self.metadata_path(name), "r") as f:
+                metadata = json.load(f)
+            stat = os.stat(self.path(name))
+        except (OSError, ValueError):
+            return None
+        # a file changed by anything else than the store no longer matches its recorded hash
+        if metadata.get("size") != stat.st_size or metadata.get("mtime") != stat.st_mtime_ns:
+            return None
+        return metadata.get(HASH_KEY)
+
+    def read_bytes(self, name: str) -> bytes:
+        try:
+            with open(self.path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _record(self, name: str, contentType: str, contentHash: str) -> None:
+        stat = os.stat(self.path(name))
+        with open(self.metadata_path(name), "w") as f:
+            json.dump({HASH_KEY: contentHash, "contentType": contentType, "size": stat.st_size,
+                       "mtime": stat.st_mtime_ns}, f)
+
+    def _write(self, name: str, body: bytes, contentType: str, contentHash: str) -> None:
+        with self._open_write(name, contentType, contentHash) as f:
+            f.write(body)
+
+    @contextlib.contextmanager
+    def _open_write(self, name: str, contentType: str, contentHash: str, **options):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.partial"
+        # readers never see a partially written file
+        with open(temporary, "wb") as f:
+            yield f
+        os.replace(temporary, path)
+        self._record(name, contentType, contentHash)
+
+
+def get_store(url: str) -> ObjectStore:
+    """ Store rooted at `url`: `gs://bucket[/prefix]`, a local path or a `file://` URL. """
+    if url.startswith("gs://"):
+        return GCSStore(url)
+    return LocalStore(url)
+
+
+def bucket(name: str) -> ObjectStore:
+    """ Store of a bucket: the GCS bucket, or `<STORAGE_ROOT>/<name>` when STORAGE_ROOT is set. """
+    root = os.environ.get("STORAGE_ROOT")
+    if root:
+        return get_store(os.path.join(root, name))
+    return get_store(f"gs://{name}")
@@ -0,0 +1,178 @@
+""" Server-sent events stream of price updates.
+
+Clients subscribe to a set of tickers and receive compact price deltas whenever a cached quote
+changes. A single refresh loop reads the shared market data cache for the union of watched
+tickers and fans the changes out to every subscriber, so upstream load grows with the number
+of tickers rather than with the number of connected clients.
+
+Every streaming client holds one serving thread, so the number of concurrent streams is capped.
+
+`price_stream.py` reads optional env variables:
+    - PRICE_STREAM_INTERVAL -- seconds between cache reads of the refresh loop, defaults to 15
+    - PRICE_STREAM_HEARTBEAT -- seconds between keep-alive comments on an idle stream, defaults to 20
+    - PRICE_STREAM_MAX_CLIENTS -- max concurrent streams per process, defaults to 4
+"""
+
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+import market_cache
+
+logger = logging.getLogger("recommendation-engine")
+
+
+def quote_of(frame) -> dict:
+    """ Compact quote of a daily frame: last price, change for day % and bar timestamp in ms. """
+    closes = frame["Close"].to_numpy(dtype=float)
+    price = float(closes[-1])
+    change = price * 100.0 / float(closes[-2]) - 100.0 if closes.shape[0] > 1 else 0.0
+    return {
+        "p": round(price, 4),
+        "c": round(change, 4) if np.isfinite(change) else None,
+        "t": int(frame.index[-1].timestamp() * 1000),
+    }
+
+
+class Subscription:
+    """ Pending updates of one client.
+
+    Updates are merged per ticker, so a slow client only receives the latest quote of every
+    ticker instead of an ever-growing backlog.
+    """
+    def __init__(self, tickers: list):
+        self.tickers: frozenset = frozenset(tickers)
+        self.pending: dict = {}
+        self.closed: bool = False
+        self._condition = threading.Condition()
+
+    def push(self, quotes: dict) -> None:
+        with self._condition:
+            self.pending.update(quotes)
+            self._condition.notify()
+
+    def wait(self, timeout: float) -> dict:
+        """ Block until updates arrive or the timeout passes, then return and clear them. """
+        with self._condition:
+            if not self.pending and not self.closed:
+                self._condition.wait(timeout)
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def close(self) -> None:
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class PriceStream:
+    """ Fans out quote changes from one refresh loop to all subscribers.
+
+    Public methods:
+        subscribe() -- register a client for a set of tickers.
+        unsubscribe() -- remove a client.
+        events() -- generator of SSE messages for a subscription.
+
+    Attributes:
+        cache -- market data cache the quotes are read from
+        interval -- seconds between cache reads
+        heartbeat -- seconds between keep-alive comments
+        maxClients -- max concurrent subscriptions
+    """
+    def __init__(self, cache: market_cache.MarketDataCache, interval: float = None, heartbeat: float = None,
+                 maxClients: int = None):
+        self.cache: market_cache.MarketDataCache = cache
+        self.interval: float = interval or float(os.environ.get("PRICE_STREAM_INTERVAL", 15))
+        self.heartbeat: float = heartbeat or float(os.environ.get("PRICE_STREAM_HEARTBEAT", 20))
+        self.maxClients: int = maxClients or int(os.environ.get("PRICE_STREAM_MAX_CLIENTS", 4))
+        self.subscriptions: set = set()
+        self.quotes: dict = {}
+        self.refreshes: int = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread = None
+
+    def subscribe(self, tickers: list) -> Subscription:
+        """ Register a client; the first message carries the latest known quotes.
+
+        Args:
+            tickers (list): tickers to watch.
+
+        Returns:
+            Subscription: the new subscription or None if the client limit is reached.
+        """
+        subscription = Subscription(tickers)
+        with self._lock:
+            if len(self.subscriptions) >= self.maxClients:
+                return None
+            self.subscriptions.add(subscription)
+            known = {ticker: self.quotes[ticker] for ticker in subscription.tickers if ticker in self.quotes}
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="ipre-price-stream", daemon=True)
+                self._thread.start()
+        if known:
+            subscription.push(known)
+        if len(known) < len(subscription.tickers):
+            # fetch new tickers now rather than on the next tick
+            self._wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        with self._lock:
+            self.subscriptions.discard(subscription)
+
+    def events(self, subscription: Subscription):
+        """ Yield SSE messages of a subscription until the client disconnects. """
+        try:
+            yield f"retry: {int(self.interval * 1000)}\n\n"
+            while not subscription.closed:
+                quotes = subscription.wait(self.heartbeat)
+                if quotes:
+                    yield f"event: prices\ndata: {json.dumps(quotes, separators=(',', ':'))}\n\n"
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            # the WSGI server closes the generator when the client goes away
+            self.unsubscribe(subscription)
+
+    def refresh(self) -> dict:
+        """ Read the watched tickers from the cache and push changed quotes to subscribers.
+
+        Returns:
+            dict: quotes that changed since the previous refresh.
+        """
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+        watched = sorted(set().union(*(subscription.tickers for subscription in subscriptions)))
+        if not watched:
+            return {}
+        self.refreshes += 1
+        changed = {}
+        for ticker, frame in self.cache.get_many(watched).items():
+            quote = quote_of(frame)
+            if self.quotes.get(ticker) != quote:
+                changed[ticker] = quote
+        with self._lock:
+            self.quotes.update(changed)
+        for subscription in subscriptions:
+            delta = {ticker: changed[ticker] for ticker in subscription.tickers if ticker in changed}
+            if delta:
+                subscription.push(delta)
+        return changed
+
+    def _loop(self) -> None:
+        while True:
+            with self._lock:
+                if not self.subscriptions:
+                    self._thread = None
+                    return
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Price stream refresh failed.")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
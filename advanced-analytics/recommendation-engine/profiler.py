@@ -0,0 +1,329 @@
+""" On-demand request profiler for the recommendation engine.
+
+An admin arms a profiling session for the next N requests or for a time window. Profiled
+requests are measured with cProfile or with a sampling thread, optionally together with
+`tracemalloc` allocation snapshots, and the result is returned as collapsed stacks
+(`frame;frame;frame weight` lines) that flame graph tools consume directly.
+
+When no session is armed, the request hooks only check the `active` attribute. A time window
+is finished by a timer at its deadline, so `tracemalloc` and the sampler stop even when no
+request or report comes after it.
+
+`profiler.py` reads env variables:
+    - PROFILER_TOKEN -- admin bearer token; the profiler endpoints are disabled when not set
+"""
+
+import collections
+import cProfile
+import hmac
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger("recommendation-engine")
+
+__valid_modes__ = [
+    "cprofile",
+    "sampling"
+]
+
+
+def frame_label(filename: str, lineno: int, name: str = None) -> str:
+    if name:
+        return f"{os.path.basename(filename)}:{name}:{lineno}"
+    return f"{os.path.basename(filename)}:{lineno}"
+
+
+def collapse(stacks: dict) -> str:
+    """ Render {(frame, ...): weight} as collapsed stack lines, heaviest first. """
+    lines = [
+        f"{';'.join(stack)} {int(weight)}"
+        for stack, weight in sorted(stacks.items(), key=lambda item: -item[1])
+        if int(weight) > 0
+    ]
+    return "\n".join(lines)
+
+
+class ProfilingSession:
+    """ Measurements collected for one armed profiling session.
+
+    Attributes:
+        mode -- `cprofile` (deterministic, weights in microseconds) or `sampling` (weights in samples)
+        requests -- number of requests to profile, or None for a time window
+        seconds -- length of the time window, or None for a request count
+        interval -- sampling interval in seconds
+        traceMemory -- whether to take tracemalloc snapshots
+    """
+    def __init__(self, mode: str, requests: int = None, seconds: float = None,
+                 interval: float = 0.005, traceMemory: bool = False):
+        self.mode: str = mode
+        self.requests: int = requests
+        self.seconds: float = seconds
+        self.interval: float = interval
+        self.traceMemory: bool = traceMemory
+        self.startedAt: float = time.time()
+        self.finishedAt: float = None
+        self.deadline: float = time.monotonic() + seconds if seconds else None
+        self.started: int = 0
+        self.completed: int = 0
+        self.paths: collections.Counter = collections.Counter()
+        self.stats: pstats.Stats = None
+        self.samples: collections.Counter = collections.Counter()
+        self.threads: set = set()
+        self.baseline = None
+        self.allocations: list = []
+        self.allocationStacks: dict = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "mode": self.mode,
+            "requests": self.requests,
+            "seconds": self.seconds,
+            "traceMemory": self.traceMemory,
+            "startedAt": self.startedAt,
+            "finishedAt": self.finishedAt,
+            "profiledRequests": self.completed,
+            "paths": dict(self.paths),
+        }
+
+
+class Profiler:
+    """ Arms profiling sessions and hooks them into the request lifecycle.
+
+    Public methods:
+        start() -- arm a new profiling session.
+        stop() -- finish the current session early.
+        begin() / end() -- request hooks, called only while `active` is set.
+        report() -- status and results of the last session.
+    """
+    def __init__(self, token: str = None):
+        self.token: str = token if token is not None else os.environ.get("PROFILER_TOKEN")
+        self.active: bool = False
+        self.session: ProfilingSession = None
+        self._lock = threading.Lock()
+        self._sampler: threading.Thread = None
+        self._timer: threading.Timer = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def authorized(self, header: str) -> bool:
+        """ Check an `Authorization: Bearer <token>` header value. """
+        if not self.enabled or not header or not header.startswith("Bearer "):
+            return False
+        return hmac.compare_digest(header[len("Bearer "):].encode(), self.token.encode())
+
+    def start(self, mode: str = "sampling", requests: int = None, seconds: float = None,
+              interval: float = 0.005, traceMemory: bool = False) -> ProfilingSession:
+        """ Arm a profiling session for the next `requests` requests or for `seconds` seconds.
+
+        Returns:
+            ProfilingSession: the armed session.
+        """
+        if mode not in __valid_modes__:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if bool(requests) == bool(seconds):
+            raise ValueError("Specify either a number of requests or a number of seconds")
+        with self._lock:
+            if self.active:
+                raise RuntimeError("Profiling session is already running")
+            self.session = ProfilingSession(mode, requests, seconds, interval, traceMemory)
+            if traceMemory:
+                tracemalloc.start(25)
+                self.session.baseline = tracemalloc.take_snapshot()
+            self.active = True
+            if mode == "sampling":
+                self._sampler = threading.Thread(
+                    target=self._sample, args=(self.session,), name="ipre-profiler", daemon=True
+                )
+                self._sampler.start()
+            if seconds:
+                self._timer = threading.Timer(seconds, self.stop, kwargs={"session": self.session})
+                self._timer.daemon = True
+                self._timer.start()
+        logger.info(f"Profiling session started: mode={mode}, requests={requests}, seconds={seconds}.")
+        return self.session
+
+    def stop(self, session: ProfilingSession = None) -> ProfilingSession:
+        """ Finish the running session and collect its results.
+
+        Args:
+            session (ProfilingSession, optional): only finish this session, for the deadline timer
+                that may fire after its session was stopped and another one started. Defaults to None.
+        """
+        with self._lock:
+            if not self.active or (session is not None and session is not self.session):
+                return self.session
+            self.active = False
+            session = self.session
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if session.traceMemory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                self._collect_allocations(session, snapshot)
+            session.finishedAt = time.time()
+        logger.info(f"Profiling session finished after {session.completed} requests.")
+        return session
+
+    def begin(self, path: str):
+        """ Request start hook. Returns a token to pass to end(), None if not profiled. """
+        session = self.session
+        with self._lock:
+            if not self.active or self._expired(session):
+                return None
+            if session.requests and session.started >= session.requests:
+                return None
+            session.started += 1
+            session.paths[path] += 1
+        if session.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another request thread already holds the interpreter-wide profiler
+                with self._lock:
+                    session.started -= 1
+                    session.paths[path] -= 1
+                return None
+            return profile
+        ident = threading.get_ident()
+        session.threads.add(ident)
+        return ident
+
+    def end(self, token) -> None:
+        """ Request end hook. """
+        if token is None:
+            return
+        session = self.session
+        if isinstance(token, cProfile.Profile):
+            token.disable()
+            with self._lock:
+                if session.stats is None:
+                    session.stats = pstats.Stats(token)
+                else:
+                    session.stats.add(token)
+        else:
+            session.threads.discard(token)
+        with self._lock:
+            session.completed += 1
+            finished = session.requests and session.completed >= session.requests
+        if finished or self._expired(session):
+            self.stop()
+
+    def report(self) -> dict:
+        """ Status and results of the current or last session. """
+        session = self.session
+        if session is None:
+            return {"status": "idle"}
+        if self.active and self._expired(session):
+            self.stop()
+        result = session.to_dict()
+        result["status"] = "running" if self.active else "done"
+        if not self.active:
+            result["collapsed"] = self.collapsed(session)
+            result["functions"] = self._top_functions(session)
+            result["allocations"] = session.allocations
+            result["allocationStacks"] = collapse(session.allocationStacks)
+        return result
+
+    def collapsed(self, session: ProfilingSession) -> str:
+        """ Collapsed call stacks of the session. """
+        if session.mode == "sampling":
+            return collapse(session.samples)
+        if session.stats is None:
+            return ""
+        return collapse(self._stacks_from_stats(session.stats.stats))
+
+    @staticmethod
+    def _expired(session: ProfilingSession) -> bool:
+        return session.deadline is not None and time.monotonic() >= session.deadline
+
+    def _sample(self, session: ProfilingSession) -> None:
+        while self.active and self.session is session:
+            frames = sys._current_frames()
+            for ident in list(session.threads):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                if stack:
+                    session.samples[tuple(reversed(stack))] += 1
+            if self._expired(session):
+                self.stop()
+                return
+            time.sleep(session.interval)
+
+    @staticmethod
+    def _stacks_from_stats(stats: dict, maxDepth: int = 64, minWeight: float = 1.0) -> dict:
+        """ Approximate call stacks from the cProfile call graph.
+
+        cProfile keeps caller/callee edges rather than full stacks, so the inclusive time of
+        each function is split between its callees in proportion to the edge timings.
+        Weights are in microseconds.
+        """
+        callees = collections.defaultdict(dict)
+        for func, (_, _, _, _, callers) in stats.items():
+            for caller, edge in callers.items():
+                callees[caller][func] = edge[3]
+        roots = [func for func, value in stats.items() if not value[4]]
+        stacks = collections.Counter()
+
+        def walk(func, path, weight):
+            tottime, cumtime = stats[func][2], stats[func][3]
+            path = path + (frame_label(*func),)
+            if cumtime <= 0:
+                return
+            stacks[path] += weight * tottime / cumtime
+            if len(path) >= maxDepth:
+                return
+            for callee, edgeTime in callees[func].items():
+                share = weight * edgeTime / cumtime
+                if share >= minWeight and frame_label(*callee) not in path:
+                    walk(callee, path, share)
+
+        for root in roots:
+            walk(root, (), stats[root][3] * 1e6)
+        return stacks
+
+    @staticmethod
+    def _top_functions(session: ProfilingSession, limit: int = 30) -> list:
+        if session.stats is None:
+            return []
+        rows = sorted(session.stats.stats.items(), key=lambda item: -item[1][3])[:limit]
+        return [
+            {
+                "function": frame_label(*func),
+                "calls": value[1],
+                "totalTime": value[2],
+                "cumulativeTime": value[3],
+            }
+            for func, value in rows
+        ]
+
+    @staticmethod
+    def _collect_allocations(session: ProfilingSession, snapshot, limit: int = 30) -> None:
+        ignored = [tracemalloc.Filter(False, path) for path in (__file__, tracemalloc.__file__, pstats.__file__)]
+        snapshot = snapshot.filter_traces(ignored)
+        diff = snapshot.compare_to(session.baseline.filter_traces(ignored), "traceback")
+        diff = [stat for stat in diff if stat.size_diff > 0][:limit]
+        session.allocations = [
+            {
+                "location": frame_label(stat.traceback[-1].filename, stat.traceback[-1].lineno),
+                "sizeDiff": stat.size_diff,
+                "countDiff": stat.count_diff,
+            }
+            for stat in diff
+        ]
+        session.allocationStacks = {
+            tuple(frame_label(frame.filename, frame.lineno) for frame in stat.traceback): stat.size_diff
+            for stat in diff
+        }
@@ -0,0 +1,289 @@
+""" Market data providers.
+
+Every provider exposes the same three methods, so the statistics routes and the capital
+markets pipeline can run against YahooFinance or fully offline:
+    - history() -- daily OHLCV of one ticker, prices adjusted like `yfinance.Ticker.history`
+    - download() -- daily quotes of many tickers with (field, ticker) columns like `yfinance.download`
+    - metadata() -- long name, exchange, currency and timezone of a ticker
+
+Implementations:
+    - YahooProvider -- YahooFinance through `yfinance`
+    - SyntheticProvider -- deterministic random walks, the same ticker always yields the same quotes
+    - ReplayProvider -- recorded `<TICKER>.parquet` or `<TICKER>.csv` fixtures from a directory
+
+Optional environment variables:
+    - MARKET_DATA_PROVIDER -- `yahoo` (default), `synthetic` or `replay`
+    - MARKET_DATA_FIXTURES -- fixture directory of the replay provider
+    - MARKET_DATA_SEED -- seed of the synthetic provider, defaults to 0
+"""
+
+import abc
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+import yfinance
+
+PERIOD_PATTERN = re.compile(r"^(\d+)(d|wk|mo|y)$")
+FIELDS = ["Adj Close", "Close", "High", "Low", "Open", "Volume"]
+
+
+def period_offset(period: str) -> pd.DateOffset:
+    """ Convert a yfinance period such as `5mo` or `1y` into a date offset, None if unsupported. """
+    match = PERIOD_PATTERN.match(period)
+    if not match:
+        return None
+    value, unit = int(match.group(1)), match.group(2)
+    return {
+        "d": pd.DateOffset(days=value),
+        "wk": pd.DateOffset(weeks=value),
+        "mo": pd.DateOffset(months=value),
+        "y": pd.DateOffset(years=value),
+    }[unit]
+
+
+def adjust(quotes: pd.DataFrame) -> pd.DataFrame:
+    """ Scale OHLC by the Adj Close / Close ratio and drop Adj Close, as `auto_adjust=True` does. """
+    ratio = quotes["Adj Close"] / quotes["Close"]
+    adjusted = quotes.drop(columns="Adj Close")
+    for field in ["Open", "High", "Low", "Close"]:
+        adjusted[field] = adjusted[field] * ratio
+    return adjusted
+
+
+class QuoteProvider(abc.ABC):
+    """ Base class of market data providers.
+
+    Subclasses implement `quotes()` returning daily quotes of one ticker with FIELDS columns;
+    history() and download() slice, adjust and combine them.
+    """
+    name = None
+
+    @abc.abstractmethod
+    def quotes(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """ Unadjusted daily quotes of one ticker between `start` and `end`, FIELDS columns. """
+
+    def last_date(self, ticker: str) -> pd.Timestamp:
+        """ Reference date that periods are counted back from. """
+        return pd.Timestamp.now().normalize()
+
+    def window(self, ticker: str, period: str = None, start=None, end=None) -> tuple:
+        end = pd.Timestamp(end) if end is not None else self.last_date(ticker)
+        if start is not None:
+            return pd.Timestamp(start), end
+        offset = period_offset(period or "1mo")
+        if offset is None:
+            return pd.Timestamp("1970-01-01"), end
+        return end - offset, end
+
+    def history(self, ticker: str, period: str = None, start=None, end=None) -> pd.DataFrame:
+        """ Daily adjusted OHLCV of one ticker.
+
+        Args:
+            ticker (str): asset ticker.
+            period (str, optional): yfinance period, e.g. `5mo`. Defaults to `1mo` without start.
+            start, end (optional): explicit date window.
+
+        Returns:
+            pd.DataFrame: Open, High, Low, Close, Volume indexed by date.
+        """
+        start, end = self.window(ticker, period, start, end)
+        return adjust(self.quotes(ticker, start, end))
+
+    def download(self, tickers: list, period: str = None, start=None, end=None,
+                 auto_adjust: bool = False) -> pd.DataFrame:
+        """ Daily quotes of several tickers.
+
+        Args:
+            tickers (list): asset tickers.
+            period (str, optional): yfinance period. Defaults to `1mo` without start.
+            start, end (optional): explicit date window.
+            auto_adjust (bool): adjust OHLC and drop Adj Close. Defaults to False.
+
+        Returns:
+            pd.DataFrame: quotes with (field, ticker) columns; tickers without data are left out.
+        """
+        frames = {}
+        for ticker in tickers:
+            frame = self.quotes(ticker, *self.window(ticker, period, start, end))
+            if frame.shape[0] > 0:
+                frames[ticker] = adjust(frame) if auto_adjust else frame
+        if not frames:
+            return pd.DataFrame()
+        data = pd.concat(frames, axis=1).sort_index()
+        return data.swaplevel(axis=1).sort_index(axis=1)
+
+    def metadata(self, ticker: str) -> dict:
+        return {"longName": None, "exchange": None, "currency": None, "timezone": None}
+
+
+class YahooProvider(QuoteProvider):
+    """ YahooFinance quotes through `yfinance`. """
+    name = "yahoo"
+
+    def quotes(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        data = yfinance.Ticker(ticker).history(start=start, end=end, auto_adjust=False)
+        return data.reindex(columns=FIELDS)
+
+    def history(self, ticker: str, period: str = None, start=None, end=None) -> pd.DataFrame:
+        if start is not None:
+            return yfinance.Ticker(ticker).history(start=start, end=end)
+        return yfinance.Ticker(ticker).history(period=period or "1mo")
+
+    def download(self, tickers: list, period: str = None, start=None, end=None,
+                 auto_adjust: bool = False) -> pd.DataFrame:
+        data = yfinance.download(
+            tickers=tickers,
+            period=None if start is not None else (period or "1mo"),
+            start=start,
+            end=end,
+            auto_adjust=auto_adjust,
+            progress=False
+        )
+        if data.shape[0] > 0 and not isinstance(data.columns, pd.MultiIndex):
+            data.columns = pd.MultiIndex.from_product([data.columns, tickers[:1]])
+        return data
+
+    def metadata(self, ticker: str) -> dict:
+        info = yfinance.Ticker(ticker).info
+        return {
+            "longName": info.get("longName"),
+            "exchange": info.get("exchange"),
+            "currency": info.get("currency"),
+            "timezone": info.get("exchangeTimezoneShortName"),
+        }
+
+
+class SyntheticProvider(QuoteProvider):
+    """ Deterministic geometric random walks on business days.
+
+    Each ticker has its own generator seeded by the provider seed and the ticker name, and
+    the walk always starts at `origin`, so any window of a ticker is reproducible. The walk of
+    a ticker is generated once up to the latest requested end and windows are sliced from it.
+
+    Attributes:
+        maxWalks -- max number of tickers whose walks are kept
+    """
+    name = "synthetic"
+
+    def __init__(self, seed: int = None, origin: str = "1990-01-01", drift: float = 0.0003,
+                 volatility: float = 0.015, maxWalks: int = 128):
+        self.seed: int = seed if seed is not None else int(os.environ.get("MARKET_DATA_SEED", 0))
+        self.origin: pd.Timestamp = pd.Timestamp(origin)
+        self.drift: float = drift
+        self.volatility: float = volatility
+        self.maxWalks: int = maxWalks
+        self.walks: dict = {}
+
+    def quotes(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        key = (self.seed, ticker)
+        walk = self.walks.get(key)
+        if walk is None or walk[0] < end:
+            walk = (end, self.walk(ticker, end))
+            self.walks.pop(key, None)
+            while self.walks and len(self.walks) >= self.maxWalks:
+                self.walks.pop(next(iter(self.walks)), None)
+            self.walks[key] = walk
+        return walk[1].loc[start:end].copy()
+
+    def walk(self, ticker: str, end: pd.Timestamp) -> pd.DataFrame:
+        """ Quotes of a ticker from `origin` to `end`. """
+        dates = pd.bdate_range(self.origin, end)
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode("utf-8"))])
+        price = 20.0 + 180.0 * rng.random()
+        # draws are consumed row by row, so the first days do not depend on the window end
+        z = rng.standard_normal((len(dates), 5))
+        close = price * np.exp(np.cumsum(self.drift + self.volatility * z[:, 0]))
+        open_ = np.concatenate([[price], close[:-1]]) * np.exp(self.volatility / 3 * z[:, 1])
+        high = np.maximum(open_, close) * (1 + np.abs(self.volatility / 2 * z[:, 2]))
+        low = np.minimum(open_, close) * (1 - np.abs(self.volatility / 2 * z[:, 3]))
+        volume = np.round(np.exp(14.0 + 0.5 * z[:, 4]))
+        quotes = pd.DataFrame(
+            {"Adj Close": close, "Close": close, "High": high, "Low": low, "Open": open_, "Volume": volume},
+            index=pd.DatetimeIndex(dates, name="Date")
+        )
+        return quotes
+
+    def metadata(self, ticker: str) -> dict:
+        return {"longName": f"{ticker} Synthetic", "exchange": "SYN", "currency": "USD", "timezone": "EST"}
+
+
+class ReplayProvider(QuoteProvider):
+    """ Recorded quotes from `<TICKER>.parquet` or `<TICKER>.csv` fixtures.
+
+    Periods are counted back from the last recorded date of each ticker, so a replay gives the
+    same answer whenever it runs. An optional `metadata.json` maps tickers to metadata.
+    """
+    name = "replay"
+
+    def __init__(self, directory: str = None):
+        self.directory: str = directory or os.environ["MARKET_DATA_FIXTURES"]
+        self.frames: dict = {}
+        metadataPath = os.path.join(self.directory, "metadata.json")
+        self.metadataByTicker: dict = {}
+        if os.path.exists(metadataPath):
+            with open(metadataPath, "r") as f:
+                self.metadataByTicker = json.load(f)
+
+    def load(self, ticker: str) -> pd.DataFrame:
+        if ticker not in self.frames:
+            path = os.path.join(self.directory, ticker)
+            if os.path.exists(path + ".parquet"):
+                frame = pd.read_parquet(path + ".parquet")
+            elif os.path.exists(path + ".csv"):
+                frame = pd.read_csv(path + ".csv", index_col=0, parse_dates=True)
+            else:
+                frame = pd.DataFrame(columns=FIELDS, index=pd.DatetimeIndex([], name="Date"))
+            if "Adj Close" not in frame.columns:
+                frame["Adj Close"] = frame["Close"]
+            self.frames[ticker] = frame.loc[:, FIELDS].sort_index()
+        return self.frames[ticker]
+
+    def last_date(self, ticker: str) -> pd.Timestamp:
+        frame = self.load(ticker)
+        return frame.index[-1] if frame.shape[0] > 0 else super().last_date(ticker)
+
+    def quotes(self, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        return self.load(ticker).loc[start:end]
+
+    def metadata(self, ticker: str) -> dict:
+        return {**super().metadata(ticker), **self.metadataByTicker.get(ticker, {})}
+
+    @staticmethod
+    def record(provider: QuoteProvider, tickers: list, directory: str, start, end=None,
+               fileFormat: str = "parquet") -> None:
+        """ Record quotes of another provider as replay fixtures. """
+        os.makedirs(directory, exist_ok=True)
+        data = provider.download(tickers, start=start, end=end)
+        for ticker in data.columns.get_level_values(1).unique():
+            frame = data.xs(ticker, axis=1, level=1).dropna(how="all")
+            path = os.path.join(directory, ticker)
+            if fileFormat == "parquet":
+                frame.to_parquet(path + ".parquet")
+            else:
+                frame.to_csv(path + ".csv")
+        with open(os.path.join(directory, "metadata.json"), "w") as f:
+            json.dump({ticker: provider.metadata(ticker) for ticker in tickers}, f)
+
+
+__providers__ = {
+    provider.name: provider for provider in [YahooProvider, SyntheticProvider, ReplayProvider]
+}
+
+
+def get_provider(name: str = None) -> QuoteProvider:
+    """ Create the market data provider selected by MARKET_DATA_PROVIDER.
+
+    Args:
+        name (str, optional): `yahoo`, `synthetic` or `replay`. Defaults to MARKET_DATA_PROVIDER or `yahoo`.
+
+    Returns:
+        QuoteProvider: market data provider.
+    """
+    name = name or os.environ.get("MARKET_DATA_PROVIDER", "yahoo")
+    if name not in __providers__:
+        raise ValueError(f"Unknown market data provider: {name}")
+    return __providers__[name]()
@@ -3,11 +3,21 @@ portfolio optimization, investment analytics.
 
 `recommendation_engine.py` requires env variables:
     - QUOTES_BUCKET -- GCS bucket name with capital markets quotes data
-    - QUOTES_BLOB -- name of capital markets quotes file, e.g. capital-markets-quotes.csv
+    - QUOTES_BLOB -- name of capital markets quotes file, e.g. capital-markets-quotes.csv, or of the
+      partitioned Parquet dataset written by the pipeline, e.g. capital-markets-quotes
     - PREDICTED_IRP_BUCKET -- GCS bucket name with _predicted_ investor risk preferences
     - PREDICTED_IRP_BLOB -- name of predicted IRP file, e.g. predicted-irp.csv
     - PREDICTED_RETURNS_BUCKET -- GCS bucket name with _predicted_ expected returns data
     - PREDICTED_RETURNS_BLOB -- name of predicted expected returns file, e.g. predicted-expected-returns.csv
+
+Optional environment variables:
+    - RETURNS_CUBE_BUCKET -- GCS bucket name with the multi-horizon returns cube, defaults to QUOTES_BUCKET
+    - RETURNS_CUBE_BLOB -- name of the returns cube written by the pipeline, the partitioned Parquet dataset
+      capital-markets-returns-cube, or capital-markets-returns-cube.csv when the pipeline writes the CSV cube;
+      periodic returns are computed from quotes when not set, see `returns_cube.py`
+
+CSV files may be plain, gzip or zstd compressed, see `compressed_io.py`. Buckets are local directories
+under STORAGE_ROOT when it is set, see `object_store.py`.
 """
 
 import json
@@ -21,6 +31,11 @@ import pandas as pd
 import pypfopt
 from google.cloud import storage
 
+import compressed_io
+import object_store
+import partitioned_store
+import returns_cube
+
 # Set logging
 logger = logging.getLogger("recommendation-engine")
 logging.basicConfig(
@@ -31,9 +46,17 @@ logging.basicConfig(
 )
 
 __valid_methods__ = [
-    "make_recommendation"
+    "make_recommendation",
+    "make_recommendations",
+    "project_portfolio",
+    "backtest_recommendation",
 ]
 
+# Monte Carlo paths simulated at once, progress is reported after each chunk
+PROJECTION_CHUNK = 1000
+PROJECTION_PERCENTILES = [5, 25, 50, 75, 95]
+TRADING_DAYS = 252
+
 
 class PortfolioOptimizer:
     """ Class for computing optimal asset weights in the portfolio.
@@ -49,10 +72,13 @@ class PortfolioOptimizer:
         self.quotesBucket: str = os.environ["QUOTES_BUCKET"]
         self.quotesBlob: str = os.environ["QUOTES_BLOB"]
         self.quotes: pd.DataFrame = None
+        self.returnsCubeBucket: str = os.environ.get("RETURNS_CUBE_BUCKET", self.quotesBucket)
+        self.returnsCubeBlob: str = os.environ.get("RETURNS_CUBE_BLOB")
 
         self.riskAversionBucket: str = os.environ["PREDICTED_IRP_BUCKET"]
         self.riskAversionBlob: str = os.environ["PREDICTED_IRP_BLOB"]
         self.riskAversion: float = None
+        self.predictedRisk: pd.DataFrame = None
 
         self.expectedReturnsBucket: str = os.environ["PREDICTED_RETURNS_BUCKET"]
         self.expectedReturnsBlob: str = os.environ["PREDICTED_RETURNS_BLOB"]
@@ -68,24 +94,44 @@ class PortfolioOptimizer:
         self.assetWeights: dict = None
         self.portfolioMetrics: dict = None
 
+    def keep_available(self, data: pd.DataFrame, source: str) -> pd.DataFrame:
+        """ Restrict the tickers to those with data, e.g. without the tickers quarantined by the pipeline.
+
+        Args:
+            data (pd.DataFrame): quotes or returns, one column per ticker.
+            source (str): name of the data for the log.
+
+        Returns:
+            pd.DataFrame: data of the remaining tickers.
+        """
+        data = data.reindex(columns=self.tickers)
+        missing = data.columns[data.isna().all()].tolist()
+        if missing:
+            logger.warning(f"No {source} for {missing}, leaving them out of the portfolio.")
+            self.tickers = [ticker for ticker in self.tickers if ticker not in missing]
+        return data.loc[:, self.tickers]
+
     def get_quotes(self) -> pd.DataFrame:
-        """ Load historical quotes data from Cloud storage csv.
+        """ Load historical quotes data from Cloud storage csv or a partitioned Parquet dataset.
 
             Returns:
                 pd.DataFrame: quotes dataframe.
             """
         logger.debug(
             f"Getting quotes from {self.quotesBucket}/{self.quotesBlob}.")
-        dataPath = "".join(["gs://", os.path.join(self.quotesBucket, self.quotesBlob)])
-        quotesAll = pd.read_csv(dataPath, index_col=0)
-        self.quotes = quotesAll.loc[:, self.tickers]
+        dataPath = object_store.bucket(self.quotesBucket).url(self.quotesBlob)
+        if self.quotesBlob.endswith((".csv", ".csv.gz", ".csv.zst")):
+            self.quotes = compressed_io.read_csv(dataPath, index_col=0)
+        else:
+            # only the tickers of the universe are read from the columnar files
+            self.quotes = partitioned_store.PartitionedStore(dataPath).read(columns=self.tickers)
+        self.quotes = self.keep_available(self.quotes, "quotes")
+        # quotes keep each ticker's own listing window; the optimizer needs a history common to all
+        self.quotes = self.quotes.dropna(how="any")
         return self.quotes
 
     def get_periodic_returns(self, periods: int = 20) -> pd.DataFrame:
-        """ Calculate periodic returns from quotes.
-
-        Args:
-            periods (int): Rolling window of periodic returns. Defaults to 20.
+        """ Load periodic returns from the returns cube, or calculate them from quotes.
 
         Args:
             periods (int): rolling window of MA. Defaults to 20.
@@ -93,6 +139,14 @@ class PortfolioOptimizer:
         Returns:
             pd.DataFrame: periodic returns data frame.
         """
+        if self.returnsCubeBlob and periods in returns_cube.HORIZONS:
+            logger.debug(f"Getting {periods}-day returns from {self.returnsCubeBucket}/{self.returnsCubeBlob}.")
+            dataPath = object_store.bucket(self.returnsCubeBucket).url(self.returnsCubeBlob)
+            self.periodicReturns = returns_cube.read(dataPath, periods, tickers=self.tickers)
+            if self.periodicReturns is not None:
+                self.periodicReturns = self.keep_available(self.periodicReturns, "returns").dropna(how="any")
+                return self.periodicReturns
+            logger.warning("Failed to load the returns cube. Estimating returns from quotes.")
         if not isinstance(self.quotes, pd.DataFrame):
             self.get_quotes()
         logger.debug(f"Estimating periodic returns, periods = {periods}.")
@@ -108,8 +162,8 @@ class PortfolioOptimizer:
         logger.debug(f"Estimating expected annualized returns, periodsPerYear={self.periodsPerYear}.")
         try:
             logger.debug(f"Getting expected returns vector from {self.expectedReturnsBucket}/{self.expectedReturnsBlob}.")
-            dataPath = "".join(["gs://", os.path.join(self.expectedReturnsBucket, self.expectedReturnsBlob)])
-            remoteReturns = pd.read_csv(dataPath, index_col=0)
+            dataPath = object_store.bucket(self.expectedReturnsBucket).url(self.expectedReturnsBlob)
+            remoteReturns = compressed_io.read_csv(dataPath, index_col=0)
             self.expectedReturns = remoteReturns.loc[self.tickers, 'forecast_value'] * self.periodsPerYear
         except FileNotFoundError:
             logger.warning("Failed to load expected returns from GCS. Estimating returns from quotes.")
@@ -160,9 +214,12 @@ class PortfolioOptimizer:
             float: Risk aversion value.
         """
         try:
-            logger.debug(f"Getting risk aversion from {self.riskAversionBucket}/{self.riskAversionBlob}.")
-            dataPath = "".join(["gs://", os.path.join(self.riskAversionBucket, self.riskAversionBlob)])
-            riskAversion_df = pd.read_csv(dataPath, sep=';')
+            if self.predictedRisk is None:
+                logger.debug(f"Getting risk aversion from {self.riskAversionBucket}/{self.riskAversionBlob}.")
+                dataPath = object_store.bucket(self.riskAversionBucket).url(self.riskAversionBlob)
+                # loaded once, for the recommendations of several investors
+                self.predictedRisk = compressed_io.read_csv(dataPath, sep=';')
+            riskAversion_df = self.predictedRisk
             riskAversion_series = riskAversion_df.loc[riskAversion_df.clientID == self.uuid, 'predicted_risk']
             # scale risk aversion
             self.riskAversion = self.scale_value(riskAversion_series.iloc[-1], min_max)
@@ -187,10 +244,11 @@ class PortfolioOptimizer:
         Returns:
             obj: pyfopt.efficient_frontier object.
         """
-        if not isinstance(self.expectedReturns, pd.Series):
-            self.get_expected_returns()
+        # the risk model comes first, it leaves out tickers without data that expected returns then skip
         if self.riskModel is None:
             self.get_risk_model()
+        if not isinstance(self.expectedReturns, pd.Series):
+            self.get_expected_returns()
         logger.debug("Setting convex optimizer.")
         self.optimizer = pypfopt.efficient_frontier.EfficientFrontier(
             expected_returns=self.expectedReturns,
@@ -261,26 +319,172 @@ class PortfolioOptimizer:
         return self.portfolioMetrics
 
 
-def make_recommendation(uuid: str, riskAversion: float = None):
-    """ Workflow for making personalized recommendation, computing investment analytics.
+def report(progress, fraction: float) -> None:
+    """ Report the completed fraction of a job, nothing outside of jobs. """
+    if progress:
+        progress(fraction)
+
+
+def prepare(mypy: PortfolioOptimizer, progress=None, share: float = 1.0) -> None:
+    """ Load the market data of an optimizer, reporting progress up to `share`.
+
+    The risk model comes first, it leaves out tickers without data that expected returns then skip.
+    """
+    mypy.get_risk_model()
+    report(progress, 0.6 * share)
+    mypy.get_expected_returns()
+    report(progress, share)
+
+
+def recommend(mypy: PortfolioOptimizer, riskAversion: float = None) -> dict:
+    """ Recommendation for the investor of a prepared optimizer.
 
     Args:
-        uuid (str): unique user ID.
-        riskAversion (float, optional): Select risk aversion factor in range [0, 1]. Defaults to None.
+        mypy (PortfolioOptimizer): optimizer holding the market data, see `prepare()`.
+        riskAversion (float, optional): Select risk aversion factor in range [0, 1]. Defaults to the predicted one.
 
     Returns:
         dict: personalized recommendation on investment products, investment performance metrics.
     """
-    mypy = PortfolioOptimizer(uuid)
     if not isinstance(riskAversion, float):
-        riskAversion = mypy.get_risk_aversion(uuid)
+        riskAversion = mypy.get_risk_aversion()
     else:
         riskAversion = mypy.scale_value(riskAversion)
+    # a new optimizer per investor, the market data is shared
+    mypy.optimizer = None
     weights = mypy.fit(riskAversion)
     metrics = mypy.get_portfolio_metrics(rf=0.025)
-    recommendation = {
+    return {
         "portfolioComposition": weights,
         "portfolioMetrics": metrics,
         "riskAversion": mypy.unscale_value(riskAversion),
     }
-    return recommendation
+
+
+def portfolio_weights(recommendation: dict) -> pd.Series:
+    """ Asset weights of a recommendation. """
+    return pd.Series({ticker: asset["weight"] for ticker, asset in recommendation["portfolioComposition"].items()})
+
+
+def make_recommendation(uuid: str, riskAversion: float = None, progress=None):
+    """ Workflow for making personalized recommendation, computing investment analytics.
+
+    Args:
+        uuid (str): unique user ID.
+        riskAversion (float, optional): Select risk aversion factor in range [0, 1]. Defaults to None.
+        progress (callable, optional): Callback receiving the completed fraction of work. Defaults to None.
+
+    Returns:
+        dict: personalized recommendation on investment products, investment performance metrics.
+    """
+    mypy = PortfolioOptimizer(uuid)
+    prepare(mypy, progress, 0.8)
+    return recommend(mypy, riskAversion)
+
+
+def make_recommendations(uuids: list, riskAversion: float = None, progress=None) -> dict:
+    """ Batch of recommendations sharing the market data, risk model and predicted risk preferences.
+
+    Args:
+        uuids (list): unique user IDs.
+        riskAversion (float, optional): Risk aversion factor in range [0, 1] of every investor. Defaults to
+            the predicted one of each investor.
+        progress (callable, optional): Callback receiving the completed fraction of work. Defaults to None.
+
+    Returns:
+        dict: recommendations keyed by user ID.
+    """
+    mypy = PortfolioOptimizer(None)
+    prepare(mypy, progress, 0.2)
+    recommendations = {}
+    for i, uuid in enumerate(uuids):
+        mypy.uuid = uuid
+        recommendations[uuid] = recommend(mypy, riskAversion)
+        report(progress, 0.2 + 0.8 * (i + 1) / len(uuids))
+    return {"recommendations": recommendations}
+
+
+def project_portfolio(uuid: str, riskAversion: float = None, years: int = 10, paths: int = 10000,
+                      seed: int = None, progress=None) -> dict:
+    """ Monte Carlo projection of the value of a recommended portfolio.
+
+    Periodic portfolio returns are drawn from a normal distribution with the expected return and
+    risk of the recommended weights, and compounded into one value path per draw.
+
+    Args:
+        uuid (str): unique user ID.
+        riskAversion (float, optional): Select risk aversion factor in range [0, 1]. Defaults to None.
+        years (int, optional): projection horizon. Defaults to 10.
+        paths (int, optional): number of simulated paths. Defaults to 10000.
+        seed (int, optional): random seed, for reproducible projections. Defaults to None.
+        progress (callable, optional): Callback receiving the completed fraction of work. Defaults to None.
+
+    Returns:
+        dict: the recommendation and percentiles of the portfolio value at every year, starting at 1.
+    """
+    mypy = PortfolioOptimizer(uuid)
+    prepare(mypy, progress, 0.2)
+    recommendation = recommend(mypy, riskAversion)
+    report(progress, 0.3)
+    weights = portfolio_weights(recommendation)
+    mean = float(weights @ mypy.expectedReturns.loc[weights.index]) / mypy.periodsPerYear
+    std = float(np.sqrt(weights @ mypy.riskModel.loc[weights.index, weights.index] @ weights / mypy.periodsPerYear))
+    rng = np.random.default_rng(seed)
+    values = np.ones((paths, years + 1))
+    for start in range(0, paths, PROJECTION_CHUNK):
+        count = min(PROJECTION_CHUNK, paths - start)
+        growth = np.cumprod(1 + rng.normal(mean, std, (count, years * mypy.periodsPerYear)), axis=1)
+        values[start:start + count, 1:] = growth[:, mypy.periodsPerYear - 1::mypy.periodsPerYear]
+        report(progress, 0.3 + 0.7 * (start + count) / paths)
+    percentiles = np.percentile(values, PROJECTION_PERCENTILES, axis=0)
+    return {
+        **recommendation,
+        "projection": {
+            "years": list(range(years + 1)),
+            "paths": paths,
+            "percentiles": {str(p): row.tolist() for p, row in zip(PROJECTION_PERCENTILES, percentiles)},
+            "probabilityOfLoss": float((values[:, -1] < 1.0).mean()),
+        },
+    }
+
+
+def backtest_recommendation(uuid: str, riskAversion: float = None, progress=None) -> dict:
+    """ Historical performance of the recommended weights over the stored quotes.
+
+    The portfolio is rebalanced to the recommended weights every day; the weights are not estimated
+    again along the history, so the result shows how the allocation behaved rather than the model.
+
+    Args:
+        uuid (str): unique user ID.
+        riskAversion (float, optional): Select risk aversion factor in range [0, 1]. Defaults to None.
+        progress (callable, optional): Callback receiving the completed fraction of work. Defaults to None.
+
+    Returns:
+        dict: the recommendation with annual return, volatility and max drawdown in %, and the
+            month-end portfolio value keyed by timestamp in ms, starting at 1.
+    """
+    mypy = PortfolioOptimizer(uuid)
+    prepare(mypy, progress, 0.4)
+    recommendation = recommend(mypy, riskAversion)
+    report(progress, 0.5)
+    quotes = mypy.quotes if isinstance(mypy.quotes, pd.DataFrame) else mypy.get_quotes()
+    report(progress, 0.9)
+    weights = portfolio_weights(recommendation)
+    quotes = quotes.reindex(columns=weights.index)
+    quotes.index = pd.to_datetime(quotes.index)
+    returns = quotes.sort_index().pct_change().iloc[1:].fillna(0.0) @ weights
+    growth = (1 + returns).cumprod()
+    drawdown = growth / growth.cummax() - 1
+    monthEnds = growth[~growth.index.to_period("M").duplicated(keep="last")]
+    timestamps = (monthEnds.index - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+    return {
+        **recommendation,
+        "backtest": {
+            "firstDate": growth.index[0].strftime("%Y-%m-%d"),
+            "lastDate": growth.index[-1].strftime("%Y-%m-%d"),
+            "annualReturn": (float(growth.iloc[-1]) ** (TRADING_DAYS / len(growth)) - 1) * 100,
+            "annualVolatility": float(returns.std() * np.sqrt(TRADING_DAYS)) * 100,
+            "maxDrawdown": float(drawdown.min()) * 100,
+            "growth": dict(zip(map(str, timestamps.tolist()), monthEnds.tolist())),
+        },
+    }
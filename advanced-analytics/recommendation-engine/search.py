@@ -0,0 +1,135 @@
+""" In-memory ticker search over symbols and long names.
+
+The index is built once at startup:
+    - sorted symbol, name word and full name arrays answer prefix queries with a binary search,
+      scanning only as many neighbours as results are requested
+    - a trigram index answers fuzzy queries (typos, partial words) when prefixes do not fill
+      the requested number of results; candidates are ranked by trigram Jaccard similarity
+"""
+
+import bisect
+import collections
+import re
+
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+# minimal trigram similarity of a fuzzy match
+FUZZY_THRESHOLD = 0.3
+
+SYMBOL_EXACT = "symbol"
+SYMBOL_PREFIX = "symbol_prefix"
+NAME_PREFIX = "name_prefix"
+FUZZY = "fuzzy"
+
+
+def normalize(text: str) -> str:
+    return NON_ALPHANUMERIC.sub(" ", (text or "").lower()).strip()
+
+
+def trigrams(term: str) -> set:
+    padded = f" {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """ Prefix and fuzzy search over ticker symbols and long names.
+
+    Public methods:
+        search() -- ranked matches for a query.
+
+    Attributes:
+        symbols -- indexed ticker symbols
+        names -- long name of every symbol
+        exchanges -- exchange of every symbol
+    """
+    def __init__(self, descriptions: dict, exchanges: dict = None):
+        self.symbols: list = list(descriptions)
+        self.names: list = [descriptions[symbol] for symbol in self.symbols]
+        self.exchanges: list = [(exchanges or {}).get(symbol) for symbol in self.symbols]
+
+        symbolTerms = sorted((normalize(symbol), i) for i, symbol in enumerate(self.symbols))
+        nameTerms = set()
+        for i, name in enumerate(self.names):
+            normalized = normalize(name)
+            words = normalized.split()
+            # every word suffix of the name, so "of amer" finds "bank of america"
+            nameTerms.update((" ".join(words[j:]), i) for j in range(len(words)))
+        nameTerms = sorted(nameTerms)
+        self._symbolKeys: list = [term for term, _ in symbolTerms]
+        self._symbolIds: list = [i for _, i in symbolTerms]
+        self._nameKeys: list = [term for term, _ in nameTerms]
+        self._nameIds: list = [i for _, i in nameTerms]
+
+        self._terms: list = []
+        self._termIds: list = []
+        self._termGrams: list = []
+        self._postings: dict = collections.defaultdict(list)
+        terms = {(term, i) for term, i in symbolTerms}
+        terms.update((word, i) for i, name in enumerate(self.names) for word in normalize(name).split())
+        for term, i in sorted(terms):
+            termId = len(self._terms)
+            grams = trigrams(term)
+            self._terms.append(term)
+            self._termIds.append(i)
+            self._termGrams.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(termId)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> list:
+        """ Ranked matches: exact symbol, symbol prefix, name prefix, then fuzzy matches.
+
+        Args:
+            query (str): symbol or name fragment.
+            limit (int): max number of results. Defaults to 10.
+            fuzzy (bool): complete the results with fuzzy matches. Defaults to True.
+
+        Returns:
+            list: `{"symbol", "long_name", "exchange", "match", "score"}` dicts.
+        """
+        query = normalize(query)
+        if not query or limit < 1:
+            return []
+        found = {}
+        self._scan_prefix(query, self._symbolKeys, self._symbolIds, found, limit, SYMBOL_PREFIX)
+        if len(found) < limit:
+            self._scan_prefix(query, self._nameKeys, self._nameIds, found, limit, NAME_PREFIX)
+        if fuzzy and len(found) < limit:
+            self._fuzzy(query, found, limit)
+        return [
+            {
+                "symbol": self.symbols[i],
+                "long_name": self.names[i],
+                "exchange": self.exchanges[i],
+                "match": match,
+                "score": round(score, 4),
+            }
+            for i, (match, score) in found.items()
+        ]
+
+    @staticmethod
+    def _scan_prefix(query: str, keys: list, ids: list, found: dict, limit: int, match: str) -> None:
+        position = bisect.bisect_left(keys, query)
+        while position < len(keys) and len(found) < limit and keys[position].startswith(query):
+            i = ids[position]
+            if i not in found:
+                exact = match == SYMBOL_PREFIX and keys[position] == query
+                found[i] = (SYMBOL_EXACT if exact else match, len(query) / len(keys[position]))
+            position += 1
+
+    def _fuzzy(self, query: str, found: dict, limit: int) -> None:
+        grams = trigrams(query)
+        shared = collections.Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        best = {}
+        for termId, count in shared.items():
+            i = self._termIds[termId]
+            if i in found:
+                continue
+            similarity = count / (len(grams) + self._termGrams[termId] - count)
+            if similarity >= FUZZY_THRESHOLD and similarity > best.get(i, 0.0):
+                best[i] = similarity
+        for i, similarity in sorted(best.items(), key=lambda item: -item[1])[:limit - len(found)]:
+            found[i] = (FUZZY, similarity)
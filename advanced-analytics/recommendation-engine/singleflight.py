@@ -0,0 +1,94 @@
+""" Single-flight coalescing of identical concurrent computations.
+
+The first caller for a key runs the computation; callers arriving with the same key while it
+is in flight wait for it and share its result or exception. Nothing is kept once the call
+finishes, so coalescing never serves stale data.
+"""
+
+import collections
+import logging
+import threading
+
+logger = logging.getLogger("recommendation-engine")
+
+
+class Call:
+    """ One in-flight computation and the callers waiting for it. """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException = None
+        self.duplicates: int = 0
+
+
+class SingleFlight:
+    """ Coalesce concurrent calls that share a key.
+
+    Keys are tuples whose first item names the computation, e.g. `("basic", "AAPL")`;
+    metrics are kept per name.
+
+    Public methods:
+        do() -- run a function once per key for all concurrent callers.
+        metrics() -- calls, executions and coalescing ratio per computation name.
+    """
+    def __init__(self):
+        self.calls: dict = {}
+        self.counters: dict = collections.defaultdict(collections.Counter)
+        self._lock = threading.Lock()
+
+    def do(self, key: tuple, func, *args, **kwargs):
+        """ Run `func(*args, **kwargs)` unless an identical call is in flight.
+
+        Args:
+            key (tuple): normalized computation name and parameters.
+            func (callable): computation to run.
+
+        Returns:
+            Result of the leading call, shared by all concurrent duplicates.
+        """
+        name = key[0]
+        with self._lock:
+            self.counters[name]["calls"] += 1
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+                self.counters[name]["executions"] += 1
+            else:
+                call.duplicates += 1
+                self.counters[name]["coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self.calls[key]
+            call.done.set()
+            if call.duplicates:
+                logger.debug(f"Coalesced {call.duplicates} concurrent calls of {key}.")
+
+    def metrics(self) -> dict:
+        """ Calls, executions, coalesced calls and coalescing ratio per computation name. """
+        with self._lock:
+            counters = {name: dict(counter) for name, counter in self.counters.items()}
+            inFlight = len(self.calls)
+        result = {}
+        for name, counter in counters.items():
+            calls = counter.get("calls", 0)
+            coalesced = counter.get("coalesced", 0)
+            result[name] = {
+                "calls": calls,
+                "executions": counter.get("executions", 0),
+                "coalesced": coalesced,
+                "ratio": coalesced / calls if calls else 0.0,
+            }
+        return {"inFlight": inFlight, "computations": result}
@@ -0,0 +1,85 @@
+""" Precomputed asset statistics snapshot.
+
+The capital markets pipeline writes per-ticker statistics (previous close, last price, day change,
+day and 52-week ranges, 5-month open price history) once per run. The snapshot is loaded once
+and kept in memory, so statistics are served without an outbound network call. Prices and day
+changes are only taken from it once the market closed and it holds the last settled session;
+intraday quotes come from the live market data cache, see `statistics.py`.
+
+`snapshot.py` reads optional env variables:
+    - STATISTICS_BUCKET -- GCS bucket name with the statistics snapshot, a directory under STORAGE_ROOT
+      when it is set; the snapshot is not used when not set
+    - STATISTICS_BLOB -- name of the snapshot file, defaults to `capital-markets-statistics.json`
+    - STATISTICS_MAX_AGE -- seconds before the snapshot is loaded again, defaults to 21600
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import fsspec
+
+import object_store
+
+logger = logging.getLogger("recommendation-engine")
+
+
+class StatisticsSnapshot:
+    """ Lazily loaded, in-memory copy of the pipeline's statistics snapshot.
+
+    Public methods:
+        get() -- statistics of a ticker or None if the snapshot does not hold it.
+        reload() -- load the snapshot again.
+
+    Attributes:
+        path -- location of the snapshot, None when disabled
+        maxAge -- seconds before the snapshot is loaded again
+    """
+    def __init__(self, path: str = None, maxAge: float = None):
+        if path is None and os.environ.get("STATISTICS_BUCKET"):
+            blob = os.environ.get("STATISTICS_BLOB", "capital-markets-statistics.json")
+            path = object_store.bucket(os.environ["STATISTICS_BUCKET"]).url(blob)
+        self.path: str = path
+        self.maxAge: float = maxAge or float(os.environ.get("STATISTICS_MAX_AGE", 21600))
+        self.statistics: dict = None
+        self.generatedAt: str = None
+        self.loadedAt: float = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def reload(self) -> dict:
+        """ Load the snapshot, keeping the previous copy if loading fails. """
+        logger.debug(f"Loading statistics snapshot from {self.path}.")
+        try:
+            with fsspec.open(self.path, "r") as f:
+                data = json.load(f)
+            self.statistics = data["statistics"]
+            self.generatedAt = data.get("generatedAt")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Failed to load statistics snapshot: {e}.")
+            if self.statistics is None:
+                self.statistics = {}
+        self.loadedAt = time.time()
+        return self.statistics
+
+    def get(self, ticker: str) -> dict:
+        """ Statistics of a ticker.
+
+        Args:
+            ticker (str): asset ticker.
+
+        Returns:
+            dict: precomputed statistics or None if unavailable.
+        """
+        if not self.enabled:
+            return None
+        if time.time() - self.loadedAt > self.maxAge:
+            with self._lock:
+                if time.time() - self.loadedAt > self.maxAge:
+                    self.reload()
+        return self.statistics.get(ticker)
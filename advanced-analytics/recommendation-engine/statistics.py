@@ -1,12 +1,54 @@
-from yfinance import Ticker
+import datetime
 import time
 import json
 
+import numpy as np
+import pandas as pd
+
+import columnar
+import downsampling
+import indicators
+import market_cache
+import snapshot
+
 settings = json.load(open("settings.json", "r"))
 tickers_description = settings["tickersDescription"]
 tickers_exchange = settings["tickersExchange"]
 tickers_exchange_timezone = settings["tickersExchangeTimezone"]
 tickers_currency = settings["tickersCurrency"]
+universe = settings["tickers"]
+
+# one year of daily quotes per ticker shared by all statistics functions
+cache = market_cache.MarketDataCache(period='1y')
+# statistics precomputed by the capital markets pipeline, used when configured
+stored_statistics = snapshot.StatisticsSnapshot()
+SNAPSHOT_HISTORY_PERIOD = '5mo'
+# indicators of the requested tickers with the quotes they were computed from
+computed_indicators = {}
+
+
+def settled_statistics(asset_name):
+    """
+    Returns the snapshot statistics of an asset when they hold the last settled session.
+    While the market is open, or when the snapshot is behind, e.g. because the pipeline stalled,
+    returns None and prices come from the live cache.
+    """
+    if market_cache.market_is_open():
+        return None
+    stored = stored_statistics.get(asset_name)
+    if not stored:
+        return None
+    last_date = datetime.datetime.fromtimestamp(stored['timestamp'], datetime.timezone.utc).date()
+    if last_date < market_cache.last_settled_session():
+        return None
+    return stored
+
+
+def json_value(value):
+    """
+    Returns None for NaN, which JSON cannot represent, e.g. the day range of a ticker without quotes that day.
+    """
+    return None if isinstance(value, float) and np.isnan(value) else value
 
 
 def basic(asset_name):
@@ -16,10 +58,14 @@ def basic(asset_name):
     - change for day %;
     - long name.
     """
-    ticker = Ticker(asset_name)
-    # Sometimes yfinance returns one-day statistics if the period is 2d,
-    # so request 3 days period and consume only the last 2 days
-    asset_history = ticker.history(period='3d').dropna(subset=['Close'])
+    stored = settled_statistics(asset_name)
+    if stored:
+        return {
+            'current_price': stored['current_price'],
+            'change_for_day': stored['change_for_day'],
+            'long_name': tickers_description.get(asset_name),
+        }
+    asset_history = cache.get(asset_name)
     yesterday_info = asset_history.iloc[-2]
     today_info = asset_history.iloc[-1]
     previous_close = float(yesterday_info.get('Close'))
@@ -31,6 +77,41 @@ def basic(asset_name):
     }
 
 
+def batch(asset_names):
+    """
+    Returns basic statistics for several assets at once, keyed by asset name.
+    Quotes missing from the cache are fetched with one bulk download and the statistics
+    are computed across all columns of the close price matrix.
+    Assets without quotes are mapped to None.
+    """
+    result = dict.fromkeys(asset_names)
+    for name in asset_names:
+        if settled_statistics(name):
+            result[name] = basic(name)
+    remaining = [name for name in asset_names if result[name] is None]
+    frames = cache.get_many(remaining) if remaining else {}
+    if not frames:
+        return result
+    closes = pd.concat({name: frame['Close'] for name, frame in frames.items()}, axis=1).sort_index()
+    values = closes.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    # position of every valid price counted from the end of its column: 1 is the last one
+    from_end = np.cumsum(valid[::-1], axis=0)[::-1]
+    current_price = np.where(valid & (from_end == 1), values, 0.0).sum(axis=0)
+    previous_close = np.where(valid & (from_end == 2), values, 0.0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change_for_day = current_price * 100.0 / previous_close - 100.0
+    long_names = closes.columns.map(tickers_description.get)
+    for name, price, change, long_name in zip(closes.columns, current_price, change_for_day, long_names):
+        if np.isfinite(change):
+            result[name] = {
+                'current_price': float(price),
+                'change_for_day': float(change),
+                'long_name': long_name,
+            }
+    return result
+
+
 def detailed(asset_name):
     """
     Returns detailed statistics about an asset:
@@ -49,8 +130,17 @@ def detailed(asset_name):
     - forward dividend;
     - dividend yield.
     """
-    ticker = Ticker(asset_name)
-    year_info = ticker.history(period='1y').dropna(subset=['Close'])
+    stored = settled_statistics(asset_name)
+    if stored:
+        result = {key: json_value(value) for key, value in stored.items() if key != 'history'}
+        result.update({
+            'long_name': tickers_description.get(asset_name),
+            'exchange': tickers_exchange.get(asset_name),
+            'timezone': tickers_exchange_timezone,
+            'currency': tickers_currency,
+        })
+        return result
+    year_info = cache.get(asset_name)
     yesterday_info = year_info.iloc[-2]
     today_info = year_info.iloc[-1]
     previous_close = float(yesterday_info.get('Close'))
@@ -76,9 +166,117 @@ def detailed(asset_name):
     }
 
 
-def history(asset_name, period='5mo'):
+def history_series(asset_name, period='5mo'):
+    """
+    Returns open prices for the specified period of time as a series indexed by date.
+    """
+    return cache.history(asset_name, period).dropna(subset=['Open']).loc[:, 'Open']
+
+
+def stored_history_series(stored):
+    """
+    Returns the snapshot history `timestamp: price at day start` as a series indexed by date.
+    """
+    history = stored['history']
+    return pd.Series(list(history.values()), index=pd.to_datetime([int(timestamp) for timestamp in history], unit='ms'))
+
+
+def history_data(asset_name, period='5mo', points=None, resolution=None):
+    """
+    Returns open prices reduced to at most `points` values with LTTB as a series,
+    or OHLCV bars for a resolution (daily, weekly, monthly) as a data frame.
+    Reduced and resampled histories are cached per ticker, period, resolution and point count
+    until the quotes refresh.
+    """
+    if resolution is None and points is None:
+        return compute_history(asset_name, period)
+    return cache.memoize(
+        (asset_name, 'history', period, resolution, points), compute_history, asset_name, period, points, resolution
+    )
+
+
+def compute_history(asset_name, period='5mo', points=None, resolution=None):
+    if resolution is not None:
+        return downsampling.resample_ohlc(cache.history(asset_name, period), resolution)
+    stored = stored_statistics.get(asset_name) if period == SNAPSHOT_HISTORY_PERIOD else None
+    prices = stored_history_series(stored) if stored else history_series(asset_name, period)
+    return downsampling.downsample(prices, points)
+
+
+def history(asset_name, period='5mo', points=None, resolution=None, layout='object'):
+    """
+    Returns history for the specified period of time:
+    - in format `timestamp: price at day start`, reduced to at most `points` prices with LTTB;
+    - or, with a resolution (daily, weekly, monthly), in format `timestamp: {open, high, low, close, volume}`.
+    The `columnar` layout returns a dict with the start timestamp, timestamp deltas and value arrays instead.
+    """
+    stored = stored_statistics.get(asset_name) if period == SNAPSHOT_HISTORY_PERIOD else None
+    if stored and points is None and resolution is None and layout == 'object':
+        return json.dumps(stored['history'])
+    data = history_data(asset_name, period, points, resolution)
+    if layout == 'columnar':
+        return columnar.encode(data)
+    if resolution is not None:
+        return data.rename(columns=str.lower).to_json(orient='index')
+    return data.to_json()
+
+
+def full(asset_name, period='5mo', points=None, layout='object'):
+    """
+    Returns detailed statistics together with the history for the specified period of time,
+    both derived from the same cached year of quotes.
+    """
+    result = detailed(asset_name)
+    stored = stored_statistics.get(asset_name) if period == SNAPSHOT_HISTORY_PERIOD else None
+    if stored and points is None and layout == 'object':
+        result['history'] = stored['history']
+        return result
+    prices = history_data(asset_name, period, points)
+    if layout == 'columnar':
+        result['history'] = columnar.encode(prices)
+        return result
+    timestamps = (prices.index - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)
+    result['history'] = dict(zip(map(str, timestamps.tolist()), prices.tolist()))
+    return result
+
+
+def closes_indicators(asset_names):
+    """
+    Returns the indicators of the assets, computed again only when the last date or close of their quotes changed.
+    """
+    frames = cache.get_many(list(dict.fromkeys([*asset_names, indicators.BENCHMARK])))
+    if not frames:
+        return {}
+    key = tuple(asset_names)
+    version = tuple((name, frame.index[-1], float(frame['Close'].iat[-1])) for name, frame in frames.items())
+    entry = computed_indicators.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    closes = pd.concat({name: frame['Close'] for name, frame in frames.items()}, axis=1).sort_index()
+    result = indicators.to_dict(indicators.compute(closes))
+    result = {name: result.get(name) for name in asset_names}
+    computed_indicators.pop(key, None)
+    while len(computed_indicators) >= market_cache.DERIVED_ENTRIES:
+        computed_indicators.pop(next(iter(computed_indicators)), None)
+    computed_indicators[key] = (version, result)
+    return result
+
+
+def technical_indicators(asset_names=None):
     """
-    Returns history for the specified period of time in format `timestamp: price at day start`.
+    Returns technical indicators keyed by asset name, for the whole universe when no names are given:
+    - moving averages for 20, 50 and 200 days;
+    - 14-day RSI;
+    - annualized 20-day volatility;
+    - current and maximum drawdown;
+    - beta to SPY.
+    The universe is computed in one pass and kept until its quotes get a new day or close.
+    Assets without quotes are mapped to None.
     """
-    asset = Ticker(asset_name)
-    return asset.history(period).dropna(subset=['Open']).loc[:, 'Open'].to_json()
+    result = closes_indicators(universe)
+    if asset_names is None:
+        return result
+    others = sorted(name for name in asset_names if name not in result)
+    if others:
+        result = {**result, **closes_indicators(others)}
+    return {name: result.get(name) for name in asset_names}
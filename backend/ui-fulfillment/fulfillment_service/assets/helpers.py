@@ -1,6 +1,8 @@
 import logging
 from decimal import Decimal, InvalidOperation
+from itertools import accumulate
 
+import msgpack
 from django.conf import settings
 from millify import millify
 from requests.exceptions import HTTPError
@@ -8,9 +10,10 @@ from requests.exceptions import HTTPError
 from fulfillment_service.assets.exceptions import MLServiceError
 from fulfillment_service.assets.models import Asset, Metrics
 from fulfillment_service.utils.serializers import abs_with_direction
-from fulfillment_service.utils.views import decimal_from_str, get_concurrent, requests_session
+from fulfillment_service.utils.views import decimal_from_str, requests_session
 
 ML_SERVICE_URL = settings.ML_SERVICE_URL
+ML_MSGPACK_CONTENT_TYPE = 'application/msgpack'
 logger = logging.getLogger(__name__)
 
 
@@ -142,6 +145,36 @@ class MLServiceProvider:
         except (InvalidOperation, KeyError):
             raise MLServiceError('Required field in ML response has unexpected format or is not present')
 
+    @staticmethod
+    def get_basic_statistics_by_assets(asset_names):
+        """
+        returns minimum statistics for several assets with one request
+        :param asset_names: the names of assets for which the statistics will be requested
+        :return: dict of BasicStatistic by asset name; assets unknown to the ML service are not included
+        """
+        if not asset_names:
+            return {}
+        params = {'asset_name': ','.join(asset_names)}
+        session = requests_session()
+        try:
+            with session.get(ML_SERVICE_URL + '/stat/batch', params=params) as response:
+                response.raise_for_status()
+                data = response.json()
+        except HTTPError as e:
+            raise MLServiceError(str(e))
+        try:
+            return {
+                asset_name: BasicStatistic(
+                    long_name=info['long_name'],
+                    current_price=decimal_from_str(info['current_price']),
+                    change_for_day=decimal_from_str(info['change_for_day']),
+                )
+                for asset_name, info in data.items()
+                if info is not None
+            }
+        except (AttributeError, InvalidOperation, KeyError, TypeError):
+            raise MLServiceError('Required field in ML response has unexpected format or is not present')
+
     @staticmethod
     def get_statistics_by_asset(asset_name):
         """
@@ -164,20 +197,21 @@ class MLServiceProvider:
         - timestamp;
         - history (for last 5 months).
         """
-        params = {'asset_name': asset_name}
+        params = {'asset_name': asset_name, 'format': 'columnar'}
+        headers = {'Accept': '{}, application/json'.format(ML_MSGPACK_CONTENT_TYPE)}
         session = requests_session()
         try:
-            with session.get(ML_SERVICE_URL + '/stat/detailed/', params=params) as response:
+            with session.get(ML_SERVICE_URL + '/stat/full/', params=params, headers=headers) as response:
                 response.raise_for_status()
-                data = response.json()
-            with session.get(ML_SERVICE_URL + '/stat/history/', params=params) as history:
-                history.raise_for_status()
-                history = history.json()
-        except HTTPError as e:
+                if response.headers.get('Content-Type', '').startswith(ML_MSGPACK_CONTENT_TYPE):
+                    data = msgpack.unpackb(response.content)
+                else:
+                    data = response.json()
+        except (HTTPError, ValueError) as e:
             raise MLServiceError(str(e))
 
         try:
-            history = {int(timestamp): decimal_from_str(price) for timestamp, price in history.items()}
+            history = MLServiceProvider.parse_history(data['history'])
             volume = data.get('volume')
             return DetailedStatistics(
                 previous_close=decimal_from_str(data['previous_close']),
@@ -196,9 +230,22 @@ class MLServiceProvider:
                 timestamp=int(data['timestamp']),
                 history=history,
             )
-        except (InvalidOperation, KeyError):
+        except (AttributeError, InvalidOperation, KeyError, TypeError):
             raise MLServiceError('Required field in ML response has unexpected format or is not present')
 
+    @staticmethod
+    def parse_history(history):
+        """
+        returns history as `timestamp: price` from either layout of the ML service:
+        - `{"timestamp": price}` object;
+        - columnar `{"start": ms, "step": ms, "deltas": [...], "columns": {"price": [...]}}`.
+        """
+        if 'columns' not in history:
+            return {int(timestamp): decimal_from_str(price) for timestamp, price in history.items()}
+        start, step = int(history['start'] or 0), int(history['step'])
+        timestamps = (start + step * offset for offset in accumulate(history['deltas']))
+        return {timestamp: decimal_from_str(price) for timestamp, price in zip(timestamps, history['columns']['price'])}
+
 
 class UserPortfolio:
     def __init__(self, user, wallet=None):
@@ -224,9 +271,9 @@ class UserPortfolio:
         Asset.purchase_assets(assets, invested_sum, self.wallet)
 
     def overall_sum_with_profit(self, assets):
-        assets_with_statistics = get_concurrent(
-            lambda asset: asset.with_statistics(MLServiceProvider).with_profit(), assets
-        )
+        assets_with_statistics = [
+            asset.with_profit() for asset in Asset.bulk_with_statistics(assets, MLServiceProvider)
+        ]
         return self.overall_sum(assets) + sum(asset.statistics.profit for asset in assets_with_statistics)
 
     @staticmethod
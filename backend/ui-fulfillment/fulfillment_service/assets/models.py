@@ -63,6 +63,30 @@ class Asset(models.Model):
             self.statistics = None
             return self
 
+    @staticmethod
+    def bulk_with_statistics(assets, ml_provider):
+        assets = list(assets)
+        statistics = ml_provider.get_basic_statistics_by_assets([asset.asset_name for asset in assets])
+        for asset in assets:
+            if asset.asset_name not in statistics:
+                raise MLServiceError('No statistics for {} asset'.format(asset.asset_name))
+            asset.statistics = statistics[asset.asset_name]
+        return assets
+
+    @staticmethod
+    def bulk_with_statistics_no_fail(assets, ml_provider):
+        assets = list(assets)
+        try:
+            statistics = ml_provider.get_basic_statistics_by_assets([asset.asset_name for asset in assets])
+        except MLServiceError as e:
+            logger.warning('Failed to get basic info about assets: {}'.format(str(e)))
+            statistics = {}
+        for asset in assets:
+            asset.statistics = statistics.get(asset.asset_name)
+            if asset.statistics is None:
+                logger.warning('Failed to get basic info about {} asset'.format(asset.asset_name))
+        return assets
+
     @staticmethod
     def purchase_assets(assets, invested_sum, wallet):
         purchasing_transaction = Transaction.objects.create(
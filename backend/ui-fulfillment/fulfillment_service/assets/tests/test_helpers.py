@@ -1,5 +1,6 @@
 from decimal import Decimal
 
+import msgpack
 import pytest
 from django.conf import settings
 
@@ -163,11 +164,58 @@ class TestMLServiceProviderGetBasicStatisticsByAsset:
         assert response.long_name == 'ABC Inc.'
 
 
+class TestMLServiceProviderGetBasicStatisticsByAssets:
+    def setup_method(self):
+        self.asset_names = ['ABC', 'BCD', 'CDE']
+        self.url = '{}/stat/batch'.format(ML_SERVICE_URL)
+        self.provider = MLServiceProvider()
+        self.request = {
+            'ABC': {'change_for_day': 1.391809898486656, 'current_price': 2438.0776, 'long_name': 'ABC Inc.'},
+            'BCD': {'change_for_day': -0.5, 'current_price': 12.5, 'long_name': 'BCD Inc.'},
+            'CDE': None,
+        }
+
+    def test_requests_all_assets_at_once(self, requests_mock):
+        requests_mock.get(self.url, json=self.request)
+        self.provider.get_basic_statistics_by_assets(self.asset_names)
+        assert requests_mock.call_count == 1
+        assert requests_mock.request_history[0].qs['asset_name'] == ['abc,bcd,cde']
+
+    def test_does_not_request_empty_list(self, requests_mock):
+        assert self.provider.get_basic_statistics_by_assets([]) == {}
+        assert requests_mock.call_count == 0
+
+    def test_fails_if_http_request_fails(self, requests_mock):
+        requests_mock.get(self.url, status_code=400)
+        with pytest.raises(MLServiceError):
+            self.provider.get_basic_statistics_by_assets(self.asset_names)
+
+    @pytest.mark.parametrize('field', ['current_price', 'change_for_day', 'long_name'])
+    def test_fails_if_required_fields_are_not_in_http_response(self, requests_mock, field):
+        requests_mock.get(self.url, json=self.request)
+        del self.request['BCD'][field]
+        with pytest.raises(MLServiceError):
+            self.provider.get_basic_statistics_by_assets(self.asset_names)
+
+    def test_skips_assets_without_statistics(self, requests_mock):
+        requests_mock.get(self.url, json=self.request)
+        response = self.provider.get_basic_statistics_by_assets(self.asset_names)
+        assert lists_equal(list(response.keys()), ['ABC', 'BCD'])
+
+    def test_uses_data_from_response(self, requests_mock):
+        requests_mock.get(self.url, json=self.request)
+        response = self.provider.get_basic_statistics_by_assets(self.asset_names)
+        assert response['ABC'].current_price == Decimal('2438.08')
+        assert response['ABC'].change_for_day == Decimal('1.39')
+        assert response['ABC'].long_name == 'ABC Inc.'
+        assert response['BCD'].current_price == Decimal('12.5')
+        assert response['BCD'].change_for_day == Decimal('-0.5')
+
+
 class TestMLServiceProviderGetStatisticsByAsset:
     def setup_method(self):
         self.asset_name = 'ABC'
-        self.detailed_url = '{}/stat/detailed/?asset_name={}'.format(ML_SERVICE_URL, self.asset_name)
-        self.history_url = '{}/stat/history/?asset_name={}'.format(ML_SERVICE_URL, self.asset_name)
+        self.url = '{}/stat/full/?asset_name={}'.format(ML_SERVICE_URL, self.asset_name)
         self.provider = MLServiceProvider()
         self.detailed = {
             'previous_close': '1.3388',
@@ -200,44 +248,50 @@ class TestMLServiceProviderGetStatisticsByAsset:
             '1622678400000': '2395.0200195312',
             '1622764800000': '2422.5200195312',
         }
+        self.detailed['history'] = self.history
 
     def test_fails_if_http_request_fails(self, requests_mock):
-        requests_mock.get(self.detailed_url, status_code=400)
-        requests_mock.get(self.history_url, status_code=400)
+        requests_mock.get(self.url, status_code=400)
         with pytest.raises(MLServiceError):
             self.provider.get_statistics_by_asset(self.asset_name)
 
     @pytest.mark.parametrize('field', ['current_price', 'day_range_low', 'timestamp'])
     def test_fails_if_required_fields_are_not_in_http_response(self, requests_mock, field):
-        requests_mock.get(self.detailed_url, json=self.detailed)
-        requests_mock.get(self.history_url, json=self.history)
+        requests_mock.get(self.url, json=self.detailed)
         del self.detailed[field]
         with pytest.raises(MLServiceError):
             self.provider.get_statistics_by_asset(self.asset_name)
 
     def test_fails_if_fields_have_invalid_data(self, requests_mock):
-        requests_mock.get(self.detailed_url, json=self.detailed)
-        requests_mock.get(self.history_url, json=self.history)
+        requests_mock.get(self.url, json=self.detailed)
         self.detailed['day_range_low'] = 'str'
         with pytest.raises(MLServiceError):
             self.provider.get_statistics_by_asset(self.asset_name)
 
     def test_fails_if_history_values_have_invalid_data(self, requests_mock):
-        requests_mock.get(self.detailed_url, json=self.detailed)
-        requests_mock.get(self.history_url, json=self.history)
+        requests_mock.get(self.url, json=self.detailed)
         self.history['1620691200000'] = 'str'
         with pytest.raises(MLServiceError):
             self.provider.get_statistics_by_asset(self.asset_name)
 
+    def test_fails_if_history_is_not_in_http_response(self, requests_mock):
+        requests_mock.get(self.url, json=self.detailed)
+        del self.detailed['history']
+        with pytest.raises(MLServiceError):
+            self.provider.get_statistics_by_asset(self.asset_name)
+
+    def test_requests_detailed_statistics_and_history_at_once(self, requests_mock):
+        requests_mock.get(self.url, json=self.detailed)
+        self.provider.get_statistics_by_asset(self.asset_name)
+        assert requests_mock.call_count == 1
+
     def test_volume_correctly_transformed(self, requests_mock):
-        requests_mock.get(self.detailed_url, json=self.detailed)
-        requests_mock.get(self.history_url, json=self.history)
+        requests_mock.get(self.url, json=self.detailed)
         response = self.provider.get_statistics_by_asset(self.asset_name)
         assert response.volume == '24M'
 
     def test_uses_detailed_data_from_response(self, requests_mock):
-        requests_mock.get(self.detailed_url, json=self.detailed)
-        requests_mock.get(self.history_url, json=self.history)
+        requests_mock.get(self.url, json=self.detailed)
         response = self.provider.get_statistics_by_asset(self.asset_name)
         assert response.previous_close == Decimal('1.34')
         assert response.change_for_day == Decimal('1.14')
@@ -254,8 +308,7 @@ class TestMLServiceProviderGetStatisticsByAsset:
         assert response.year_range_low == Decimal('80.81')
 
     def test_uses_history_data_from_response(self, requests_mock):
-        requests_mock.get(self.detailed_url, json=self.detailed)
-        requests_mock.get(self.history_url, json=self.history)
+        requests_mock.get(self.url, json=self.detailed)
         response = self.provider.get_statistics_by_asset(self.asset_name)
         assert response.history == {
             1609718400000: Decimal('1757.54'),
@@ -271,6 +324,48 @@ class TestMLServiceProviderGetStatisticsByAsset:
             1622764800000: Decimal('2422.52'),
         }
 
+    def test_requests_columnar_history(self, requests_mock):
+        requests_mock.get(self.url, json=self.detailed)
+        self.provider.get_statistics_by_asset(self.asset_name)
+        assert requests_mock.last_request.qs['format'] == ['columnar']
+        assert 'application/msgpack' in requests_mock.last_request.headers['Accept']
+
+    def test_uses_columnar_history_data_from_response(self, requests_mock):
+        self.detailed['history'] = {
+            'start': 1609718400000,
+            'step': 86400000,
+            'deltas': [0, 1, 1, 3],
+            'columns': {'price': [1757.5400390625, 1725.0, 1702.6300048828, 1740.0600585938]},
+        }
+        requests_mock.get(self.url, json=self.detailed)
+        response = self.provider.get_statistics_by_asset(self.asset_name)
+        assert response.history == {
+            1609718400000: Decimal('1757.54'),
+            1609804800000: Decimal('1725'),
+            1609891200000: Decimal('1702.63'),
+            1610150400000: Decimal('1740.06'),
+        }
+
+    def test_uses_msgpack_response(self, requests_mock):
+        self.detailed['history'] = {
+            'start': 1609718400000,
+            'step': 86400000,
+            'deltas': [0],
+            'columns': {'price': [1.5]},
+        }
+        requests_mock.get(
+            self.url, content=msgpack.packb(self.detailed), headers={'Content-Type': 'application/msgpack'}
+        )
+        response = self.provider.get_statistics_by_asset(self.asset_name)
+        assert response.current_price == Decimal('124.95')
+        assert response.history == {1609718400000: Decimal('1.5')}
+
+    def test_fails_if_columnar_history_has_invalid_data(self, requests_mock):
+        self.detailed['history'] = {'start': 1609718400000, 'step': 86400000, 'deltas': None, 'columns': {}}
+        requests_mock.get(self.url, json=self.detailed)
+        with pytest.raises(MLServiceError):
+            self.provider.get_statistics_by_asset(self.asset_name)
+
 
 class TestMLServiceProviderGetProfit:
     def test_correct_for_negative_profit(self):
@@ -2,6 +2,9 @@ from decimal import Decimal
 
 import pytest
 
+from fulfillment_service.assets.exceptions import MLServiceError
+from fulfillment_service.assets.helpers import BasicStatistic
+from fulfillment_service.assets.models import Asset
 from fulfillment_service.assets.tests.factories import AssetFactory
 from fulfillment_service.wallets.tests.factories import TransactionFactory
 
@@ -20,3 +23,36 @@ class TestAsset:
         AssetFactory(overall_sum=Decimal('400'), transaction=transaction)
         AssetFactory()  # create asset for another transaction
         assert asset.part_of_portfolio == 10
+
+
+class StubMLProvider:
+    @staticmethod
+    def get_basic_statistics_by_assets(asset_names):
+        return {name: BasicStatistic(current_price=Decimal('10')) for name in asset_names if name != 'NONE'}
+
+
+class FailingMLProvider:
+    @staticmethod
+    def get_basic_statistics_by_assets(asset_names):
+        raise MLServiceError('Some exception..')
+
+
+class TestAssetBulkStatistics:
+    def test_statistics_are_set_for_every_asset(self):
+        assets = Asset.bulk_with_statistics([Asset(asset_name='ABC'), Asset(asset_name='BCD')], StubMLProvider)
+        assert [asset.statistics.current_price for asset in assets] == [Decimal('10'), Decimal('10')]
+
+    def test_fails_if_asset_has_no_statistics(self):
+        with pytest.raises(MLServiceError):
+            Asset.bulk_with_statistics([Asset(asset_name='ABC'), Asset(asset_name='NONE')], StubMLProvider)
+
+    def test_no_fail_sets_empty_statistics_for_asset_without_statistics(self):
+        assets = Asset.bulk_with_statistics_no_fail(
+            [Asset(asset_name='ABC'), Asset(asset_name='NONE')], StubMLProvider
+        )
+        assert assets[0].statistics.current_price == Decimal('10')
+        assert assets[1].statistics is None
+
+    def test_no_fail_sets_empty_statistics_if_ml_provider_fails(self):
+        assets = Asset.bulk_with_statistics_no_fail([Asset(asset_name='ABC')], FailingMLProvider)
+        assert assets[0].statistics is None
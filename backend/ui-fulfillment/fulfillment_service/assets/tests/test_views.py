@@ -50,15 +50,15 @@ class TestAssetsWithMetricsAPIView:
             )
 
         mocker.patch(
-            '{}.get_basic_statistics_by_asset'.format(HELPERS_CLASS_PATH),
-            new=get_basic_statistics_by_asset_stub,
+            '{}.get_basic_statistics_by_assets'.format(HELPERS_CLASS_PATH),
+            new=lambda asset_names: {name: get_basic_statistics_by_asset_stub(name) for name in asset_names},
         )
         mocker.patch('fulfillment_service.assets.helpers.BasicStatistic.set_profit', new=set_profit_stub)
 
     @staticmethod
     def patch_error(mocker):
         mocker.patch(
-            '{}.get_basic_statistics_by_asset'.format(HELPERS_CLASS_PATH),
+            '{}.get_basic_statistics_by_assets'.format(HELPERS_CLASS_PATH),
             side_effect=MLServiceError('Some exception..'),
         )
 
@@ -561,8 +561,8 @@ class TestPortfolioAdviceAPIView:
 
         mocker.patch('{}.get_advice'.format(HELPERS_CLASS_PATH), new=get_advice)
         mocker.patch(
-            '{}.get_basic_statistics_by_asset'.format(HELPERS_CLASS_PATH),
-            new=get_basic_statistics_by_asset_stub,
+            '{}.get_basic_statistics_by_assets'.format(HELPERS_CLASS_PATH),
+            new=lambda asset_names: {name: get_basic_statistics_by_asset_stub(name) for name in asset_names},
         )
 
     @staticmethod
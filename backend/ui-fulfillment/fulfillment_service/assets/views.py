@@ -9,7 +9,6 @@ from rest_framework.views import APIView
 
 from fulfillment_service.assets.exceptions import MLServiceError
 from fulfillment_service.assets.models import Asset
-from fulfillment_service.utils.views import get_concurrent
 from fulfillment_service.wallets.models import NoWalletsForUserError, Wallet
 
 from .helpers import MLServiceProvider, UserPortfolio
@@ -48,10 +47,10 @@ class AssetsWithMetricsAPIView(APIView):
         metrics = portfolio.existing_metrics()
         assets = portfolio.existing_assets()
         invested_sum = portfolio.overall_sum(assets)
-        assets_with_statistics = get_concurrent(
-            lambda asset: asset.with_statistics_no_fail(MLServiceProvider).with_profit().with_directions(),
-            assets,
-        )
+        assets_with_statistics = [
+            asset.with_profit().with_directions()
+            for asset in Asset.bulk_with_statistics_no_fail(assets, MLServiceProvider)
+        ]
 
         response = AssetWithMetricsSerializer(
             {
@@ -152,10 +151,9 @@ class PortfolioAdviceAPIView(APIView):
             logger.exception('Failed to get advice from the service: {}'.format(str(e)))
             return Response('Failed to get advice from the service', status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        assets_with_statistics = get_concurrent(
-            lambda asset: asset.with_statistics_no_fail(MLServiceProvider).with_directions(),
-            assets,
-        )
+        assets_with_statistics = [
+            asset.with_directions() for asset in Asset.bulk_with_statistics_no_fail(assets, MLServiceProvider)
+        ]
 
         response = AssetWithMetricsForAdviceSerializer(
             {